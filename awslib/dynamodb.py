@@ -2,8 +2,43 @@ from __future__ import print_function # Python 2/3 compatibility
 import boto3
 import json
 import decimal
+import logging
+import math
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
+from indeed import metrics
+
+TABLE_NAME = 'jobRecords'
+REGION_NAME = 'us-east-1'
+# maximum number of put requests in one BatchWriteItem call
+BATCH_WRITE_LIMIT = 25
+# maximum number of keys in one BatchGetItem call
+BATCH_GET_LIMIT = 100
+# text attributes which are stored compressed once they are large
+COMPRESSIBLE_FIELDS = ('title', 'company', 'source', 'description', 'url')
+# size in bytes from which text attributes are compressed
+COMPRESS_THRESHOLD = 512
+# first byte of a compressed value names its codec
+CODEC_PREFIXES = {'zlib': b'z', 'zstd': b's'}
+
+logger = logging.getLogger(__name__)
+
+_resources = {}
+_resources_lock = threading.Lock()
+
+
+def get_resource(region_name=REGION_NAME):
+    """
+    DynamoDB resource of the region, created once per process
+    """
+    with _resources_lock:
+        if region_name not in _resources:
+            _resources[region_name] = boto3.resource('dynamodb', region_name=region_name)
+        return _resources[region_name]
 
 # Helper class to convert a DynamoDB item to JSON.
 class DecimalEncoder(json.JSONEncoder):
@@ -31,9 +66,7 @@ def del_empty_values(d):
     return d
 
 def jobExists(job_id):
-    dynamodb = boto3.resource("dynamodb", region_name='us-east-1')
-
-    table = dynamodb.Table('jobRecords')
+    table = get_resource().Table(TABLE_NAME)
 
     #job_id = "123456789"
 
@@ -44,7 +77,7 @@ def jobExists(job_id):
             }
         )
     except ClientError as e:
-        print(e.response['Error']['Message'])
+        logger.error(e.response['Error']['Message'])
     else:
         if 'Item' in response:
             return True
@@ -54,32 +87,434 @@ def jobExists(job_id):
         #print(json.dumps(item, indent=4, cls=DecimalEncoder))
     return False
 
-def updateJobs(listOfJobs):
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    table = dynamodb.Table('jobRecords')
-    unique_jobIds = []
-    with table.batch_writer() as batch:
-        for j in listOfJobs:
-            if j.job_id not in unique_jobIds:
-                unique_jobIds.append(j.job_id)
-
-                json_item = del_empty_values({
-                    'job_id': j.job_id,
-                    'title': j.title,
-                    'company': j.company,
-                    'city': j.city,
-                    'state': j.state,
-                    'country': j.country,
-                    'source': j.source,
-                    'date': j.date,
-                    'description': j.description,
-                    'url': j.url,
-                    'expired': j.expired,
-                    'date_published': j.date_published
-                })
-                batch.put_item(
-                    Item=json_item
-                )
-            else:
-                print("skipping job id: {0}".format(j.job_id))
-    return
\ No newline at end of file
+def job_item(j, fingerprint=None):
+    """
+    DynamoDB item of a job, empty attributes are left out
+    :fingerprint - Element.fingerprint stored with the item
+    """
+    return del_empty_values({
+        'job_id': j.job_id,
+        'title': j.title,
+        'company': j.company,
+        'city': j.city,
+        'state': j.state,
+        'country': j.country,
+        'source': j.source,
+        'date': j.date,
+        'description': j.description,
+        'url': j.url,
+        'expired': j.expired,
+        'date_published': j.date_published,
+        'fingerprint': fingerprint
+    })
+
+
+def _zstandard():
+    """
+    zstandard module, None if it isn't installed
+    """
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def default_codec():
+    return 'zstd' if _zstandard() is not None else 'zlib'
+
+
+def compress_text(text, codec='zlib'):
+    """
+    Binary value of a text, prefixed with the byte of its codec
+    """
+    data = text.encode("utf-8")
+    if codec == 'zstd':
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise ImportError("zstd codec requires zstandard, pip install zstandard")
+        return CODEC_PREFIXES['zstd'] + zstandard.compress(data, 3)
+    if codec == 'zlib':
+        return CODEC_PREFIXES['zlib'] + zlib.compress(data, 6)
+    raise ValueError("unknown codec: {0}".format(codec))
+
+
+def decompress_value(value):
+    """
+    Text of a value written by compress_text, bytes or boto3 Binary
+    """
+    data = bytes(getattr(value, 'value', value))
+    prefix, data = data[:1], data[1:]
+    if prefix == CODEC_PREFIXES['zlib']:
+        return zlib.decompress(data).decode("utf-8")
+    if prefix == CODEC_PREFIXES['zstd']:
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise ImportError("item was stored with zstd, pip install zstandard to read it")
+        return zstandard.decompress(data).decode("utf-8")
+    raise ValueError("unknown codec prefix: {0!r}".format(prefix))
+
+
+def encode_item(item, threshold=COMPRESS_THRESHOLD, codec=None):
+    """
+    Copy of an item with large text attributes compressed
+    Attributes of COMPRESSIBLE_FIELDS of at least threshold bytes are
+    stored as Binary if that makes them smaller. Key and fingerprint are
+    never compressed, conditions and lookups keep working on them.
+    :codec - zlib or zstd, zstd if zstandard is installed
+    """
+    codec = codec or default_codec()
+    encoded = dict(item)
+    for field in COMPRESSIBLE_FIELDS:
+        value = item.get(field)
+        if not isinstance(value, str):
+            continue
+        size = len(value.encode("utf-8"))
+        if size < threshold:
+            continue
+        compressed = compress_text(value, codec)
+        if len(compressed) < size:
+            encoded[field] = compressed
+    return encoded
+
+
+def decode_item(item):
+    """
+    Item as it was before encode_item, compressed attributes become text again
+    """
+    decoded = dict(item)
+    for field in COMPRESSIBLE_FIELDS:
+        value = item.get(field)
+        if value is not None and not isinstance(value, str):
+            decoded[field] = decompress_value(value)
+    return decoded
+
+
+def item_size(item):
+    """
+    Size of an item as DynamoDB bills it: lengths of attribute names and
+    of their values, strings in UTF-8, booleans 1 byte, numbers about one
+    byte per two digits
+    """
+    size = 0
+    for name, value in item.items():
+        size += len(name.encode("utf-8"))
+        if isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        elif isinstance(value, bool) or value is None:
+            size += 1
+        elif isinstance(value, (int, float, decimal.Decimal)):
+            size += len(str(value).lstrip("-").replace(".", "")) // 2 + 2
+        else:
+            size += len(getattr(value, 'value', value))
+    return size
+
+
+def write_units(item):
+    """
+    Write capacity units of putting an item, 1 per started KB
+    """
+    return max(1, math.ceil(item_size(item) / 1024))
+
+
+class JobStore():
+    """
+    Long-lived writer of jobs into jobRecords table
+    Jobs are deduplicated by job id and sent with BatchWriteItem in
+    batches of 25. Items DynamoDB leaves unprocessed are retried with
+    exponential backoff. With workers > 0 batches are sent from a thread
+    pool while the caller keeps adding jobs.
+
+        with JobStore(workers=4) as store:
+            store.put_many(crawler.iter_results())
+    """
+    def __init__(self, table_name=TABLE_NAME, dynamodb=None, workers=0,
+                 max_retries=8, backoff_factor=0.05, cache=None, fingerprints=None,
+                 compress_threshold=0, codec=None):
+        """
+        :table_name - name of jobs table
+        :dynamodb - boto3 DynamoDB resource, shared resource of us-east-1 if omitted
+        :workers - threads sending batches, 0 sends from the calling thread
+        :max_retries - attempts to resend unprocessed items of a batch
+        :backoff_factor - sleep before retry is backoff_factor * 2 ** attempt seconds
+        :cache - KnownJobCache or BloomFilter from awslib.jobcache, jobs
+                 found in a KnownJobCache are not written again and not
+                 looked up. Hits of a BloomFilter may be false, they are
+                 looked up with BatchGetItem and only stored jobs are skipped.
+        :fingerprints - FingerprintIndex from awslib.jobcache. Jobs with the
+                        fingerprint and expired flag they were stored with
+                        are skipped, jobs which only expired or came back
+                        get a conditional update of expired, changed jobs
+                        are written again. Takes precedence over cache for
+                        jobs it knows.
+        :compress_threshold - text attributes of at least this many bytes are
+                              stored compressed, see encode_item. 0 stores
+                              plain text. Reads decode either way.
+        :codec - zlib or zstd, zstd if zstandard is installed
+        """
+        self.table_name = table_name
+        self.dynamodb = dynamodb if dynamodb is not None else get_resource()
+        # client of a resource takes plain python values and is thread-safe
+        self.client = self.dynamodb.meta.client
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+        self.futures = []
+        self.cache = cache
+        self.fingerprints = fingerprints
+        self.compress_threshold = compress_threshold
+        self.codec = codec or (default_codec() if compress_threshold else None)
+        self.seen = set()
+        self.pending = []
+        # items of jobs the cache only may know, waiting for a lookup
+        self.maybe_known = []
+        self.stats = {'received': 0, 'duplicates': 0, 'known': 0, 'written': 0,
+                      'batches': 0, 'retries': 0, 'lookups': 0,
+                      'unchanged': 0, 'updated': 0, 'conflicts': 0, 'false_hits': 0}
+        self.stats_lock = threading.Lock()
+
+    def put(self, job):
+        """
+        Queue job for writing, returns False if it was skipped right away:
+        its job id was already queued or the job is known unchanged
+        """
+        self.stats['received'] += 1
+        if job.job_id in self.seen:
+            self.stats['duplicates'] += 1
+            logger.debug("skipping job id: %s", job.job_id)
+            return False
+        self.seen.add(job.job_id)
+        fingerprint = None
+        stored = None
+        if self.fingerprints is not None:
+            fingerprint = job.fingerprint()
+            stored = self.fingerprints.get(job.job_id)
+        if stored is not None and stored[0] == fingerprint:
+            if stored[1] == bool(job.expired):
+                self.stats['unchanged'] += 1
+                return False
+            self._submit(self._update_expired, self.item(job, fingerprint))
+            return True
+        if stored is None and self.cache is not None and job.job_id in self.cache:
+            if getattr(self.cache, "exact", True):
+                self.stats['known'] += 1
+                return False
+            self.maybe_known.append(self.item(job, fingerprint))
+            if len(self.maybe_known) >= BATCH_GET_LIMIT:
+                self._confirm_known()
+            return True
+        self._queue(self.item(job, fingerprint))
+        return True
+
+    def _queue(self, item):
+        self.pending.append(item)
+        if len(self.pending) >= BATCH_WRITE_LIMIT:
+            self._send()
+
+    def _confirm_known(self):
+        """
+        Look up jobs the cache may know, write the ones which aren't stored
+        """
+        items, self.maybe_known = self.maybe_known, []
+        found = set(item['job_id'] for item in self._get_batch([item['job_id'] for item in items]))
+        with self.stats_lock:
+            self.stats['known'] += len(found)
+            self.stats['false_hits'] += len(items) - len(found)
+        for item in items:
+            if item['job_id'] not in found:
+                self._queue(item)
+
+    def item(self, job, fingerprint=None):
+        """
+        Item of a job as it is written, large text compressed
+        """
+        item = job_item(job, fingerprint)
+        if self.compress_threshold:
+            item = encode_item(item, self.compress_threshold, self.codec)
+        return item
+
+    def put_many(self, jobs):
+        """
+        Queue all jobs of an iterable, returns number of unique jobs
+        """
+        count = 0
+        for job in jobs:
+            count += self.put(job)
+        return count
+
+    def flush(self):
+        """
+        Write queued jobs and wait for batches in flight
+        Job ids seen so far are forgotten, next crawl is deduplicated anew.
+        """
+        if self.maybe_known:
+            self._confirm_known()
+        if self.pending:
+            self._send()
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+        self.seen = set()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+
+    def _send(self):
+        items, self.pending = self.pending, []
+        self._submit(self._write_batch, items)
+
+    def _submit(self, write, *args):
+        if self.executor is None:
+            write(*args)
+        else:
+            self.futures = [f for f in self.futures if not f.done() or f.exception()]
+            self.futures.append(self.executor.submit(write, *args))
+
+    def _update_expired(self, item):
+        """
+        Set expired of a stored job if it still has the same fingerprint,
+        write the whole item otherwise
+        """
+        expired = item.get('expired', False)
+        try:
+            with metrics.registry.timer("dynamodb_update"):
+                self.client.update_item(TableName=self.table_name,
+                                        Key={'job_id': item['job_id']},
+                                        UpdateExpression="SET expired = :expired",
+                                        ConditionExpression="fingerprint = :fingerprint",
+                                        ExpressionAttributeValues={':expired': expired,
+                                                                   ':fingerprint': item['fingerprint']})
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # item is missing or was stored with other content
+            with self.stats_lock:
+                self.stats['conflicts'] += 1
+            self._write_batch([item])
+            return
+        with self.stats_lock:
+            self.stats['updated'] += 1
+        self.fingerprints.set(item['job_id'], item['fingerprint'], expired)
+
+    def _write_batch(self, items):
+        request = {self.table_name: [{'PutRequest': {'Item': item}} for item in items]}
+        for attempt in range(self.max_retries + 1):
+            with metrics.registry.timer("dynamodb_batch_write"):
+                response = self.client.batch_write_item(RequestItems=request)
+            unprocessed = response.get('UnprocessedItems') or {}
+            left = len(unprocessed.get(self.table_name, []))
+            with self.stats_lock:
+                self.stats['written'] += len(request[self.table_name]) - left
+                self.stats['batches'] += 1
+            if self.cache is not None or self.fingerprints is not None:
+                left_ids = set(r['PutRequest']['Item']['job_id'] for r in unprocessed.get(self.table_name, []))
+                written = [r['PutRequest']['Item'] for r in request[self.table_name]
+                           if r['PutRequest']['Item']['job_id'] not in left_ids]
+                if self.cache is not None:
+                    self.cache.update(item['job_id'] for item in written)
+                if self.fingerprints is not None:
+                    for item in written:
+                        self.fingerprints.set(item['job_id'], item['fingerprint'], item.get('expired', False))
+            if not left:
+                return
+            request = unprocessed
+            with self.stats_lock:
+                self.stats['retries'] += 1
+            time.sleep(self.backoff_factor * 2 ** attempt)
+        raise RuntimeError("{0} items left unprocessed after {1} retries"
+                           .format(left, self.max_retries))
+
+    def jobs_exist(self, job_ids):
+        """
+        Find which job ids are stored in the table
+        Ids in an exact cache are taken as stored, the rest are looked up
+        with BatchGetItem in chunks of 100 keys and found ones are cached.
+        Returns set of stored job ids
+        """
+        unique_ids = list(dict.fromkeys(job_ids))
+        if self.cache is not None and getattr(self.cache, "exact", True):
+            existing = set(j for j in unique_ids if j in self.cache)
+        else:
+            existing = set()
+        lookup = [j for j in unique_ids if j not in existing]
+        for i in range(0, len(lookup), BATCH_GET_LIMIT):
+            found = [item['job_id'] for item in self._get_batch(lookup[i:i + BATCH_GET_LIMIT])]
+            existing.update(found)
+            if self.cache is not None:
+                self.cache.update(found)
+        return existing
+
+    def get_jobs(self, job_ids):
+        """
+        Stored items of job ids, compressed attributes decoded
+        Returns dict of items by job id, missing jobs are left out
+        """
+        unique_ids = list(dict.fromkeys(job_ids))
+        items = {}
+        for i in range(0, len(unique_ids), BATCH_GET_LIMIT):
+            for item in self._get_batch(unique_ids[i:i + BATCH_GET_LIMIT], projection=None):
+                items[item['job_id']] = decode_item(item)
+        return items
+
+    def _get_batch(self, job_ids, projection='job_id'):
+        request = {self.table_name: {'Keys': [{'job_id': j} for j in job_ids]}}
+        if projection:
+            request[self.table_name]['ProjectionExpression'] = projection
+        found = []
+        for attempt in range(self.max_retries + 1):
+            with metrics.registry.timer("dynamodb_batch_get"):
+                response = self.client.batch_get_item(RequestItems=request)
+            with self.stats_lock:
+                self.stats['lookups'] += 1
+            found.extend(response['Responses'].get(self.table_name, []))
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                return found
+            time.sleep(self.backoff_factor * 2 ** attempt)
+        raise RuntimeError("{0} keys left unprocessed after {1} retries"
+                           .format(len(request[self.table_name]['Keys']), self.max_retries))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def jobs_exist(job_ids, store=None):
+    """
+    Set of job ids from job_ids which are stored in jobRecords table
+    :store - JobStore to look up with, its cache is used if it has one
+    """
+    if store is not None:
+        return store.jobs_exist(job_ids)
+    return JobStore().jobs_exist(job_ids)
+
+
+def get_jobs(job_ids, store=None):
+    """
+    Stored items of job ids by job id, compressed attributes decoded
+    :store - JobStore to read with
+    """
+    if store is not None:
+        return store.get_jobs(job_ids)
+    return JobStore().get_jobs(job_ids)
+
+
+def updateJobs(listOfJobs, store=None):
+    """
+    Put jobs into jobRecords table, skipping repeated job ids
+    :listOfJobs - list or any iterable of Element, e.g. PageCrawler.iter_results()
+    :store - JobStore to write with, it is flushed but left open
+    Returns number of jobs written
+    """
+    if store is not None:
+        count = store.put_many(listOfJobs)
+        store.flush()
+        return count
+    with JobStore() as store:
+        return store.put_many(listOfJobs)
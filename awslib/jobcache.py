@@ -0,0 +1,235 @@
+"""In-process caches of job ids already stored in DynamoDB.
+KnownJobCache is an exact LRU set, BloomFilter takes a fixed amount of
+memory for any number of ids but answers "maybe stored" for a small share
+of new ids, so its hits have to be confirmed before a job is skipped. FingerprintIndex also remembers the content hash of every
+stored job to tell unchanged jobs from changed ones. All of them can be
+saved to and loaded from a local snapshot file,
+so a restarted worker doesn't have to ask DynamoDB about jobs it already
+wrote. Saving merges with the snapshot on disk under a lock, crawler
+processes sharing one file keep each other's jobs.
+"""
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+from collections import OrderedDict
+from indeed.utils import locked_file, write_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class KnownJobCache():
+    """
+    Least recently used set of job ids
+    """
+    # a hit means the job is stored
+    exact = True
+    def __init__(self, maxsize=1000000):
+        """
+        :maxsize - number of job ids kept, the oldest are dropped first
+        """
+        self.maxsize = maxsize
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, job_id):
+        with self.lock:
+            if job_id in self.ids:
+                self.ids.move_to_end(job_id)
+                return True
+            return False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, job_id):
+        with self.lock:
+            self.ids[job_id] = None
+            self.ids.move_to_end(job_id)
+            if len(self.ids) > self.maxsize:
+                self.ids.popitem(last=False)
+
+    def update(self, job_ids):
+        for job_id in job_ids:
+            self.add(job_id)
+
+    def save(self, path):
+        """
+        Write job ids one per line, oldest first
+        Ids of the snapshot on disk are kept, older than ids of this cache.
+        """
+        with self.lock:
+            ids = list(self.ids)
+        with locked_file(path):
+            merged = self.load(path, self.maxsize)
+            merged.update(ids)
+            write_atomic(path, "\n".join(merged.ids).encode("utf-8"))
+
+    @classmethod
+    def load(cls, path, maxsize=1000000):
+        """
+        Read snapshot written by save, empty cache if file is missing
+        """
+        cache = cls(maxsize)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                cache.update(line for line in f.read().split("\n") if line)
+        return cache
+
+
+class FingerprintIndex():
+    """
+    Fingerprint and expired flag of stored jobs by job id
+    Least recently used entries are dropped first.
+    """
+    def __init__(self, maxsize=1000000):
+        """
+        :maxsize - number of jobs kept
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, job_id):
+        """
+        Tuple (fingerprint, expired) of a stored job, None if unknown
+        """
+        with self.lock:
+            entry = self.entries.get(job_id)
+            if entry is not None:
+                self.entries.move_to_end(job_id)
+            return entry
+
+    def set(self, job_id, fingerprint, expired):
+        with self.lock:
+            self.entries[job_id] = (fingerprint, bool(expired))
+            self.entries.move_to_end(job_id)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, job_id):
+        return job_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def save(self, path):
+        """
+        Write one "job_id fingerprint expired" line per job, oldest first
+        Jobs of the snapshot on disk are kept, entries of this index win.
+        """
+        with self.lock:
+            entries = list(self.entries.items())
+        with locked_file(path):
+            merged = self.load(path, self.maxsize)
+            for job_id, (fingerprint, expired) in entries:
+                merged.set(job_id, fingerprint, expired)
+            data = "\n".join("{0}\t{1}\t{2:d}".format(job_id, fingerprint, expired)
+                             for job_id, (fingerprint, expired) in merged.entries.items())
+            write_atomic(path, data.encode("utf-8"))
+
+    @classmethod
+    def load(cls, path, maxsize=1000000):
+        """
+        Read snapshot written by save, empty index if file is missing
+        """
+        index = cls(maxsize)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f.read().split("\n"):
+                    if line:
+                        job_id, fingerprint, expired = line.rsplit("\t", 2)
+                        index.set(job_id, fingerprint, expired == "1")
+        return index
+
+
+class BloomFilter():
+    """
+    Bloom filter of job ids
+    A hit only means the job may be stored. Past capacity the share of
+    false hits grows quickly, a warning is logged once it is reached.
+    """
+    exact = False
+
+    def __init__(self, capacity=1000000, error_rate=0.001, bits=None, hashes=None):
+        """
+        :capacity - expected number of job ids
+        :error_rate - share of new ids reported as known at full capacity
+        """
+        self.bits = bits or int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = hashes or max(1, round(self.bits / capacity * math.log(2)))
+        # capacity the size was chosen for, also for filters read from a snapshot
+        self.capacity = round(self.bits * math.log(2) / self.hashes) if bits else capacity
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+        self.warned = False
+        self.lock = threading.Lock()
+
+    def _positions(self, job_id):
+        # double hashing: position i is h1 + i * h2
+        digest = hashlib.blake2b(job_id.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, job_id):
+        return all(self.array[p >> 3] & (1 << (p & 7)) for p in self._positions(job_id))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+    def add(self, job_id):
+        positions = self._positions(job_id)
+        with self.lock:
+            added = False
+            for p in positions:
+                if not self.array[p >> 3] & (1 << (p & 7)):
+                    self.array[p >> 3] |= 1 << (p & 7)
+                    added = True
+            # ids already in the filter are not counted again
+            self.count += added
+            if self.full and not self.warned:
+                self.warned = True
+                logger.warning("Bloom filter holds %s job ids, more than its capacity of %s: "
+                               "false hits grow, every hit costs a lookup", self.count, self.capacity)
+
+    def update(self, job_ids):
+        for job_id in job_ids:
+            self.add(job_id)
+
+    def save(self, path):
+        """
+        Write the filter, a snapshot of the same size on disk is OR-ed in
+        Count of merged filters is the larger of the two, an estimate.
+        """
+        with self.lock:
+            array = bytearray(self.array)
+            count = self.count
+        with locked_file(path):
+            if os.path.exists(path):
+                stored = self.load(path)
+                if (stored.bits, stored.hashes) == (self.bits, self.hashes):
+                    merged = int.from_bytes(array, "little") | int.from_bytes(stored.array, "little")
+                    array = merged.to_bytes(len(array), "little")
+                    count = max(count, stored.count)
+            write_atomic(path, struct.pack("<QQQ", self.bits, self.hashes, count) + bytes(array))
+
+    @classmethod
+    def load(cls, path, capacity=1000000, error_rate=0.001):
+        """
+        Read snapshot written by save, empty filter if file is missing
+        """
+        if not os.path.exists(path):
+            return cls(capacity, error_rate)
+        with open(path, "rb") as f:
+            data = f.read()
+        bits, hashes, count = struct.unpack("<QQQ", data[:24])
+        bloom = cls(bits=bits, hashes=hashes)
+        bloom.array[:] = data[24:]
+        bloom.count = count
+        return bloom
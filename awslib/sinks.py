@@ -0,0 +1,302 @@
+"""File sinks for crawl results, written next to or instead of DynamoDB.
+Jobs are buffered and written in chunks to rolling files: a new part is
+started every max_rows jobs or max_seconds after its first job. A part
+is written under a .tmp name and renamed when it is complete, so readers
+only ever see finished files. A job id is written once per part.
+
+    with open_sink("parquet", "/data/jobs") as sink:
+        sink.put_many(crawler.iter_results())
+
+NDJSONSink needs only the standard library, ParquetSink and ArrowSink
+import pyarrow when they are created.
+"""
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+from indeed import ELEMENT_FIELDS
+
+# columns of a written job
+SINK_FIELDS = ("job_id",) + ELEMENT_FIELDS
+
+
+def job_row(job):
+    """
+    Values of SINK_FIELDS of an Element
+    """
+    return (job.job_id,) + tuple(getattr(job, field) for field in ELEMENT_FIELDS)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow sinks require pyarrow, pip install pyarrow")
+    return pyarrow
+
+
+class RollingSink():
+    """
+    Base of file sinks, subclasses write buffered rows of one part
+    """
+    extension = ""
+
+    def __init__(self, directory, prefix="jobs", max_rows=100000, buffer_rows=1000,
+                 max_seconds=None):
+        """
+        :directory - where parts are written, created if missing
+        :prefix - beginning of part file names
+        :max_rows - jobs per part, a new file is started after that
+        :buffer_rows - jobs kept in memory before they are written
+        :max_seconds - a part is finished this long after its first job
+                       even if it has fewer than max_rows, never if omitted
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.max_rows = max_rows
+        self.buffer_rows = buffer_rows
+        self.buffer = []
+        self.part = None
+        self.part_path = None
+        self.part_rows = 0
+        self.sequence = 0
+        self.files = []
+        # job ids of the current part and of the buffer
+        self.part_ids = set()
+        self.started = None
+        self.max_seconds = max_seconds
+        self.stats = {'rows': 0, 'files': 0, 'bytes': 0, 'duplicates': 0}
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self.timer = None
+        if max_seconds:
+            self.timer = threading.Thread(target=self._roll_when_due, daemon=True)
+            self.timer.start()
+
+    def put(self, job):
+        """
+        Buffer job, returns False if its job id is already in the part
+        """
+        with self.lock:
+            if job.job_id in self.part_ids:
+                self.stats['duplicates'] += 1
+                return False
+            self.part_ids.add(job.job_id)
+            if self.started is None:
+                self.started = time.monotonic()
+            self.buffer.append(job_row(job))
+            if len(self.buffer) >= self.buffer_rows:
+                self._write_buffer()
+        return True
+
+    def put_many(self, jobs):
+        """
+        Write all jobs of an iterable, returns number of jobs
+        """
+        count = 0
+        for job in jobs:
+            count += self.put(job)
+        return count
+
+    def flush(self):
+        """
+        Write buffered jobs to the current part
+        """
+        with self.lock:
+            self._write_buffer()
+
+    def roll(self):
+        """
+        Write buffered jobs and finish the current part
+        """
+        with self.lock:
+            self._write_buffer()
+            self._finish_part()
+
+    def close(self):
+        self.closed.set()
+        if self.timer is not None:
+            self.timer.join()
+        self.roll()
+
+    def _roll_when_due(self):
+        while not self.closed.wait(self.max_seconds / 4):
+            with self.lock:
+                if self.started is not None and time.monotonic() - self.started >= self.max_seconds:
+                    self._write_buffer()
+                    self._finish_part()
+
+    def _write_buffer(self):
+        while self.buffer:
+            if self.part is None:
+                self._start_part()
+            room = self.max_rows - self.part_rows
+            rows, self.buffer = self.buffer[:room], self.buffer[room:]
+            self._write_rows(rows)
+            self.part_rows += len(rows)
+            self.stats['rows'] += len(rows)
+            if self.part_rows >= self.max_rows:
+                self._finish_part()
+
+    def _start_part(self):
+        name = "{0}-{1}-{2}-{3:05d}{4}".format(
+            self.prefix, datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S"),
+            os.getpid(), self.sequence, self.extension)
+        self.sequence += 1
+        self.part_path = os.path.join(self.directory, name)
+        self.part_rows = 0
+        self.part = self._open_part(self.part_path + ".tmp")
+
+    def _finish_part(self):
+        # rows left in the buffer go to the next part
+        self.part_ids = set(row[0] for row in self.buffer)
+        self.started = time.monotonic() if self.buffer else None
+        if self.part is None:
+            return
+        self._close_part(self.part)
+        os.replace(self.part_path + ".tmp", self.part_path)
+        self.files.append(self.part_path)
+        self.stats['files'] += 1
+        self.stats['bytes'] += os.path.getsize(self.part_path)
+        self.part = None
+
+    def _open_part(self, path):
+        raise NotImplementedError
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def _close_part(self, part):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NDJSONSink(RollingSink):
+    """
+    Gzipped newline-delimited JSON, one job object per line
+    """
+    extension = ".ndjson.gz"
+
+    def __init__(self, directory, compresslevel=6, **kwargs):
+        """
+        :compresslevel - gzip level, 0 writes uncompressed .ndjson files
+        Other parameters are the same as in RollingSink
+        """
+        self.compresslevel = compresslevel
+        if not compresslevel:
+            self.extension = ".ndjson"
+        RollingSink.__init__(self, directory, **kwargs)
+
+    def _open_part(self, path):
+        if self.compresslevel:
+            return gzip.open(path, "wb", compresslevel=self.compresslevel)
+        return open(path, "wb")
+
+    def _write_rows(self, rows):
+        lines = [json.dumps(dict(zip(SINK_FIELDS, row))) for row in rows]
+        self.part.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+    def _close_part(self, part):
+        part.close()
+
+
+class ParquetSink(RollingSink):
+    """
+    Parquet files, every written buffer becomes a row group
+    """
+    extension = ".parquet"
+
+    def __init__(self, directory, compression="zstd", **kwargs):
+        """
+        :compression - Parquet codec: zstd, snappy, gzip or none
+        Other parameters are the same as in RollingSink
+        """
+        self.pa = _pyarrow()
+        import pyarrow.parquet
+        self.compression = compression
+        self.schema = _schema(self.pa)
+        RollingSink.__init__(self, directory, **kwargs)
+
+    def _open_part(self, path):
+        return self.pa.parquet.ParquetWriter(path, self.schema, compression=self.compression)
+
+    def _write_rows(self, rows):
+        self.part.write_table(_table(self.pa, self.schema, rows))
+
+    def _close_part(self, part):
+        part.close()
+
+
+class ArrowSink(RollingSink):
+    """
+    Arrow IPC files, readable with pyarrow.ipc.open_file or memory-mapped
+    """
+    extension = ".arrow"
+
+    def __init__(self, directory, compression="zstd", **kwargs):
+        """
+        :compression - IPC buffer codec: zstd, lz4 or None
+        Other parameters are the same as in RollingSink
+        """
+        self.pa = _pyarrow()
+        import pyarrow.ipc
+        self.compression = compression
+        self.schema = _schema(self.pa)
+        RollingSink.__init__(self, directory, **kwargs)
+
+    def _open_part(self, path):
+        sink = self.pa.OSFile(path, "wb")
+        options = self.pa.ipc.IpcWriteOptions(compression=self.compression)
+        return sink, self.pa.ipc.new_file(sink, self.schema, options=options)
+
+    def _write_rows(self, rows):
+        self.part[1].write_table(_table(self.pa, self.schema, rows))
+
+    def _close_part(self, part):
+        sink, writer = part
+        writer.close()
+        sink.close()
+
+
+def _schema(pa):
+    return pa.schema([(field, pa.bool_() if field == "expired" else pa.string())
+                      for field in SINK_FIELDS])
+
+
+def _table(pa, schema, rows):
+    columns = list(zip(*rows))
+    return pa.Table.from_arrays([pa.array(column, type=schema.field(i).type)
+                                 for i, column in enumerate(columns)], schema=schema)
+
+
+SINKS = {'ndjson': NDJSONSink, 'parquet': ParquetSink, 'arrow': ArrowSink}
+
+
+def open_sink(format="ndjson", path=None, **kwargs):
+    """
+    Create sink of a format, parameters are the same as in its class
+    :format - ndjson, parquet or arrow
+    :path - directory of written parts
+    """
+    if format not in SINKS:
+        raise ValueError("unknown sink format: {0}".format(format))
+    return SINKS[format](path, **kwargs)
+
+
+def tee(jobs, sink):
+    """
+    Yield jobs of an iterable, writing every one of them to sink
+    Jobs reach the sink before the consumer has handled them, the runner
+    writes them after DynamoDB has stored them instead.
+    """
+    for job in jobs:
+        sink.put(job)
+        yield job
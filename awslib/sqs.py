@@ -0,0 +1,287 @@
+"""Batched producer and concurrent consumer for SQS queues.
+BatchSender sends messages with SendMessageBatch in groups of 10 from a
+pool of producer threads, entries SQS fails to accept are resent.
+QueueWorker long-polls a queue and handles messages on a thread pool,
+deleting finished ones in batches.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+from indeed import metrics
+
+# maximum number of entries in one SendMessageBatch, DeleteMessageBatch,
+# ChangeMessageVisibilityBatch or ReceiveMessage call
+SEND_BATCH_LIMIT = 10
+
+logger = logging.getLogger(__name__)
+
+
+class BatchSender():
+    """
+    Send many messages to one queue
+    """
+    def __init__(self, queue_url, sqs=None, workers=4, max_retries=3, backoff_factor=0.1):
+        """
+        :queue_url - URL of the queue
+        :sqs - boto3 SQS client, new client if omitted
+        :workers - producer threads sending batches
+        :max_retries - attempts to resend entries SQS failed to accept
+        :backoff_factor - sleep before retry is backoff_factor * 2 ** attempt seconds
+        """
+        self.queue_url = queue_url
+        self.client = sqs if sqs is not None else boto3.client('sqs')
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.stats = {'sent': 0, 'failed': 0, 'batches': 0, 'retries': 0, 'seconds': 0.0}
+        self.stats_lock = threading.Lock()
+        self.errors = []
+
+    def send_many(self, entries):
+        """
+        Send messages, waits until all batches are done
+        :entries - iterable of dicts with send_message parameters,
+                   e.g. MessageBody, MessageAttributes, DelaySeconds
+        Returns number of messages accepted by SQS
+        """
+        started = time.perf_counter()
+        sent_before = self.stats['sent']
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = deque()
+            for batch in _chunks(entries, SEND_BATCH_LIMIT):
+                # keep a bounded number of batches in memory
+                if len(in_flight) >= self.workers * 2:
+                    in_flight.popleft().result()
+                in_flight.append(executor.submit(self._send_batch, batch))
+            for future in in_flight:
+                future.result()
+        with self.stats_lock:
+            self.stats['seconds'] += time.perf_counter() - started
+            return self.stats['sent'] - sent_before
+
+    def _send_batch(self, entries):
+        pending = {str(i): dict(entry, Id=str(i)) for i, entry in enumerate(entries)}
+        for attempt in range(self.max_retries + 1):
+            with metrics.registry.timer("sqs_send"):
+                response = self.client.send_message_batch(QueueUrl=self.queue_url,
+                                                          Entries=list(pending.values()))
+            successful = response.get('Successful', [])
+            retry = {}
+            for failure in response.get('Failed', []):
+                if failure.get('SenderFault') or attempt == self.max_retries:
+                    self.errors.append(failure)
+                else:
+                    retry[failure['Id']] = pending[failure['Id']]
+            with self.stats_lock:
+                self.stats['batches'] += 1
+                self.stats['sent'] += len(successful)
+                self.stats['failed'] += len(pending) - len(successful) - len(retry)
+                self.stats['retries'] += bool(retry)
+            if not retry:
+                return
+            pending = retry
+            time.sleep(self.backoff_factor * 2 ** attempt)
+
+    @property
+    def messages_per_second(self):
+        with self.stats_lock:
+            seconds = self.stats['seconds']
+            return self.stats['sent'] / seconds if seconds else 0.0
+
+
+class QueueWorker():
+    """
+    Process messages of a queue on a pool of threads
+    Messages are received with long polling only when a thread is free.
+    A message is deleted after its handler returns, handlers of long
+    crawls keep their messages invisible through a heartbeat. A handler
+    raising an exception doesn't stop the worker, its message is left in
+    the queue and becomes visible again after visibility timeout. Neither
+    does a failed poll, polling is retried after a backoff with jitter.
+
+        worker = QueueWorker(queue_url, handle, workers=4)
+        worker.run()
+    """
+    def __init__(self, queue_url, handler, sqs=None, workers=4, wait_time=20,
+                 visibility_timeout=600, heartbeat=None, backoff_factor=1.0, max_backoff=60):
+        """
+        :queue_url - URL of the queue
+        :handler - function called with every message dict (Body,
+                   MessageAttributes, ReceiptHandle...)
+        :sqs - boto3 SQS client, new client if omitted
+        :workers - messages handled at once
+        :wait_time - long polling time of ReceiveMessage in seconds
+        :visibility_timeout - seconds a received message stays invisible
+        :heartbeat - seconds between visibility extensions of messages in
+                     progress, half of visibility_timeout if omitted
+        :backoff_factor - sleep after n failed polls in a row is up to
+                          backoff_factor * 2 ** (n - 1) seconds, with jitter
+        :max_backoff - longest sleep between failed polls
+        """
+        self.queue_url = queue_url
+        self.handler = handler
+        self.client = sqs if sqs is not None else boto3.client('sqs')
+        self.workers = workers
+        self.wait_time = wait_time
+        self.visibility_timeout = visibility_timeout
+        self.heartbeat = heartbeat or visibility_timeout / 2
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.receive_failures = 0
+        self.stop_event = threading.Event()
+        self.in_flight = {}
+        self.done = deque()
+        self.stats = {'received': 0, 'succeeded': 0, 'failed': 0, 'deleted': 0,
+                      'extended': 0, 'polls': 0, 'empty_polls': 0, 'poll_errors': 0,
+                      'handle_seconds': 0.0, 'max_handle_seconds': 0.0}
+        self.stats_lock = threading.Lock()
+        self.started = None
+
+    def run(self, until_empty=False):
+        """
+        Receive and handle messages until stop is called
+        :until_empty - also stop when the queue has no messages left
+        """
+        self.started = time.perf_counter()
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while not self.stop_event.is_set():
+                free = self.workers - len(self.in_flight)
+                if free <= 0:
+                    wait(list(self.in_flight.values()), timeout=self.wait_time,
+                         return_when=FIRST_COMPLETED)
+                    self._collect()
+                    continue
+                try:
+                    messages = self._receive(min(free, SEND_BATCH_LIMIT))
+                except (BotoCoreError, ClientError) as e:
+                    self._collect()
+                    self._backoff(e)
+                    continue
+                for message in messages:
+                    self.in_flight[message['ReceiptHandle']] = executor.submit(self._handle, message)
+                self._collect()
+                if until_empty and not messages and not self.in_flight:
+                    break
+        finally:
+            # let running handlers finish and delete their messages
+            executor.shutdown(wait=True)
+            self.stop_event.set()
+            self._collect()
+            heartbeat.join()
+
+    def stop(self):
+        """
+        Stop receiving, messages in progress are finished and deleted
+        """
+        self.stop_event.set()
+
+    def _backoff(self, error):
+        """
+        Sleep after a failed poll, longer with every failure in a row
+        """
+        self.receive_failures += 1
+        delay = min(self.max_backoff, self.backoff_factor * 2 ** (self.receive_failures - 1))
+        delay *= random.uniform(0.5, 1.0)
+        with self.stats_lock:
+            self.stats['poll_errors'] += 1
+        logger.error("Error receiving messages, retrying in %.1f s: %s", delay, error)
+        self.stop_event.wait(delay)
+
+    def _receive(self, count):
+        with metrics.registry.timer("sqs_receive"):
+            response = self.client.receive_message(QueueUrl=self.queue_url,
+                                                   MaxNumberOfMessages=count,
+                                                   WaitTimeSeconds=self.wait_time,
+                                                   VisibilityTimeout=self.visibility_timeout,
+                                                   MessageAttributeNames=['All'])
+        messages = response.get('Messages', [])
+        self.receive_failures = 0
+        with self.stats_lock:
+            self.stats['polls'] += 1
+            self.stats['empty_polls'] += not messages
+            self.stats['received'] += len(messages)
+        return messages
+
+    def _handle(self, message):
+        started = time.perf_counter()
+        try:
+            self.handler(message)
+        except Exception:
+            logger.exception("Error handling message %s", message.get('MessageId'))
+            succeeded = False
+        else:
+            succeeded = True
+        elapsed = time.perf_counter() - started
+        with self.stats_lock:
+            self.stats['succeeded' if succeeded else 'failed'] += 1
+            self.stats['handle_seconds'] += elapsed
+            self.stats['max_handle_seconds'] = max(self.stats['max_handle_seconds'], elapsed)
+        if succeeded:
+            self.done.append(message['ReceiptHandle'])
+
+    def _collect(self):
+        """
+        Forget finished messages and delete successful ones in batches
+        Every successful message is deleted right away, the heartbeat no
+        longer extends it and it would be received again after visibility
+        timeout.
+        """
+        for receipt_handle, future in list(self.in_flight.items()):
+            if future.done():
+                del self.in_flight[receipt_handle]
+        while self.done:
+            batch = [self.done.popleft() for _ in range(min(SEND_BATCH_LIMIT, len(self.done)))]
+            self._change_batch(self.client.delete_message_batch, batch, 'deleted')
+
+    def _heartbeat(self):
+        while not self.stop_event.wait(self.heartbeat):
+            handles = [h for h, f in list(self.in_flight.items()) if not f.done()]
+            for i in range(0, len(handles), SEND_BATCH_LIMIT):
+                self._change_batch(self.client.change_message_visibility_batch,
+                                   handles[i:i + SEND_BATCH_LIMIT], 'extended',
+                                   VisibilityTimeout=self.visibility_timeout)
+
+    def _change_batch(self, call, receipt_handles, counter, **entry):
+        entries = [dict(entry, Id=str(i), ReceiptHandle=h) for i, h in enumerate(receipt_handles)]
+        try:
+            with metrics.registry.timer("sqs_" + counter):
+                response = call(QueueUrl=self.queue_url, Entries=entries)
+        except Exception as e:
+            logger.error("Error: %s", e)
+            return
+        for failure in response.get('Failed', []):
+            logger.error("Error in %s: %s", counter, failure)
+        with self.stats_lock:
+            self.stats[counter] += len(response.get('Successful', []))
+
+    def report(self):
+        """
+        Counters with throughput and mean handling latency
+        """
+        with self.stats_lock:
+            report = dict(self.stats)
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        finished = report['succeeded'] + report['failed']
+        report['in_flight'] = len(self.in_flight)
+        report['messages_per_second'] = finished / elapsed if elapsed else 0.0
+        report['mean_handle_seconds'] = report['handle_seconds'] / finished if finished else 0.0
+        return report
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,13 @@
+"""Helpers to set up local AWS stand-ins (moto) for benchmarks and tests."""
+from awslib import dynamodb
+
+
+def create_jobs_table(resource, table_name=dynamodb.TABLE_NAME):
+    """
+    Create jobs table keyed on job_id with on-demand capacity
+    """
+    return resource.create_table(
+        TableName=table_name,
+        KeySchema=[{'AttributeName': 'job_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'job_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
@@ -0,0 +1,77 @@
+"""Size and write units of jobs with full descriptions, stored as plain text
+and with large text attributes compressed by zlib and zstd.
+Descriptions are a few KB of boilerplate and varying requirements, as
+crawler_desc fetches them from job pages.
+Run from the repository root:
+    python -m benchmarks.bench_compress
+"""
+import random
+import time
+from awslib import dynamodb
+from benchmarks.feeds import make_jobs
+
+BOILERPLATE = (
+    "We are an equal opportunity employer and value diversity at our company. "
+    "We do not discriminate on the basis of race, religion, color, national origin, "
+    "gender, sexual orientation, age, marital status, veteran status, or disability status. "
+    "Benefits include medical, dental and vision insurance, a 401(k) plan with company match, "
+    "paid time off, parental leave and a learning budget. "
+)
+WORDS = ("python django flask aws dynamodb sqs lambda docker kubernetes postgres redis "
+         "experience years team design build maintain scalable services customers data "
+         "pipelines testing review mentoring agile remote seattle onsite hybrid senior "
+         "junior communication ownership production monitoring api rest graphql").split()
+
+
+def describe(job, rng, sentences=30):
+    """
+    Description of a job with repeated boilerplate around random requirements
+    """
+    requirements = " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+        for _ in range(sentences))
+    return "{0} at {1} in {2}, {3}. {4} {5}".format(
+        job.title, job.company, job.city, job.state, requirements, BOILERPLATE * 3)
+
+
+def make_described_jobs(count, seed=42):
+    rng = random.Random(seed)
+    jobs = make_jobs(count)
+    for job in jobs:
+        job.description = describe(job, rng)
+    return jobs
+
+
+def run(count=10000, threshold=dynamodb.COMPRESS_THRESHOLD):
+    """
+    Returns list of dicts with bytes and write units of count jobs per encoding
+    """
+    items = [dynamodb.job_item(job, job.fingerprint()) for job in make_described_jobs(count)]
+    codecs = ["plain", "zlib"] + (["zstd"] if dynamodb._zstandard() is not None else [])
+    report = []
+    for codec in codecs:
+        start = time.perf_counter()
+        if codec == "plain":
+            encoded = items
+        else:
+            encoded = [dynamodb.encode_item(item, threshold, codec) for item in items]
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = [dynamodb.decode_item(item) for item in encoded]
+        decode_time = time.perf_counter() - start
+        assert decoded == items
+        size = sum(dynamodb.item_size(item) for item in encoded)
+        report.append({'codec': codec, 'jobs': count,
+                       'bytes': size,
+                       'bytes_per_job': size / count,
+                       'write_units': sum(dynamodb.write_units(item) for item in encoded),
+                       'encode_us_per_job': encode_time / count * 1e6,
+                       'decode_us_per_job': decode_time / count * 1e6})
+    return report
+
+
+if __name__ == '__main__':
+    for row in run():
+        print("{codec:>6}: {bytes} bytes ({bytes_per_job:.0f} per job), {write_units} write units "
+              "per {jobs} jobs, encode {encode_us_per_job:.1f} us, decode {decode_us_per_job:.1f} us "
+              "per job".format(**row))
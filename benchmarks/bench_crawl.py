@@ -0,0 +1,91 @@
+"""Throughput of PageCrawler.crawl and of the crawler -> store pipeline
+against the fake apisearch server, with moto standing in for SQS and
+DynamoDB.
+Run from the repository root:
+    python -m benchmarks.bench_crawl
+"""
+import contextlib
+import io
+import json
+import threading
+import time
+from unittest.mock import patch
+import boto3
+from moto import mock_aws
+from awslib import dynamodb
+from awslib.sqs import BatchSender, QueueWorker
+from indeed import Indeed, make_session
+from indeed.PageCrawler import PageCrawler
+from indeed.ratelimit import TokenBucket
+from benchmarks.aws import create_jobs_table
+from benchmarks.fake_indeed import FakeIndeedServer
+
+
+def _unlimited():
+    return TokenBucket(100000, burst=1000)
+
+
+def crawl(total_results=1000, latency=0.005, workers=(1, 8)):
+    """
+    Pages and jobs per second of one crawl, sequential and fanned out
+    """
+    report = []
+    for width in workers:
+        with FakeIndeedServer(total_results=total_results, latency=latency) as server, \
+                patch.object(Indeed, "API_URL", server.url), \
+                contextlib.redirect_stdout(io.StringIO()):
+            crawler = PageCrawler("1", "python", workers=width, rate_limiter=_unlimited())
+            started = time.perf_counter()
+            crawler.crawl()
+            elapsed = time.perf_counter() - started
+            pages = server.requests
+        report.append({'workers': width, 'latency': latency, 'jobs': len(crawler.results),
+                       'pages_per_second': pages / elapsed,
+                       'jobs_per_second': len(crawler.results) / elapsed})
+    return report
+
+
+def pipeline(tasks=20, total_results=200, latency=0.002, crawler_workers=4):
+    """
+    Tasks and stored jobs per second from queue to table
+    """
+    with FakeIndeedServer(total_results=total_results, latency=latency) as server, \
+            patch.object(Indeed, "API_URL", server.url), mock_aws(), \
+            contextlib.redirect_stdout(io.StringIO()):
+        sqs = boto3.client('sqs', region_name='us-east-1')
+        queue_url = sqs.create_queue(QueueName='crawler_tasks')['QueueUrl']
+        resource = boto3.resource('dynamodb', region_name=dynamodb.REGION_NAME)
+        create_jobs_table(resource)
+        BatchSender(queue_url, sqs=sqs).send_many(
+            {'MessageBody': json.dumps({'title': 'python', 'zip_code': 98000 + i})}
+            for i in range(tasks))
+        session = make_session(pool_size=crawler_workers)
+        limiter = _unlimited()
+        stored = [0]
+        lock = threading.Lock()
+
+        def handle(message):
+            task = json.loads(message['Body'])
+            crawler = PageCrawler("1", task['title'], location=task['zip_code'],
+                                  session=session, rate_limiter=limiter)
+            with dynamodb.JobStore(dynamodb=resource) as store:
+                count = store.put_many(crawler.iter_results())
+            with lock:
+                stored[0] += count
+
+        worker = QueueWorker(queue_url, handle, sqs=sqs, workers=crawler_workers, wait_time=0)
+        started = time.perf_counter()
+        worker.run(until_empty=True)
+        elapsed = time.perf_counter() - started
+    return [{'tasks': tasks, 'crawler_workers': crawler_workers, 'jobs_stored': stored[0],
+             'tasks_per_second': tasks / elapsed, 'jobs_per_second': stored[0] / elapsed}]
+
+
+def run():
+    return {'crawl': crawl(), 'pipeline': pipeline()}
+
+
+if __name__ == '__main__':
+    for name, rows in run().items():
+        for row in rows:
+            print(name, row)
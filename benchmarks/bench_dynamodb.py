@@ -0,0 +1,55 @@
+"""Write throughput of the old updateJobs loop vs JobStore against moto.
+moto answers in-process, so the numbers show client-side overhead and
+dedup cost rather than network latency.
+Run from the repository root:
+    python -m benchmarks.bench_dynamodb
+"""
+import contextlib
+import io
+import time
+import boto3
+from moto import mock_aws
+from awslib import dynamodb
+from benchmarks.feeds import make_jobs
+from benchmarks.aws import create_jobs_table
+
+
+def old_update_jobs(jobs):
+    """
+    Previous updateJobs: new resource per call and list-based dedup
+    """
+    table = boto3.resource('dynamodb', region_name=dynamodb.REGION_NAME).Table(dynamodb.TABLE_NAME)
+    unique_jobIds = []
+    with table.batch_writer() as batch:
+        for j in jobs:
+            if j.job_id not in unique_jobIds:
+                unique_jobIds.append(j.job_id)
+                batch.put_item(Item=dynamodb.job_item(j))
+
+
+def _job_store(workers):
+    def write(jobs, resource):
+        with dynamodb.JobStore(dynamodb=resource, workers=workers) as store:
+            store.put_many(jobs)
+    return write
+
+
+def run(count=5000):
+    jobs = make_jobs(count)
+    report = []
+    for name, write in (("old_update_jobs", lambda jobs, resource: old_update_jobs(jobs)),
+                        ("job_store", _job_store(0)),
+                        ("job_store_4_workers", _job_store(4))):
+        with mock_aws():
+            resource = boto3.resource('dynamodb', region_name=dynamodb.REGION_NAME)
+            create_jobs_table(resource)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                write(jobs, resource)
+            elapsed = time.perf_counter() - started
+        report.append({'writer': name, 'jobs': count, 'jobs_per_second': count / elapsed})
+    return report
+
+if __name__ == '__main__':
+    for row in run():
+        print("{writer:>20}: {jobs_per_second:.0f} jobs/s for {jobs} jobs".format(**row))
@@ -0,0 +1,61 @@
+"""Compare JSON page decoding of the old search_jobs with the single decode path.
+Run from the repository root:
+    python -m benchmarks.bench_json
+"""
+import json
+import timeit
+from indeed import Element, ResultBatch, parse_json, json_loads
+from benchmarks.feeds import make_json_feed
+
+SIZES = (25, 1000, 10000)
+
+
+def parse_json_twice(content):
+    """
+    Previous implementation of JSON branch of Indeed.search_jobs
+    Body is decoded once for results and once for totalResults.
+    """
+    results = []
+    for i in json.loads(content)['results']:
+        title = i['jobtitle']
+        company = i['company']
+        city = i['city']
+        state = i['state']
+        country = i['country']
+        source = i['source']
+        date = i['date']
+        description = i['snippet']
+        url = i['url']
+        expired = i['expired']
+        date_published = i['formattedRelativeTime']
+        results.append(Element(title, company, city, state, country, source, date,
+                               description, url, expired, date_published))
+    return json.loads(content)['totalResults'], results
+
+
+def run(sizes=SIZES, repeat=3):
+    """
+    Time old and new decode paths for every page size
+    json_loads is orjson or ujson when installed, json.loads otherwise.
+    Returns list of dicts with seconds per page and per result
+    """
+    parsers = (("twice", parse_json_twice),
+               ("single_stdlib", lambda content: parse_json(json.loads(content))),
+               ("single_fast", lambda content: parse_json(json_loads(content))),
+               ("single_fast_batch", lambda content: parse_json(json_loads(content), ResultBatch())))
+    report = []
+    for size in sizes:
+        content = make_json_feed(size)
+        number = max(1, 20000 // size)
+        for name, func in parsers:
+            best = min(timeit.repeat(lambda: func(content), number=number, repeat=repeat)) / number
+            report.append({'parser': name, 'decoder': json_loads.__module__ if name.startswith("single_fast") else "json",
+                           'results': size, 'sec_per_page': best,
+                           'usec_per_result': best / size * 1e6})
+    return report
+
+
+if __name__ == '__main__':
+    for row in run():
+        print("{parser:>18} ({decoder}) {results:>6} results: {sec_per_page:.5f} s/page, "
+              "{usec_per_result:.2f} us/result".format(**row))
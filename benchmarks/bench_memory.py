@@ -0,0 +1,78 @@
+"""Memory per 100k jobs for the old dict-based Element, slotted Element
+and columnar ResultBatch.
+Run from the repository root:
+    python -m benchmarks.bench_memory
+"""
+import gc
+import tracemalloc
+import urllib.parse as urlparse
+from indeed import Element, ResultBatch
+from benchmarks.feeds import make_results
+
+
+class DictElement():
+    """
+    Previous Element: instance __dict__ and job_id parsed in constructor
+    """
+    def __init__(self, title, company, city, state, country, source, date,
+                 description, url, expired, date_published):
+        self.title = title
+        self.company = company
+        self.city = city
+        self.state = state
+        self.country = country
+        self.source = source
+        self.date = date
+        self.description = description
+        self.url = url
+        self.expired = expired
+        self.date_published = date_published
+        self.job_id = (urlparse.parse_qs((urlparse.urlparse(url)).query))['jk'][0]
+
+
+def _rows(count):
+    keys = ('jobtitle', 'company', 'city', 'state', 'country', 'source', 'date',
+            'snippet', 'url', 'expired', 'formattedRelativeTime')
+    return [tuple(r[k] for k in keys) for r in make_results(count)]
+
+
+def _build_list(cls):
+    return lambda rows: [cls(*row) for row in rows]
+
+
+def _build_batch(rows):
+    batch = ResultBatch()
+    for row in rows:
+        batch.append_row(*row)
+    return batch
+
+
+def measure(build, rows):
+    """
+    Bytes allocated by build(rows) which are still alive afterwards
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build(rows)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def run(count=100000):
+    rows = _rows(count)
+    report = []
+    for name, build in (("dict_element", _build_list(DictElement)),
+                        ("slotted_element", _build_list(Element)),
+                        ("result_batch", _build_batch)):
+        allocated = measure(build, rows)
+        report.append({'layout': name, 'jobs': count, 'bytes': allocated,
+                       'bytes_per_job': allocated / count})
+    return report
+
+
+if __name__ == '__main__':
+    for row in run():
+        print("{layout:>16}: {bytes} bytes for {jobs} jobs, "
+              "{bytes_per_job:.1f} bytes/job".format(**row))
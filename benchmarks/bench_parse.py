@@ -0,0 +1,58 @@
+"""Compare single-pass XML parsing with the old findall-per-field loop.
+Run from the repository root:
+    python -m benchmarks.bench_parse
+"""
+import timeit
+from lxml import etree
+from indeed import Element, parse_xml
+from benchmarks.feeds import make_xml_feed
+
+SIZES = (25, 100, 1000)
+
+
+def parse_xml_findall(content):
+    """
+    Previous implementation of XML branch of Indeed.search_jobs
+    """
+    results = []
+    xml_resp = etree.fromstring(content)
+    count_of_results = len(xml_resp.findall(".//date"))
+    for i in range(count_of_results):
+        title = xml_resp.findall(".//jobtitle")[i].text
+        company = xml_resp.findall(".//company")[i].text
+        city = xml_resp.findall(".//city")[i].text
+        state = xml_resp.findall(".//state")[i].text
+        country = xml_resp.findall(".//country")[i].text
+        source = xml_resp.findall(".//source")[i].text
+        date = xml_resp.findall(".//date")[i].text
+        description = xml_resp.findall(".//snippet")[i].text
+        url = xml_resp.findall(".//url")[i].text
+        expired = False if xml_resp.findall(".//expired")[i].text == 'false' else True
+        date_published = xml_resp.findall(".//formattedRelativeTime")[i].text
+        results.append(Element(title, company, city, state, country, source,
+                               date, description, url, expired, date_published))
+    return results
+
+
+def run(sizes=SIZES, repeat=3):
+    """
+    Time both parsers for every feed size
+    Returns list of dicts with seconds per page and per result
+    """
+    report = []
+    for size in sizes:
+        content = make_xml_feed(size)
+        number = max(1, 2000 // size)
+        for name, func in (("findall", parse_xml_findall), ("single_pass", parse_xml)):
+            # quadratic parser gets a single run on the largest page
+            n = 1 if name == "findall" and size >= 1000 else number
+            best = min(timeit.repeat(lambda: func(content), number=n, repeat=repeat)) / n
+            report.append({'parser': name, 'results': size,
+                           'sec_per_page': best, 'usec_per_result': best / size * 1e6})
+    return report
+
+
+if __name__ == '__main__':
+    for row in run():
+        print("{parser:>12} {results:>5} results: {sec_per_page:.5f} s/page, "
+              "{usec_per_result:.1f} us/result".format(**row))
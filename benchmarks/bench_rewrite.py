@@ -0,0 +1,70 @@
+"""Writes of a repeated crawl with and without change detection, against moto.
+The second crawl returns the same jobs with date_published drifted, a few
+of them expired and a few edited, as daily crawls of one location do.
+Run from the repository root:
+    python -m benchmarks.bench_rewrite
+"""
+import boto3
+from moto import mock_aws
+from awslib import dynamodb
+from awslib.jobcache import FingerprintIndex
+from benchmarks.feeds import make_jobs
+from benchmarks.aws import create_jobs_table
+
+
+def second_crawl(count, expired_share=0.05, changed_share=0.02):
+    jobs = make_jobs(count)
+    for i, job in enumerate(jobs):
+        job.date_published = "2 days ago"
+        if i < count * expired_share:
+            job.expired = True
+        elif i < count * (expired_share + changed_share):
+            job.description += " (edited)"
+    return jobs
+
+
+def item_units(item):
+    """
+    Write capacity units of an item
+    An update consumes the units of the whole item too.
+    """
+    return dynamodb.write_units(item)
+
+
+class CountingStore(dynamodb.JobStore):
+    """
+    JobStore adding up write units of the items it sends
+    """
+    units = 0
+
+    def _write_batch(self, items):
+        self.units += sum(item_units(item) for item in items)
+        dynamodb.JobStore._write_batch(self, items)
+
+    def _update_expired(self, item):
+        self.units += item_units(item)
+        dynamodb.JobStore._update_expired(self, item)
+
+
+def run(count=5000):
+    """
+    Returns list of dicts with write requests and units of two crawls
+    """
+    report = []
+    for name, fingerprints in (("put_every_job", None), ("fingerprints", FingerprintIndex())):
+        with mock_aws():
+            resource = boto3.resource('dynamodb', region_name=dynamodb.REGION_NAME)
+            create_jobs_table(resource)
+            for crawl, jobs in (("first", make_jobs(count)), ("second", second_crawl(count))):
+                with CountingStore(dynamodb=resource, fingerprints=fingerprints) as store:
+                    store.put_many(jobs)
+                report.append({'writer': name, 'crawl': crawl, 'jobs': count,
+                               'puts': store.stats['written'], 'updates': store.stats['updated'],
+                               'skipped': store.stats['unchanged'], 'write_units': store.units})
+    return report
+
+
+if __name__ == '__main__':
+    for row in run():
+        print("{writer:>14} {crawl:>6} crawl of {jobs} jobs: {puts} puts, {updates} updates, "
+              "{skipped} skipped, {write_units} write units".format(**row))
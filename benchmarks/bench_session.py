@@ -0,0 +1,44 @@
+"""Per-page latency with a fresh connection per request vs pooled session.
+Run from the repository root:
+    python -m benchmarks.bench_session
+"""
+import time
+import requests
+from indeed import Indeed, make_session
+from benchmarks.fake_indeed import FakeIndeedServer
+
+
+class _NoPoolSession(requests.Session):
+    """
+    Session that closes connection after every request, like requests.get
+    """
+    def request(self, *args, **kwargs):
+        try:
+            return requests.Session.request(self, *args, **kwargs)
+        finally:
+            self.close()
+
+
+def run(pages=200):
+    """
+    Fetch the same number of pages in both modes
+    Returns list of dicts with milliseconds per page and opened connections
+    """
+    report = []
+    for name, session in (("per_request", _NoPoolSession()), ("pooled", make_session())):
+        with FakeIndeedServer(total_results=pages * 25) as server:
+            indeed = Indeed("1", session=session, base_url=server.url)
+            started = time.perf_counter()
+            for page in range(pages):
+                indeed.search_jobs("python", start=page * 25)
+            elapsed = time.perf_counter() - started
+            report.append({'mode': name, 'pages': pages,
+                           'ms_per_page': elapsed / pages * 1000,
+                           'connections': server.connections})
+    return report
+
+
+if __name__ == '__main__':
+    for row in run():
+        print("{mode:>12}: {ms_per_page:.2f} ms/page, "
+              "{connections} connections for {pages} pages".format(**row))
@@ -0,0 +1,78 @@
+"""Measure worker startup: import time of entry points and per-call cost
+of random user agents and IPs.
+Run from the repository root:
+    python -m benchmarks.bench_startup
+"""
+import os
+import subprocess
+import sys
+import timeit
+from ipaddress import IPv4Address
+from random import getrandbits
+from indeed.utils import getRandomIP, getRandomUserAgent, loadUserAgents
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# statements timed in a fresh interpreter
+IMPORTS = (
+    ("indeed", "import indeed"),
+    ("runner_main", "import main"),
+    ("runner_plan", "import main; import yaml; import indeed.geo"),
+    ("runner_crawler", "import main; import yaml, boto3; import indeed.PageCrawler, "
+                       "indeed.coalesce, indeed.shard, awslib.dynamodb, awslib.sqs, awslib.sinks"),
+    # modules main.py imported for every command before imports were deferred
+    ("runner_eager", "import yaml, boto3, requests, lxml.etree, my_fake_useragent; import indeed.PageCrawler, "
+                     "indeed.coalesce, indeed.shard, awslib.dynamodb, awslib.sqs, awslib.sinks"),
+)
+
+
+def import_seconds(statement, repeat=5):
+    """
+    Best wall time of running statement in a new interpreter, timed
+    inside it so interpreter startup itself isn't counted
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "runner")]))
+
+    def run(code):
+        best = None
+        for _ in range(repeat):
+            out = subprocess.check_output([sys.executable, "-c",
+                                           "import time; t = time.perf_counter(); "
+                                           + code + "\nprint(time.perf_counter() - t)"], env=env)
+            seconds = float(out.decode().split()[-1])
+            best = seconds if best is None else min(best, seconds)
+        return best
+    return run(statement or "pass")
+
+
+def old_user_agent():
+    from my_fake_useragent import UserAgent
+    return UserAgent().random()
+
+
+def old_ip():
+    return str(IPv4Address(getrandbits(32)))
+
+
+def run(repeat=5):
+    """
+    Returns dict with import seconds per entry point and microseconds per draw
+    """
+    report = {'imports': {name: import_seconds(statement, repeat) for name, statement in IMPORTS}}
+    loadUserAgents()
+    draws = {}
+    for name, func, number in (("user_agent_old", old_user_agent, 20),
+                               ("user_agent_pool", getRandomUserAgent, 100000),
+                               ("ip_old", old_ip, 100000),
+                               ("ip_fast", getRandomIP, 100000)):
+        draws[name] = min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+    report['usec_per_call'] = draws
+    return report
+
+
+if __name__ == '__main__':
+    report = run()
+    for name, seconds in report['imports'].items():
+        print("{0:>16}: {1:.1f} ms to import".format(name, seconds * 1e3))
+    for name, usec in report['usec_per_call'].items():
+        print("{0:>16}: {1:.2f} us per call".format(name, usec))
@@ -0,0 +1,53 @@
+"""Peak memory and time of a 1000-result crawl collected into a list vs
+consumed as a stream.
+Run from the repository root:
+    python -m benchmarks.bench_stream
+"""
+import contextlib
+import io
+import time
+import tracemalloc
+from unittest.mock import patch
+from indeed import Indeed
+from indeed.PageCrawler import PageCrawler
+from indeed.ratelimit import TokenBucket
+from indeed.utils import loadUserAgents
+from benchmarks.fake_indeed import FakeIndeedServer
+
+
+def _collect(crawler):
+    crawler.crawl()
+    return len(crawler.results)
+
+
+def _stream(crawler):
+    count = 0
+    for _ in crawler.iter_results():
+        count += 1
+    return count
+
+
+def run(total_results=1000):
+    report = []
+    # the user agent pool is loaded once per process, keep it out of both modes
+    loadUserAgents()
+    with FakeIndeedServer(total_results=total_results) as server, \
+            patch.object(Indeed, "API_URL", server.url):
+        for name, consume in (("list", _collect), ("stream", _stream)):
+            crawler = PageCrawler("1", "python", rate_limiter=TokenBucket(10000, burst=100))
+            with contextlib.redirect_stdout(io.StringIO()):
+                tracemalloc.start()
+                started = time.perf_counter()
+                jobs = consume(crawler)
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            report.append({'mode': name, 'jobs': jobs, 'seconds': elapsed,
+                           'peak_bytes': peak})
+    return report
+
+
+if __name__ == '__main__':
+    for row in run():
+        print("{mode:>6}: {jobs} jobs in {seconds:.2f} s, "
+              "peak {peak_bytes} bytes".format(**row))
@@ -0,0 +1,137 @@
+"""Local stand-in for Indeed apisearch endpoint.
+Serves synthetic JSON and XML feeds over HTTP/1.1 keep-alive with
+configurable result count, latency and share of 429/500 answers, and
+counts accepted connections and requests, so tests and benchmarks run
+without network access.
+
+    server = FakeIndeedServer(total_results=100)
+    server.start()
+    indeed = Indeed("1", base_url=server.url)
+    ...
+    server.stop()
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from benchmarks.feeds import make_json_feed, make_xml_feed
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            draw = server.random.random()
+        if draw < server.throttle_rate + server.error_rate:
+            status = 429 if draw < server.throttle_rate else 500
+            with server.lock:
+                server.failures[status] = server.failures.get(status, 0) + 1
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        params = parse_qs(urlparse(self.path).query)
+        start = int(params.get('start', ['0'])[0] or 0)
+        limit = int(params.get('limit', ['25'])[0] or 25)
+        ids = None
+        if server.corpus is not None:
+            matching = server.search_corpus(params)
+            total = len(matching)
+            ids = matching[start:start + limit]
+        else:
+            total = self.server.total_results
+        count = max(0, min(limit, total - start))
+        first = start + self.server.first_id
+        if params.get('format', ['json'])[0] == 'xml':
+            body, content_type = make_xml_feed(count, first, total, ids), "text/xml"
+        else:
+            body, content_type = make_json_feed(count, first, total, ids), "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeIndeedServer(ThreadingHTTPServer):
+    """
+    Fake apisearch server bound to a random local port
+    """
+    daemon_threads = True
+
+    def __init__(self, total_results=100, host="127.0.0.1", port=0, first_id=0,
+                 latency=0.0, error_rate=0.0, throttle_rate=0.0, seed=0, corpus=None):
+        """
+        :total_results - totalResults reported for every query
+        :corpus - list of job dicts with job_type, site_type, distance
+                  (miles) and age (days) filtered by jt, st, radius and
+                  fromage of a query; job key number is the position in
+                  the list. total_results is ignored if given.
+        :first_id - number of job key of the first result, lower it to
+                    simulate new postings on top of the feed
+        :latency - seconds before every answer
+        :error_rate - share of requests answered with 500
+        :throttle_rate - share of requests answered with 429
+        :seed - seed of random failures
+        """
+        ThreadingHTTPServer.__init__(self, (host, port), _Handler)
+        self.total_results = total_results
+        self.first_id = first_id
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.corpus = corpus
+        self.failures = {}
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self._thread = None
+
+    def search_corpus(self, params):
+        """
+        Positions of corpus jobs matching query parameters, newest first
+        """
+        job_type = params.get('jt', [''])[0]
+        site_type = params.get('st', [''])[0]
+        radius = float(params.get('radius', ['25'])[0] or 25)
+        fromage = params.get('fromage', [''])[0]
+        return [i for i, job in enumerate(self.corpus)
+                if (not job_type or job.get('job_type') == job_type)
+                and (not site_type or job.get('site_type') == site_type)
+                and job.get('distance', 0) <= radius
+                and (not fromage or job.get('age', 0) <= int(fromage))]
+
+    @property
+    def url(self):
+        return "http://{0}:{1}/ads/apisearch".format(*self.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,72 @@
+"""Synthetic Indeed API feeds used by benchmarks and tests.
+Every generated result has a unique job key so the feeds can also be used
+to check deduplication.
+"""
+import json
+from xml.sax.saxutils import escape
+
+
+def make_results(count, start=0, ids=None):
+    """
+    Build list of result dicts in the shape of Indeed JSON response
+    :count - number of results
+    :start - offset of the first result, used to make unique job keys
+    :ids - numbers of job keys of the results, range from start if omitted
+    """
+    results = []
+    for i in (range(start, start + count) if ids is None else ids):
+        results.append({
+            'jobtitle': "Python Developer {0}".format(i),
+            'company': "Company {0}".format(i % 97),
+            'city': "Seattle",
+            'state': "WA",
+            'country': "US",
+            'source': "Indeed",
+            'date': "Mon, 01 Apr 2019 10:00:00 GMT",
+            'snippet': "Looking for <b>Python</b> developer number {0}".format(i),
+            'url': "http://www.indeed.com/viewjob?jk={0:016x}&qd=abc&indpubnum=1".format(i),
+            'expired': False,
+            'formattedRelativeTime': "1 day ago",
+        })
+    return results
+
+
+def make_json_feed(count, start=0, total=None, ids=None):
+    """
+    Build JSON body of apisearch response
+    """
+    return json.dumps({
+        'version': 2,
+        'totalResults': count if total is None else total,
+        'start': start + 1,
+        'end': start + count,
+        'results': make_results(count, start, ids),
+    }).encode("utf-8")
+
+
+def make_xml_feed(count, start=0, total=None, ids=None):
+    """
+    Build XML body of apisearch response
+    """
+    rows = []
+    for r in make_results(count, start, ids):
+        fields = "".join("<{0}>{1}</{0}>".format(k, escape(str(v).lower() if k == 'expired' else str(v)))
+                         for k, v in r.items())
+        rows.append("<result>{0}</result>".format(fields))
+    return ("<?xml version='1.0' encoding='UTF-8'?>"
+            "<response version=\"2\">"
+            "<query>python</query><location>98101</location>"
+            "<totalresults>{total}</totalresults>"
+            "<start>{start}</start><end>{end}</end>"
+            "<results>{rows}</results>"
+            "</response>").format(total=count if total is None else total,
+                                  start=start + 1, end=start + count,
+                                  rows="".join(rows)).encode("utf-8")
+
+
+def make_jobs(count, start=0):
+    """
+    Build list of Element as parsed from a synthetic feed
+    """
+    from indeed import parse_json
+    return parse_json({'totalResults': count, 'results': make_results(count, start)})[1]
@@ -0,0 +1,106 @@
+"""Run all benchmarks and save results as JSON to compare commits.
+Run from the repository root:
+    python -m benchmarks.suite                      # writes benchmarks/results/<commit>.json
+    python -m benchmarks.suite --only parse crawl
+    python -m benchmarks.suite --compare benchmarks/results/<old>.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+from benchmarks import bench_parse, bench_json, bench_session, bench_memory, bench_stream, \
+    bench_dynamodb, bench_crawl, bench_startup, bench_rewrite, bench_compress
+
+BENCHMARKS = {
+    'parse': bench_parse.run,
+    'json': bench_json.run,
+    'session': bench_session.run,
+    'memory': bench_memory.run,
+    'stream': bench_stream.run,
+    'dynamodb': bench_dynamodb.run,
+    'crawl': bench_crawl.run,
+    'startup': bench_startup.run,
+    'rewrite': bench_rewrite.run,
+    'compress': bench_compress.run,
+}
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(names=None):
+    """
+    Run benchmarks by name, all of them if names are omitted
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        print("running %s" % name, file=sys.stderr)
+        # keep the report readable if a benchmark prints
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = BENCHMARKS[name]()
+    return {'commit': current_commit(),
+            'timestamp': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'results': results}
+
+
+def _numbers(value, prefix=""):
+    """
+    Flatten nested results into {path: number}
+    """
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+    flat = {}
+    for key, item in items:
+        flat.update(_numbers(item, "{0}.{1}".format(prefix, key) if prefix else str(key)))
+    return flat
+
+
+def compare(old, new):
+    """
+    Lines with ratio new / old of every number present in both runs
+    """
+    old_numbers, new_numbers = _numbers(old['results']), _numbers(new['results'])
+    lines = []
+    for path in sorted(set(old_numbers) & set(new_numbers)):
+        before, after = old_numbers[path], new_numbers[path]
+        ratio = after / before if before else float("inf")
+        lines.append("{0:<60} {1:>14.4g} {2:>14.4g} {3:>8.2f}x".format(path, before, after, ratio))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    parser.add_argument("--output", help="JSON file, benchmarks/results/<commit>.json by default")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    args = parser.parse_args()
+    report = run(args.only)
+    output = args.output or os.path.join(RESULTS_DIR, report['commit'] + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("results saved to %s" % output)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), report):
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
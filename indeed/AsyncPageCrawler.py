@@ -0,0 +1,53 @@
+"""Asyncio version of PageCrawler
+All pages of a query are requested at once as soon as the first page
+tells the total count of results. Many crawlers can share one AsyncIndeed
+client, so its concurrency and rate limit apply to all of them.
+"""
+import asyncio
+import logging
+from indeed import construct_query
+from indeed.aio import AsyncIndeed
+from indeed.PageCrawler import page_offsets
+from indeed.ratelimit import get_limiter
+from indeed.utils import *
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPageCrawler:
+    crawler_limit = 1000  # indeed doesn't return jobs more than #1000
+    sort = "date"
+
+    def __init__(self, publisher_id, job_title, location=98101, fromage=3, limit=25, filter_dups=1, client=None, rate_limiter=None):
+        """
+        :client - AsyncIndeed shared between crawlers, a private client
+                  is created and closed by crawl if omitted
+        :rate_limiter - TokenBucket of the private client, the limiter of
+                        publisher_id from indeed.ratelimit.get_limiter if
+                        omitted. A shared client keeps its own limiter.
+        """
+        self.publisher_id = publisher_id
+        self.job_title = job_title
+        self.location = location
+        self.fromage = fromage
+        self.limit = limit
+        self.filter_dups = filter_dups
+        self.client = client
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_limiter(publisher_id)
+        self.results = []
+
+    async def crawl(self):
+        if self.client is None:
+            async with AsyncIndeed(self.publisher_id, rate_limiter=self.rate_limiter) as indeed:
+                return await self._crawl(indeed)
+        return await self._crawl(self.client)
+
+    async def _crawl(self, indeed):
+        query = construct_query(all_words=self.job_title)
+        total_results, results = await indeed.search_jobs(query=query, sort=self.sort, location=self.location, fromage=self.fromage, filter_dups=self.filter_dups, userip=getRandomIP(), useragent=getRandomUserAgent())
+        logger.info("total jobs found: %s", total_results)
+        pages = await asyncio.gather(*[
+            indeed.search_jobs(query=query, sort=self.sort, location=self.location, fromage=self.fromage, start=start, limit=self.limit, filter_dups=self.filter_dups)
+            for start in page_offsets(total_results, self.limit, self.crawler_limit)])
+        self.results = results + [job for _, page in pages for job in page]
+        return self.results
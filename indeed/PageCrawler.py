@@ -2,10 +2,26 @@
 It will run a first query and get a total count of results available and then get all data by running
 queries with a starting position increased each time until is saved.
 """
-from indeed import Indeed, construct_query
-import math, time
+from indeed import Indeed, construct_query, make_session
+from indeed.ratelimit import get_limiter
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
 from indeed.utils import *
 
+logger = logging.getLogger(__name__)
+
+
+def page_offsets(total_results, limit=25, crawler_limit=1000):
+    """
+    Start positions of pages following the first page of 25 results
+    Offsets past crawler_limit are not returned, indeed doesn't serve them.
+    """
+    if total_results <= 25:
+        return []
+    pages_left = math.ceil((total_results - 25) / limit)
+    return [x * limit for x in range(1, pages_left + 1) if x * limit <= crawler_limit]
+
 
 class PageCrawler:
     crawler_limit = 1000  # indeed doesn't return jobs more than #1000
@@ -17,44 +33,136 @@ class PageCrawler:
     sort = "date"
     fromage = 3  # days back by default
     filter_dups = 1
-    results = []
+    results = None
+    session = None
+    rate_limiter = None
+    workers = 1
+    cache = None
+    radius = 25  # miles around location
+    state = None
+    query = None
+    total_results = 0
+    newest = None
 
-    def __init__(self, publisher_id, job_title, location=98101, fromage=3, limit=25, filter_dups=1):
+    def __init__(self, publisher_id, job_title, location=98101, fromage=3, limit=25, filter_dups=1, session=None, rate_limiter=None, workers=1, cache=None, radius=25, state=None, query=None):
+        """
+        :session - requests.Session shared between crawlers to reuse
+                   connections to the API, see indeed.make_session
+        :rate_limiter - TokenBucket paced requests, the limiter of
+                        publisher_id from indeed.ratelimit.get_limiter if omitted
+        :workers - number of pages fetched at once after the first page,
+                   pages are still merged in start order
+        :cache - response cache from indeed.cache shared between crawlers
+        :state - HighWaterMarks from indeed.state for incremental crawls:
+                 paging stops at the first job seen by the previous crawl
+                 of the same job_title and location, only new jobs are
+                 returned. Pages are fetched one by one in this mode.
+                 The new mark is kept until commit_mark is called.
+        :query - API query, all words of job_title if omitted
+        """
         self.publisher_id = publisher_id
+        self.workers = workers
+        self.cache = cache
+        self.radius = radius
+        self.state = state
+        self.query = query
+        self.session = session if session is not None else make_session(pool_size=max(10, workers))
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_limiter(publisher_id)
         self.location = location
         self.job_title = job_title
         self.fromage = fromage
         self.limit = limit
         self.filter_dups = filter_dups
-
+        self.results = []
 
     def crawl(self):
-        indeed = Indeed(self.publisher_id)
-        query = construct_query(all_words=self.job_title)
-        indeed.search_jobs(query=query, sort=self.sort, location=self.location, fromage=self.fromage, filter_dups=self.filter_dups, userip=getRandomIP(), useragent=getRandomUserAgent())
-        print("total jobs found: " + indeed.totalResults.__str__())
-        #for job in indeed.results:
-        #    print(job.title)
-        if indeed.totalResults<=25:
-            pages_left = 0
-        else:
-            pages_left = math.ceil((indeed.totalResults-25)/self.limit)
+        """
+        Crawl all pages and append jobs to self.results
+        """
+        self.results.extend(self.iter_results())
 
-        print("pages left: " + pages_left.__str__())
-        self.results = self.results + indeed.results
+    def iter_results(self, pages=False):
+        """
+        Yield jobs as pages arrive, without keeping them in memory
+        :pages - yield list of jobs per page instead of single jobs
+        """
+        if self.state is not None and self.sort == "date":
+            yield from self._iter_incremental(pages)
+            return
+        indeed = Indeed(self.publisher_id, session=self.session, rate_limiter=self.rate_limiter, cache=self.cache)
+        query = self.query or construct_query(all_words=self.job_title)
+        indeed.search_jobs(query=query, sort=self.sort, location=self.location, radius=self.radius, fromage=self.fromage, filter_dups=self.filter_dups, userip=getRandomIP(), useragent=getRandomUserAgent())
+        self.total_results = indeed.totalResults
+        logger.info("total jobs found: %s", indeed.totalResults)
+        offsets = page_offsets(indeed.totalResults, self.limit, self.crawler_limit)
+        logger.info("pages left: %s", len(offsets))
+        yield from self._emit(indeed.results, pages)
         # generate request for each page
-        for x in range(1, pages_left+1):
-            # delay between each request
-            time.sleep(getRandomSleepTime(3, 10)) # here we don't want to spam API.
-            job_seq_number = x*self.limit
+        # requests are paced by the rate limiter, here we don't want to spam API.
+        if self.workers > 1 and len(offsets) > 1:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            try:
+                for x, page in enumerate(executor.map(lambda start: self.fetch_page(query, start), offsets), 1):
+                    logger.debug("page: %s", x)
+                    yield from self._emit(page, pages)
+            finally:
+                # pages not consumed yet are not fetched if caller stops early
+                executor.shutdown(wait=True, cancel_futures=True)
+            return
+        for x, job_seq_number in enumerate(offsets, 1):
+            indeed.search_jobs(query=query, sort=self.sort, location=self.location, radius=self.radius, fromage=self.fromage, start=job_seq_number, limit=self.limit, filter_dups=self.filter_dups)
+            logger.debug("page: %s", x)
+            yield from self._emit(indeed.results, pages)
 
-            # stop sending requests if we reached limit per query request
-            if job_seq_number>self.crawler_limit:
-                return
+    def _iter_incremental(self, pages):
+        mark = self.state.get(self.job_title, self.location)
+        indeed = Indeed(self.publisher_id, session=self.session, rate_limiter=self.rate_limiter, cache=self.cache)
+        query = self.query or construct_query(all_words=self.job_title)
+        indeed.search_jobs(query=query, sort=self.sort, location=self.location, radius=self.radius, fromage=self.fromage, filter_dups=self.filter_dups, userip=getRandomIP(), useragent=getRandomUserAgent())
+        self.total_results = indeed.totalResults
+        logger.info("total jobs found: %s", indeed.totalResults)
+        newest = indeed.results[0] if len(indeed.results) else None
+        offsets = iter(page_offsets(indeed.totalResults, self.limit, self.crawler_limit))
+        x = 0
+        while True:
+            fresh = []
+            for job in indeed.results:
+                if mark is not None and mark.reached(job):
+                    logger.info("reached jobs of previous crawl on page: %s", x)
+                    break
+                fresh.append(job)
+            if fresh:
+                yield from self._emit(fresh, pages)
+            job_seq_number = next(offsets, None)
+            if len(fresh) < len(indeed.results) or job_seq_number is None:
+                break
+            x += 1
+            indeed.search_jobs(query=query, sort=self.sort, location=self.location, radius=self.radius, fromage=self.fromage, start=job_seq_number, limit=self.limit, filter_dups=self.filter_dups)
+            logger.debug("page: %s", x)
+        # the mark moves only once the caller has stored the jobs
+        self.newest = newest
 
-            indeed.search_jobs(query=query, sort=self.sort, location=self.location, fromage=self.fromage, start=job_seq_number, limit=self.limit, filter_dups=self.filter_dups)
-            #append all results into one array
-            self.results = self.results + indeed.results
-            print("page: " + str(x))
+    def commit_mark(self):
+        """
+        Save the newest job of a finished incremental crawl as its mark
+        Call it once the jobs are stored: if storing fails, a repeated crawl
+        still returns them.
+        """
+        if self.state is not None and self.newest is not None:
+            self.state.set(self.job_title, self.location, self.newest)
+        self.newest = None
 
+    @staticmethod
+    def _emit(page, pages):
+        if pages:
+            yield page
+        else:
+            yield from page
 
+    def fetch_page(self, query, start):
+        """
+        Fetch one page with a client of its own, safe to call from threads
+        """
+        indeed = Indeed(self.publisher_id, session=self.session, rate_limiter=self.rate_limiter, cache=self.cache)
+        indeed.search_jobs(query=query, sort=self.sort, location=self.location, radius=self.radius, fromage=self.fromage, start=start, limit=self.limit, filter_dups=self.filter_dups)
+        return indeed.results
@@ -3,12 +3,63 @@
 # Python Indeed API
 # Main information here https://ads.indeed.com/jobroll/xmlfeed
 #
-import requests
-from lxml import etree
+import hashlib
+import json
+import logging
+import re
+from functools import lru_cache
+from array import array
+from io import BytesIO
+from itertools import starmap
+from operator import itemgetter
 from indeed.utils import *
+from indeed.cache import cache_key, CachedResponse
+from indeed import metrics
 import urllib.parse as urlparse
 
+# fastest installed JSON decoder, all of them accept bytes
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        json_loads = json.loads
 
+# responses retried by the session, 429 is returned when quota is exceeded
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# arguments of Element in order
+ELEMENT_FIELDS = ("title", "company", "city", "state", "country", "source",
+                  "date", "description", "url", "expired", "date_published")
+
+# fields hashed by Element.fingerprint; url carries tracking parameters,
+# expired is state and date_published drifts every day
+STABLE_FIELDS = ("title", "company", "city", "state", "country", "source",
+                 "date", "description")
+
+JOB_KEY = re.compile(r"[?&]jk=([^&#]*)")
+
+PUBLISHER_ID = re.compile(r"([?&]publisher=)[^&#]*")
+
+logger = logging.getLogger(__name__)
+
+# tags of <result> children in the order Element expects them
+XML_FIELDS = ("jobtitle", "company", "city", "state", "country", "source",
+              "date", "snippet", "url", "expired", "formattedRelativeTime")
+
+# keys of JSON results in the order Element expects them
+JSON_FIELDS = XML_FIELDS
+
+# picks the fields of a JSON result as a tuple of Element arguments
+_json_row = itemgetter(*JSON_FIELDS)
+
+# request parameters which are the same on every page of a search
+SEARCH_PARAMS = ("format", "callback", "q", "l", "sort", "radius", "st", "jt",
+                 "limit", "fromage", "highlight", "filter", "latlong", "co", "chnl")
+
+
+@lru_cache(maxsize=4096)
 def construct_query( all_words="", exact_phraze="",
                     at_least_one="", none="", title="",
                     company=""):
@@ -21,6 +72,7 @@ def construct_query( all_words="", exact_phraze="",
     :none - ignore vacancies with these words
     :title - look for this words in title
     :company - look for vacancies, posted by this company
+    Queries are cached, crawls of the same title don't rebuild them.
     """
     query = ""
     query += "+".join(filter(None, all_words.split(" ")))
@@ -35,7 +87,7 @@ def construct_query( all_words="", exact_phraze="",
     if none:
         temp = list(filter(None, none.split(" ")))
         if len(temp) > 1:
-            query += "+-".format(temp)
+            query += "+-" + "+-".join(temp)
         else:
             query += "+-" + temp[0]
     if title:
@@ -45,10 +97,89 @@ def construct_query( all_words="", exact_phraze="",
     return query
 
 
+def extract_job_id(url):
+    """
+    Get job key from jk parameter of a vacancy URL
+    """
+    match = JOB_KEY.search(url)
+    if match is not None:
+        return urlparse.unquote_plus(match.group(1))
+    return (urlparse.parse_qs((urlparse.urlparse(url)).query))['jk'][0]
+
+
+def redact_url(url):
+    """
+    Hide publisher ID of a request URL before logging it
+    """
+    return PUBLISHER_ID.sub(r"\1***", url)
+
+
+def _row_appender(results):
+    """
+    Function adding a parsed result to a list of Element or ResultBatch
+    """
+    if isinstance(results, ResultBatch):
+        return results.append_row
+    return lambda *values: results.append(Element(*values))
+
+
+def parse_json(json_resp, results=None):
+    """
+    Build elements from decoded JSON response of Indeed API
+    Fields of all results are picked with one itemgetter and the page is
+    added to results in one call.
+    :json_resp - dict returned by json_loads
+    :results - list or ResultBatch to fill, new list if omitted
+    Returns tuple (totalResults, results)
+    """
+    results = [] if results is None else results
+    rows = map(_json_row, json_resp['results'])
+    if isinstance(results, ResultBatch):
+        results.extend_rows(rows)
+    else:
+        results.extend(starmap(Element, rows))
+    return json_resp['totalResults'], results
+
+
+def parse_xml(content, results=None):
+    """
+    Parse XML response of Indeed API in a single pass
+    Every <result> element is visited once and released right after
+    its Element is built, so parse time is linear in the page size.
+    :content - raw bytes of the response
+    :results - list or ResultBatch to fill, new list if omitted
+    Returns tuple (totalResults, results)
+    """
+    # imported here, JSON clients never load lxml
+    from lxml import etree
+    total_results = 0
+    results = [] if results is None else results
+    append = _row_appender(results)
+    for _, node in etree.iterparse(BytesIO(content), events=("end",),
+                                   tag=("totalresults", "result")):
+        if node.tag == "totalresults":
+            total_results = int(node.text or 0)
+            continue
+        fields = dict.fromkeys(XML_FIELDS)
+        for child in node:
+            if child.tag in fields:
+                fields[child.tag] = child.text
+        # a missing tag is a live job
+        fields["expired"] = fields["expired"] == 'true'
+        append(*[fields[tag] for tag in XML_FIELDS])
+        # drop parsed results to keep memory flat on large pages
+        node.clear()
+        while node.getprevious() is not None:
+            del node.getparent()[0]
+    return total_results, results
+
+
 class Element():
     """
     Every element of Indeed's response
     """
+    __slots__ = ELEMENT_FIELDS + ("_job_id",)
+
     def __init__(self, title, company, city, state,
                  country, source, date, description, url,
                  expired, date_published):
@@ -77,7 +208,28 @@ class Element():
         self.url = url
         self.expired = expired
         self.date_published = date_published
-        self.job_id = (urlparse.parse_qs((urlparse.urlparse(url)).query))['jk'][0]
+        self._job_id = None
+
+    @property
+    def job_id(self):
+        """
+        Job key from jk parameter of url, extracted on first access
+        """
+        if self._job_id is None:
+            self._job_id = extract_job_id(self.url)
+        return self._job_id
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in ELEMENT_FIELDS}
+
+    def fingerprint(self):
+        """
+        Hash of job id and stable fields, same for every crawl of an
+        unchanged vacancy
+        """
+        content = "\x1f".join("" if value is None else str(value) for value in
+                               [self.job_id] + [getattr(self, field) for field in STABLE_FIELDS])
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
 
     def __repr__(self):
         """
@@ -98,18 +250,140 @@ class Element():
         Location: {country}, {city}, {state}
         Expired: {expired}
         Link: {url}
-        """.format(**self.__dict__)
+        """.format(**self.as_dict())
         return row
 
     def getTitle(self):
         return self.title
 
 
+class ResultBatch():
+    """
+    Columnar container of Indeed's response
+    Fields of all results are kept in one list per field instead of one
+    Element per result. Iterating or indexing a batch gives Element
+    objects, so it can be used wherever a list of results is expected.
+    """
+    def __init__(self):
+        self.columns = {field: [] for field in ELEMENT_FIELDS}
+        self.columns['expired'] = array('b')
+
+    def append_row(self, *values):
+        """
+        Append one result, values are given in Element argument order
+        """
+        for column, value in zip(self._column_list(), values):
+            column.append(value)
+
+    def append(self, element):
+        self.append_row(*[getattr(element, field) for field in ELEMENT_FIELDS])
+
+    def extend(self, elements):
+        for element in elements:
+            self.append(element)
+
+    def extend_rows(self, rows):
+        """
+        Append many results, every row is given in Element argument order
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        for column, values in zip(self._column_list(), zip(*rows)):
+            column.extend(values)
+
+    def _column_list(self):
+        return [self.columns[field] for field in ELEMENT_FIELDS]
+
+    def column(self, field):
+        return self.columns[field]
+
+    def job_ids(self):
+        return [extract_job_id(url) for url in self.columns['url']]
+
+    def __len__(self):
+        return len(self.columns['url'])
+
+    def __getitem__(self, i):
+        row = [column[i] for column in self._column_list()]
+        row[ELEMENT_FIELDS.index('expired')] = bool(row[ELEMENT_FIELDS.index('expired')])
+        return Element(*row)
+
+    def __iter__(self):
+        columns = self._column_list()
+        expired = ELEMENT_FIELDS.index('expired')
+        for row in zip(*columns):
+            row = list(row)
+            row[expired] = bool(row[expired])
+            yield Element(*row)
+
+
+class RequestBuilder():
+    """
+    Builds search URLs of one client
+    Base URL, publisher and version are encoded once. The other parameters
+    of a search are validated and encoded once per distinct search and
+    cached, so the URL of the next page only encodes start, userip and
+    useragent. Values are percent-encoded, '+' is kept in q where it
+    separates words.
+    """
+    def __init__(self, base_url, publisher, version=2, normalize=None, maxsize=1024):
+        """
+        :normalize - function turning arguments of search_part into values
+                     of SEARCH_PARAMS, arguments are used as they are if omitted
+        :maxsize - number of encoded searches kept
+        """
+        self.prefix = "{0}?{1}".format(base_url, urlparse.urlencode((("publisher", publisher),
+                                                                     ("v", version))))
+        self.normalize = normalize
+        self.search_part = lru_cache(maxsize=maxsize)(self._encode_search)
+
+    def _encode_search(self, *params):
+        values = self.normalize(*params) if self.normalize is not None else params
+        return urlparse.urlencode(tuple(zip(SEARCH_PARAMS, values)), safe="+",
+                                  quote_via=urlparse.quote)
+
+    def url(self, search, start=0, userip="", useragent=""):
+        """
+        URL of one page
+        :search - tuple of search_part arguments
+        """
+        return "{0}&{1}&start={2}&userip={3}&useragent={4}".format(
+            self.prefix, self.search_part(*search), urlparse.quote(str(start)),
+            urlparse.quote(str(userip)), urlparse.quote_plus(useragent))
+
+
+def make_session(pool_size=10, max_retries=3, backoff_factor=0.5):
+    """
+    Create HTTP session with keep-alive connection pool
+    One session can be shared by many Indeed clients and threads,
+    connections to the API host are reused between pages.
+    :pool_size - number of connections kept open per host
+    :max_retries - retries of a failed request, 0 disables retries
+    :backoff_factor - sleep between retries is
+                      backoff_factor * (2 ** (retry number - 1)) seconds
+    """
+    # requests is imported by the first session, not by import indeed
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUSES, allowed_methods=("GET",),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 class Indeed():
     """
     Indeed client
     """
     TIMEOUT = 5
+    API_URL = "http://api.indeed.com/ads/apisearch"
     FORMAT_RESULTS = ("xml", "json")
     SORT = ("relevance", "date")
     SITE_TYPE = ("jobsite", "employer")
@@ -169,7 +443,8 @@ class Indeed():
                  "United Kingdom": "gb",
                  "Venezuela": "ve"}
 
-    def __init__(self, publisher, version=2):
+    def __init__(self, publisher, version=2, session=None, timeout=TIMEOUT,
+                 base_url=None, rate_limiter=None, columnar=False, cache=None):
         """
         Initialize Indeed with publisher ID and version of API
         :publisher - Publisher ID.
@@ -184,32 +459,31 @@ class Indeed():
         :version - Version. Which version of the API you wish to use.
                    All publishers should be using version 2.
                    Currently available versions are 1 and 2.
+        :session - requests.Session to send requests with, see make_session.
+                   Pass the same session to many clients to share
+                   its connection pool. New session is created if omitted.
+        :timeout - Timeout of a single request in seconds.
+        :base_url - URL of apisearch endpoint, API_URL if omitted.
+        :rate_limiter - TokenBucket from indeed.ratelimit taken before
+                        every request, no limit if omitted.
+        :columnar - Store results of every page in a ResultBatch
+                    instead of a list of Element.
+        :cache - MemoryCache or SQLiteCache from indeed.cache. Responses
+                 are cached by URL without userip and useragent, a cached
+                 page is returned as CachedResponse without a request.
 
         """
         self.publisher = publisher
         self.version = version
+        self.session = session if session is not None else self.new_session()
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.columnar = columnar
+        self.cache = cache
         self.totalResults = 0
         self.format_results = "json"
-        self.url = "http://api.indeed.com/ads/apisearch?publisher={publisher}"\
-                   "&v={version}"\
-                   "&format={format_results}"\
-                   "&callback={callback}"\
-                   "&q={query}"\
-                   "&l={location}"\
-                   "&sort={sort}"\
-                   "&radius={radius}"\
-                   "&st={site_type}"\
-                   "&jt={job_type}"\
-                   "&start={start}"\
-                   "&limit={limit}"\
-                   "&fromage={fromage}"\
-                   "&highlight={highlight}"\
-                   "&filter={filter}"\
-                   "&latlong={latlong}"\
-                   "&co={country}"\
-                   "&chnl={chnl}"\
-                   "&userip={userip}"\
-                   "&useragent={useragent}"
+        self.request_builder = RequestBuilder(base_url or self.API_URL, publisher, version,
+                                              normalize=self.normalize_search)
         self.results = []
 
     def search_jobs(self, query, format_results="json", callback="",
@@ -322,6 +596,89 @@ class Indeed():
                      "User-Agent" HTTP request header from the end-user.
                      This field is required.
         """
+        url = self.build_url(query, format_results, callback, location, state,
+                             sort, radius, site_type, job_type, start, limit,
+                             fromage, highlight, filter_dups, latlong,
+                             country, chnl, userip, useragent)
+        if self.results:
+            self.results = []
+        logger.debug("search %s", redact_url(url))
+        key = cache_key(url) if self.cache is not None else None
+        content = self.cache.get(key) if key else None
+        if content is not None:
+            metrics.registry.incr("cache_hits")
+            response = CachedResponse(content)
+        else:
+            response = self.fetch(url)
+            if key and response.status_code == 200:
+                self.cache.set(key, response.content)
+        self.totalResults, self.results = self.parse_response(response.content,
+                                                              format_results)
+        return response
+
+    def fetch(self, url):
+        """
+        Send request through session, paced by rate limiter
+        """
+        registry = metrics.registry
+        if self.rate_limiter is not None:
+            registry.observe("ratelimit_wait", self.rate_limiter.acquire())
+        with registry.timer("http_request"):
+            response = self.session.get(url, timeout=self.timeout)
+        registry.incr("http_responses_{0}".format(response.status_code))
+        if self.rate_limiter is not None:
+            # statuses of requests retried by the session count too
+            for attempt in getattr(response.raw.retries, "history", ()):
+                if attempt.status is not None:
+                    self.rate_limiter.feedback(attempt.status)
+            self.rate_limiter.feedback(response.status_code)
+        return response
+
+    def iter_jobs(self, query, pages=False, max_start=1000, **kwargs):
+        """
+        Yield jobs of all pages of a search, page by page
+        Parameters are the same as in search_jobs, paging starts at start.
+        :pages - yield list of jobs per page instead of single jobs
+        :max_start - last start position served by API
+        """
+        start = kwargs.pop("start", 0)
+        limit = kwargs.setdefault("limit", 25)
+        while start <= max_start:
+            self.search_jobs(query, start=start, **kwargs)
+            if not self.results:
+                return
+            if pages:
+                yield self.results
+            else:
+                yield from self.results
+            start += limit
+            if start >= self.totalResults:
+                return
+
+    def build_url(self, query, format_results="json", callback="",
+                  location="", state="", sort="", radius=25, site_type="",
+                  job_type="", start=0, limit=25, fromage="",
+                  highlight=False, filter_dups=1,
+                  latlong="", country="", chnl="",
+                  userip="",
+                  useragent="Mozilla/5.0 " +
+                            "(Macintosh; Intel Mac OS X 10_8_2)"):
+        """
+        Build URL of a search request
+        Parameters are the same as in search_jobs
+        """
+        return self.request_builder.url((query, format_results, callback, location, state,
+                                         sort, radius, site_type, job_type, limit, fromage,
+                                         highlight, filter_dups, latlong, country, chnl),
+                                        start, userip, useragent)
+
+    def normalize_search(self, query, format_results, callback, location, state,
+                         sort, radius, site_type, job_type, limit, fromage,
+                         highlight, filter_dups, latlong, country, chnl):
+        """
+        Values of SEARCH_PARAMS for arguments of search_jobs
+        Unknown choices are replaced by API defaults.
+        """
         format_results = "xml" if format_results not in self.FORMAT_RESULTS\
             else format_results
         location = "{0}, {1}".format(location, state) if state else location
@@ -331,63 +688,35 @@ class Indeed():
         highlight = +highlight
         filter_dups = +filter_dups
         country = self.COUNTRIES.get(country, "us")
-        if self.results:
-            self.results = []
-        url = self.url.format(version=self.version, publisher=self.publisher,
-                              format_results=format_results,
-                              callback=callback, query=query,
-                              location=location, sort=sort,
-                              radius=radius,
-                              site_type=site_type, job_type=job_type,
-                              start=start, limit=limit, fromage=fromage,
-                              highlight=highlight,
-                              filter=filter_dups,
-                              latlong=latlong, country=country, chnl=chnl,
-                              userip=userip, useragent=useragent)
-        print(url)
-        response = requests.get(url, timeout=self.TIMEOUT)
-        if format_results == "json":
-            json_resp = response.json()['results']
-            self.totalResults = response.json()['totalResults']
-            #print(response.json())
-            for i in json_resp:
-                title = i['jobtitle']
-                company = i['company']
-                city = i['city']
-                state = i['state']
-                country = i['country']
-                source = i['source']
-                date = i['date']
-                description = i['snippet']
-                url = i['url']
-                expired = i['expired']
-                date_published = i['formattedRelativeTime']
-                self.results.append(Element(title, company, city, state,
-                                            country, source, date,
-                                            description, url, expired,
-                                            date_published))
-        else:
-            xml_resp = etree.fromstring(response.content)
-            count_of_results = len(xml_resp.findall(".//date"))
-            for i in range(count_of_results):
-                title = xml_resp.findall(".//jobtitle")[i].text
-                company = xml_resp.findall(".//company")[i].text
-                city = xml_resp.findall(".//city")[i].text
-                state = xml_resp.findall(".//state")[i].text
-                country = xml_resp.findall(".//country")[i].text
-                source = xml_resp.findall(".//source")[i].text
-                date = xml_resp.findall(".//date")[i].text
-                description = xml_resp.findall(".//snippet")[i].text
-                url = xml_resp.findall(".//url")[i].text
-                expired = False if xml_resp.findall(".//expired")[i].text == 'false' else\
-                    True
-                date_published = xml_resp.findall(".//formattedRelativeTime")[i].text
-
-                self.results.append(Element(title, company, city, state, country,
-                                            source, date, description, url, expired,
-                                            date_published))
-        return response
+        return (format_results, callback, query, location, sort, radius,
+                site_type, job_type, limit, fromage, highlight, filter_dups,
+                latlong, country, chnl)
 
+    def parse_response(self, content, format_results="json"):
+        """
+        Parse body of a search response
+        :content - raw bytes of the response
+        :format_results - format requested in build_url
+        Returns tuple (totalResults, list of Element or ResultBatch)
+        """
+        registry = metrics.registry
+        results = ResultBatch() if self.columnar else []
+        with registry.timer("parse"):
+            if format_results == "json":
+                with registry.timer("json_decode"):
+                    json_resp = json_loads(content)
+                with registry.timer("element_build"):
+                    parsed = parse_json(json_resp, results)
+            else:
+                parsed = parse_xml(content, results)
+        registry.incr("elements", len(parsed[1]))
+        return parsed
+
+    def new_session(self):
+        """
+        Create session for a client constructed without one
+        """
+        return make_session()
 
 def main():
     """
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Asyncio client for Indeed API, requires aiohttp
+#
+import asyncio
+import logging
+import time
+import aiohttp
+from indeed import Indeed, RETRY_STATUSES, redact_url
+from indeed import metrics
+from indeed.cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncIndeed(Indeed):
+    """
+    Indeed client for asyncio
+    One client can run many searches at once, the number of requests in
+    flight is bounded by concurrency and the rate by rate_limiter.
+    """
+    def __init__(self, publisher, version=2, session=None,
+                 timeout=Indeed.TIMEOUT, base_url=None,
+                 rate_limiter=None, concurrency=10, max_retries=3,
+                 backoff_factor=0.5, cache=None):
+        """
+        Initialize client, see Indeed for other parameters
+        :session - aiohttp.ClientSession, created on first request if omitted
+        :concurrency - maximum number of requests in flight
+        :max_retries - retries of a request answered with 429 or 5xx
+        :backoff_factor - sleep between retries is
+                          backoff_factor * (2 ** (retry number - 1)) seconds
+        """
+        Indeed.__init__(self, publisher, version, session, timeout, base_url,
+                        rate_limiter, cache=cache)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.semaphore = None
+
+    def new_session(self):
+        # aiohttp session has to be created inside a running event loop
+        return None
+
+    async def search_jobs(self, query, **kwargs):
+        """
+        Coroutine version of Indeed.search_jobs, takes the same parameters
+        Results are stored in self.results and self.totalResults like in
+        Indeed, but with many searches running at once on one client use
+        the returned tuple (totalResults, list of Element) instead.
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        url = self.build_url(query, **kwargs)
+        logger.debug("search %s", redact_url(url))
+        key = cache_key(url) if self.cache is not None else None
+        content = self.cache.get(key) if key else None
+        if content is not None:
+            metrics.registry.incr("cache_hits")
+        else:
+            content, status = await self.fetch(url)
+            if key and status == 200:
+                self.cache.set(key, content)
+        self.totalResults, self.results = self.parse_response(
+            content, kwargs.get("format_results", "json"))
+        return self.totalResults, self.results
+
+    async def fetch(self, url):
+        """
+        Get body and status of response, retrying on 429 and 5xx
+        """
+        registry = metrics.registry
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                registry.observe("ratelimit_wait", await self.rate_limiter.acquire_async())
+            async with self.semaphore:
+                started = time.perf_counter()
+                async with self.session.get(url) as response:
+                    registry.incr("http_responses_{0}".format(response.status))
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.feedback(response.status)
+                    if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                        content = await response.read()
+                        registry.observe("http_request", time.perf_counter() - started)
+                        return content, response.status
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
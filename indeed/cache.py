@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# Response cache for Indeed API
+#
+import sqlite3
+import threading
+import time
+import json
+from collections import OrderedDict
+import urllib.parse as urlparse
+
+# randomized per crawl, they don't change results
+IGNORED_PARAMS = ("userip", "useragent")
+
+
+def cache_key(url):
+    """
+    Normalized request URL: parameters sorted, userip and useragent dropped
+    """
+    parts = urlparse.urlsplit(url)
+    params = [(k, v) for k, v in urlparse.parse_qsl(parts.query, keep_blank_values=True)
+              if k not in IGNORED_PARAMS]
+    return "{0}://{1}{2}?{3}".format(parts.scheme, parts.netloc, parts.path,
+                                     urlparse.urlencode(sorted(params)))
+
+
+class CachedResponse():
+    """
+    Response served from cache, mimics the parts of requests.Response
+    used by callers of search_jobs
+    """
+    status_code = 200
+    from_cache = True
+
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class MemoryCache():
+    """
+    In-memory LRU cache of response bodies with time to live
+    """
+    def __init__(self, maxsize=1024, ttl=600):
+        """
+        :maxsize - number of responses kept
+        :ttl - seconds a response stays valid
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, content):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, content)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+
+class SQLiteCache():
+    """
+    Persistent cache of response bodies in a SQLite file
+    Shared by processes of a host, entries are evicted by TTL and, over
+    maxsize, least recently used first. Eviction runs every evict_every
+    sets of a process, between runs the table can exceed maxsize by that
+    many rows per process.
+    """
+    def __init__(self, path, maxsize=100000, ttl=3600, evict_every=None):
+        """
+        :path - database file, created if missing
+        :maxsize - number of responses kept
+        :ttl - seconds a response stays valid
+        :evict_every - sets between evictions, 1% of maxsize if omitted
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evict_every = evict_every or max(1, maxsize // 100)
+        self.sets = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                    "key TEXT PRIMARY KEY, content BLOB, "
+                                    "expires REAL, accessed REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed "
+                                    "ON responses (accessed)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_expires "
+                                    "ON responses (expires)")
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT content FROM responses "
+                                          "WHERE key = ? AND expires >= ?", (key, now)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.stats['hits'] += 1
+            return bytes(row[0])
+
+    def set(self, key, content):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                    (key, sqlite3.Binary(content), now + self.ttl, now))
+            self.sets += 1
+            if self.sets % self.evict_every == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        # counting rows scans the table, done once per evict_every sets
+        evicted = self.connection.execute("DELETE FROM responses WHERE expires < ?", (now,)).rowcount
+        count = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.maxsize:
+            evicted += self.connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY accessed LIMIT ?)", (count - self.maxsize,)).rowcount
+        self.stats['evictions'] += evicted
+
+    def close(self):
+        self.connection.close()
+
+
+def open_cache(backend="memory", path=None, size=None, ttl=600):
+    """
+    Create response cache from configuration
+    :backend - "memory" or "sqlite"
+    :path - database file of sqlite backend
+    :size - number of responses kept
+    :ttl - seconds a response stays valid
+    """
+    if backend == "sqlite":
+        return SQLiteCache(path, maxsize=size or 100000, ttl=ttl)
+    return MemoryCache(maxsize=size or 1024, ttl=ttl)
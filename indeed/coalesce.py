@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+#
+# Query coalescing: several job titles searched with one OR query
+# Rare titles return a handful of jobs per location, so a task per
+# (title, zip) mostly pays for requests which return one short page.
+# plan_packs groups titles whose learned yield fits under the crawler
+# limit together, PackCrawler searches a group with one query and assigns
+# the jobs back to the titles by the words of their job titles.
+#
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from itertools import chain
+from indeed import construct_query
+from indeed.PageCrawler import PageCrawler
+from indeed.utils import locked_file, write_atomic
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+")
+
+
+def title_words(text):
+    """
+    Set of lowercase words of a text
+    """
+    return frozenset(WORD.findall(text.lower())) if text else frozenset()
+
+
+def pack_query(titles):
+    """
+    Query matching jobs of any of the titles, all words of a title are required
+    construct_query's at_least_one splits multi-word titles into single
+    words, so every title becomes its own group joined with "or".
+    """
+    if len(titles) == 1:
+        return construct_query(all_words=titles[0])
+    return "(" + "+or+".join("({0})".format(construct_query(all_words=title))
+                             for title in titles) + ")"
+
+
+def match_titles(job, titles):
+    """
+    Titles whose words are all in the job title, or in its description if
+    none of them is in the title
+    """
+    words = title_words(job.title)
+    matched = [title for title in titles if title_words(title) <= words]
+    if not matched:
+        words = title_words(job.description)
+        matched = [title for title in titles if title_words(title) <= words]
+    return matched
+
+
+def assign_titles(jobs, titles):
+    """
+    Yield tuple (matched titles, job) for every job of a packed query,
+    matched titles are empty if the job matches none of them
+    """
+    for job in jobs:
+        yield tuple(match_titles(job, titles)), job
+
+
+def demultiplex(jobs, titles):
+    """
+    Jobs of a packed query by title, a job matching several titles is
+    listed under each of them, jobs matching none under None
+    """
+    by_title = OrderedDict((title, []) for title in titles)
+    by_title[None] = []
+    for matched, job in assign_titles(jobs, titles):
+        for title in matched or (None,):
+            by_title[title].append(job)
+    return by_title
+
+
+class YieldStats():
+    """
+    Learned number of results per location of every title
+    Estimates are exponentially weighted means of observed totals, kept
+    in a JSON file shared by the crawler which observes them and the
+    kicker which plans with them.
+    """
+    def __init__(self, alpha=0.3):
+        """
+        :alpha - weight of the newest observation
+        """
+        self.alpha = alpha
+        self.estimates = {}
+        self.observed = set()
+        self.lock = threading.Lock()
+
+    def observe(self, title, results):
+        with self.lock:
+            previous = self.estimates.get(title)
+            if previous is None:
+                self.estimates[title] = float(results)
+            else:
+                self.estimates[title] = previous + self.alpha * (results - previous)
+            self.observed.add(title)
+
+    def estimate(self, title):
+        """
+        Expected results of title per location, None if never observed
+        """
+        with self.lock:
+            return self.estimates.get(title)
+
+    def save(self, path):
+        """
+        Write estimates, titles observed by other processes are kept
+        The file is merged under a lock, so crawler processes sharing it
+        don't drop each other's titles.
+        """
+        with self.lock:
+            own = {title: self.estimates[title] for title in self.observed}
+        with locked_file(path):
+            estimates = self.load(path, self.alpha).estimates
+            estimates.update(own)
+            write_atomic(path, json.dumps(estimates).encode("utf-8"))
+
+    @classmethod
+    def load(cls, path, alpha=0.3):
+        """
+        Read estimates written by save, nothing is known if file is missing
+        """
+        stats = cls(alpha)
+        if path and os.path.exists(path):
+            with open(path) as f:
+                stats.estimates = {title: float(value) for title, value in json.load(f).items()}
+        return stats
+
+
+def plan_packs(titles, yields, crawler_limit=1000, headroom=0.5, max_titles=10):
+    """
+    Group titles into packs searched with one query
+    Titles are placed largest first into the first pack with room, a pack
+    holds up to crawler_limit * headroom expected results and max_titles
+    titles. Titles never observed or too large are searched alone.
+    Returns list of lists of titles
+    """
+    capacity = crawler_limit * headroom
+    packs, sizes = [], []
+    known = []
+    for title in titles:
+        estimate = yields.estimate(title) if yields is not None else None
+        if estimate is None or estimate > capacity:
+            packs.append([title])
+            sizes.append(capacity)
+        else:
+            known.append((estimate, title))
+    for estimate, title in sorted(known, key=lambda e: -e[0]):
+        for i, pack in enumerate(packs):
+            if len(pack) < max_titles and sizes[i] + estimate <= capacity:
+                pack.append(title)
+                sizes[i] += estimate
+                break
+        else:
+            packs.append([title])
+            sizes.append(estimate)
+    return packs
+
+
+class PackCrawler:
+    """
+    Crawl several titles of one location with one query
+    If the packed query finds more than crawler_limit jobs, the titles
+    are crawled one by one instead, so no job is lost to the limit.
+    iter_assigned tells the titles of every job, jobs assigned to a title
+    are counted in by_title and learned by yields.
+    """
+    def __init__(self, publisher_id, titles, location=98101, yields=None, **kwargs):
+        """
+        :titles - job titles of the pack
+        :yields - YieldStats updated with the results of every title
+        Other parameters are passed to PageCrawler
+        """
+        self.publisher_id = publisher_id
+        self.titles = list(titles)
+        self.location = location
+        self.yields = yields
+        self.kwargs = kwargs
+        self.by_title = OrderedDict((title, 0) for title in self.titles)
+        self.unmatched = 0
+        self.crawlers = []
+
+    def crawler(self, titles):
+        crawler = PageCrawler(self.publisher_id, " or ".join(titles), location=self.location,
+                              query=pack_query(titles), **self.kwargs)
+        self.crawlers.append(crawler)
+        return crawler
+
+    def commit_mark(self):
+        """
+        Save marks of incremental crawls, see PageCrawler.commit_mark
+        """
+        for crawler in self.crawlers:
+            crawler.commit_mark()
+
+    def iter_results(self, pages=False):
+        """
+        Yield jobs of all titles as pages arrive
+        :pages - yield list of jobs per page instead of single jobs
+        """
+        for page in self._iter_pages():
+            yield from PageCrawler._emit([job for _, job in page], pages)
+
+    def iter_assigned(self):
+        """
+        Yield tuple (titles, job) for every job as pages arrive
+        titles are the titles of the pack the job was assigned to, empty
+        if it matches none of them by words.
+        """
+        for page in self._iter_pages():
+            yield from page
+
+    def _iter_pages(self):
+        if len(self.titles) > 1:
+            crawler = self.crawler(self.titles)
+            results = crawler.iter_results(pages=True)
+            first = next(results, [])
+            if crawler.total_results <= crawler.crawler_limit:
+                for page in chain([first], results):
+                    page = list(assign_titles(page, self.titles))
+                    for matched, _ in page:
+                        for title in matched:
+                            self.by_title[title] += 1
+                        self.unmatched += not matched
+                    yield page
+                self._learn()
+                return
+            results.close()
+            logger.info("pack of %s titles found %s jobs, crawling titles one by one",
+                        len(self.titles), crawler.total_results)
+        for title in self.titles:
+            crawler = self.crawler([title])
+            # jobs of a search by one title belong to it
+            for page in crawler.iter_results(pages=True):
+                self.by_title[title] += len(page)
+                yield [((title,), job) for job in page]
+            if self.yields is not None:
+                # planning needs the size of the search, not just the crawled part
+                self.yields.observe(title, crawler.total_results)
+
+    def _learn(self):
+        if self.yields is None:
+            return
+        # jobs matched by description words only are shared by all titles
+        share = self.unmatched / len(self.titles)
+        for title, count in self.by_title.items():
+            self.yields.observe(title, count + share)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# Geographic planning of search tasks
+# Neighboring zip codes searched with the same radius return mostly the same
+# jobs. plan_centers picks a small set of zips so that every zip of the
+# dictionary is within cover_radius of one of them. Searching around those
+# centers with radius + cover_radius still reaches every job the original
+# per-zip searches with radius would reach, as long as the wider searches
+# stay under the crawler limit. plan_report estimates both.
+#
+import heapq
+import math
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 69.0
+COORDINATE_KEYS = (("latitude", "longitude"), ("lat", "lng"), ("lat", "lon"), ("lat", "long"))
+
+
+def distance_miles(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance between two points in miles
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def zip_coordinates(entry):
+    """
+    (latitude, longitude) of a zip dictionary entry, None if it has none
+    """
+    for lat_key, lon_key in COORDINATE_KEYS:
+        if entry.get(lat_key) not in (None, "") and entry.get(lon_key) not in (None, ""):
+            return float(entry[lat_key]), float(entry[lon_key])
+    return None
+
+
+class GridIndex():
+    """
+    Spatial index of points on a grid of square cells
+    """
+    def __init__(self, points, cell_miles):
+        """
+        :points - list of (latitude, longitude)
+        :cell_miles - side of a cell, use the typical query radius
+        """
+        self.points = points
+        self.cell = cell_miles / MILES_PER_DEGREE
+        self.cells = {}
+        for i, (lat, lon) in enumerate(points):
+            self.cells.setdefault(self._cell(lat, lon), []).append(i)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def near(self, lat, lon, radius):
+        """
+        Indexes of points within radius miles of (lat, lon)
+        """
+        lat_cells = int(math.ceil(radius / MILES_PER_DEGREE / self.cell))
+        # a degree of longitude gets shorter towards the poles
+        cos_lat = max(0.01, math.cos(math.radians(min(89.0, abs(lat) + radius / MILES_PER_DEGREE))))
+        lon_cells = int(math.ceil(radius / (MILES_PER_DEGREE * cos_lat) / self.cell))
+        row, col = self._cell(lat, lon)
+        found = []
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(col - lon_cells, col + lon_cells + 1):
+                for i in self.cells.get((r, c), ()):
+                    if distance_miles(lat, lon, *self.points[i]) <= radius:
+                        found.append(i)
+        return found
+
+
+def plan_centers(zip_codes, cover_radius=25):
+    """
+    Pick zips to search around so every zip is within cover_radius of one
+    Greedy set cover: the zip covering most uncovered zips is taken first.
+    Zips without coordinates are always kept.
+    :zip_codes - list of zip dictionary entries with latitude and longitude
+    Returns list of chosen entries in the order of zip_codes
+    """
+    located = [(i, zip_coordinates(entry)) for i, entry in enumerate(zip_codes)]
+    chosen = set(i for i, point in located if point is None)
+    located = [(i, point) for i, point in located if point is not None]
+    if located:
+        points = [point for _, point in located]
+        index = GridIndex(points, cover_radius)
+        covers = [set(index.near(lat, lon, cover_radius)) for lat, lon in points]
+        uncovered = set(range(len(points)))
+        # heap of (-number of uncovered zips covered, point), counts are refreshed lazily
+        heap = [(-len(c), i) for i, c in enumerate(covers)]
+        heapq.heapify(heap)
+        while uncovered:
+            count, i = heapq.heappop(heap)
+            gain = len(covers[i] & uncovered)
+            if gain < -count:
+                heapq.heappush(heap, (-gain, i))
+                continue
+            chosen.add(located[i][0])
+            uncovered -= covers[i]
+    return [zip_codes[i] for i in sorted(chosen)]
+
+
+def task_calls(results, limit=25, crawler_limit=1000):
+    """
+    API calls of a task expecting results jobs: its first page and the
+    pages after it up to the crawler limit
+    """
+    # count of indeed.PageCrawler.page_offsets, without importing the crawler
+    if results <= 25:
+        return 1
+    return 1 + min(int(math.ceil((results - 25) / limit)), crawler_limit // limit)
+
+
+def plan_report(zip_codes, centers, titles=1, radius=25, cover_radius=25,
+                jobs_per_task=100, limit=25, crawler_limit=1000):
+    """
+    Estimated API calls of searching around centers only
+    Jobs are taken as spread evenly, so a search with radius +
+    cover_radius finds ((radius + cover_radius) / radius) ** 2 times the
+    jobs of one with radius. Wider searches need more pages each and the
+    jobs past crawler_limit are never returned, so fewer tasks don't
+    always mean fewer calls.
+    :jobs_per_task - expected jobs of a search with radius around a zip,
+                     one number or a list with one number per title
+    """
+    if isinstance(jobs_per_task, (int, float)):
+        jobs_per_task = [jobs_per_task] * titles
+    scale = ((radius + cover_radius) / radius) ** 2
+    tasks_before = len(zip_codes) * titles
+    tasks_after = len(centers) * titles
+    calls_before = len(zip_codes) * sum(task_calls(jobs, limit, crawler_limit) for jobs in jobs_per_task)
+    calls_after = len(centers) * sum(task_calls(jobs * scale, limit, crawler_limit) for jobs in jobs_per_task)
+    # jobs a search can return: the first page and the pages up to the limit
+    reachable = crawler_limit + limit
+    truncated = sum(jobs * scale > reachable for jobs in jobs_per_task)
+    lost = len(centers) * sum(max(0.0, jobs * scale - reachable) for jobs in jobs_per_task)
+    return {'zip_codes': len(zip_codes), 'centers': len(centers),
+            'radius': radius, 'search_radius': radius + cover_radius,
+            'tasks_before': tasks_before, 'tasks_after': tasks_after,
+            'saved_tasks': tasks_before - tasks_after,
+            'saved_share': (tasks_before - tasks_after) / tasks_before if tasks_before else 0.0,
+            'calls_before': calls_before, 'calls_after': calls_after,
+            'saved_calls': calls_before - calls_after,
+            'saved_calls_share': (calls_before - calls_after) / calls_before if calls_before else 0.0,
+            'truncated_titles': truncated,
+            'jobs_past_limit': int(lost)}
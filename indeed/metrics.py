@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# Counters and timers of the crawl pipeline
+# Instrumented code calls metrics.registry, which is a no-op until
+# enable() is called, so the hot path pays one method call at most.
+#
+#   from indeed import metrics
+#   metrics.enable()
+#   with metrics.registry.timer("http_request"):
+#       ...
+#   print(metrics.registry.to_prometheus())
+#
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from indeed.utils import write_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class _Timer():
+    __slots__ = ("registry", "name", "started")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started)
+
+
+class Registry():
+    """
+    Thread-safe counters and timers
+    Timers keep count, total and maximum of observed seconds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def timer(self, name):
+        """
+        Context manager observing seconds spent in its block
+        """
+        return _Timer(self, name)
+
+    def snapshot(self):
+        with self.lock:
+            return {'timestamp': time.time(),
+                    'counters': dict(self.counters),
+                    'timers': {name: {'count': t[0], 'seconds': t[1], 'max_seconds': t[2]}
+                               for name, t in self.timers.items()}}
+
+    def to_prometheus(self, prefix="indeed_"):
+        """
+        Metrics in Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append("# TYPE {0}{1}_total counter".format(prefix, name))
+            lines.append("{0}{1}_total {2}".format(prefix, name, value))
+        for name, timer in sorted(snapshot['timers'].items()):
+            lines.append("# TYPE {0}{1}_seconds summary".format(prefix, name))
+            lines.append("{0}{1}_seconds_count {2}".format(prefix, name, timer['count']))
+            lines.append("{0}{1}_seconds_sum {2}".format(prefix, name, timer['seconds']))
+            lines.append("# TYPE {0}{1}_seconds_max gauge".format(prefix, name))
+            lines.append("{0}{1}_seconds_max {2}".format(prefix, name, timer['max_seconds']))
+        return "\n".join(lines) + "\n"
+
+
+class NoopRegistry():
+    """
+    Registry which records nothing
+    """
+    _null_timer = nullcontext()
+
+    def incr(self, name, amount=1):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def timer(self, name):
+        return self._null_timer
+
+    def snapshot(self):
+        return {'timestamp': time.time(), 'counters': {}, 'timers': {}}
+
+    def to_prometheus(self, prefix="indeed_"):
+        return ""
+
+
+registry = NoopRegistry()
+
+
+def enable():
+    """
+    Start recording metrics of this process, returns the registry
+    """
+    global registry
+    if isinstance(registry, NoopRegistry):
+        registry = Registry()
+    return registry
+
+
+def disable():
+    global registry
+    registry = NoopRegistry()
+
+
+def start_reporter(interval=60, json_path=None, prometheus_path=None, log=True):
+    """
+    Write snapshots of the registry every interval seconds from a daemon thread
+    :json_path - file with the latest JSON snapshot
+    :prometheus_path - file in Prometheus text format, e.g. for the
+                       node_exporter textfile collector
+    :log - also log every snapshot at INFO level
+    Paths may contain {pid} to keep files of worker processes apart.
+    Returns event which stops the reporter when set
+    """
+    stop = threading.Event()
+    pid = os.getpid()
+
+    def report():
+        while not stop.wait(interval):
+            snapshot = registry.snapshot()
+            if log:
+                logger.info("metrics: %s", json.dumps(snapshot))
+            if json_path:
+                write_atomic(json_path.format(pid=pid), json.dumps(snapshot).encode("utf-8"))
+            if prometheus_path:
+                write_atomic(prometheus_path.format(pid=pid), registry.to_prometheus().encode("utf-8"))
+
+    threading.Thread(target=report, name="metrics-reporter", daemon=True).start()
+    return stop
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Token bucket rate limiter for Indeed API requests
+#
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+
+# statuses telling that the API wants us to slow down
+SLOWDOWN_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket():
+    """
+    Token bucket shared by threads and coroutines of one process
+    Every request takes a token, tokens are refilled at rate per second up
+    to burst. A request that finds the bucket empty reserves a future token
+    and sleeps until it is due, so waiting callers are served in order.
+    Rate drops on 429/5xx responses and slowly recovers on success.
+    """
+    def __init__(self, rate, burst=1, min_rate=None, slowdown=0.5, recovery=0.05):
+        """
+        :rate - requests per second allowed by API quota
+        :burst - number of requests which can be sent at once
+        :min_rate - rate never goes below this value, default is rate / 16
+        :slowdown - rate is multiplied by this value on 429/5xx
+        :recovery - share of rate given back on every successful response
+        """
+        self.max_rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate if min_rate is not None else self.max_rate / 16
+        self.slowdown = slowdown
+        self.recovery = recovery
+        self.lock = threading.Lock()
+        self.state = {'tokens': float(burst), 'updated': time.time(), 'rate': self.max_rate}
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(float(self.burst), state['tokens'] + elapsed * state['rate'])
+        state['updated'] = now
+
+    def _update(self, change):
+        with self.lock:
+            return change(self.state)
+
+    def reserve(self):
+        """
+        Take a token, returns number of seconds to wait before using it
+        """
+        def take(state):
+            self._refill(state, time.time())
+            state['tokens'] -= 1
+            return -state['tokens'] / state['rate'] if state['tokens'] < 0 else 0.0
+        return self._update(take)
+
+    def acquire(self):
+        """
+        Block current thread until request can be sent
+        """
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        """
+        Suspend current coroutine until request can be sent
+        """
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def feedback(self, status_code):
+        """
+        Adapt rate to the status of a response
+        """
+        def adapt(state):
+            self._refill(state, time.time())
+            if status_code in SLOWDOWN_STATUSES:
+                state['rate'] = max(self.min_rate, state['rate'] * self.slowdown)
+                state['tokens'] = min(state['tokens'], 0.0)
+            else:
+                state['rate'] = min(self.max_rate, state['rate'] + self.max_rate * self.recovery)
+            return state['rate']
+        return self._update(adapt)
+
+    @property
+    def rate(self):
+        return self._update(lambda state: state['rate'])
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket shared by processes through a local state file
+    Every update takes an exclusive flock on the file, so all processes
+    of a host using the same path are limited together.
+    """
+    def __init__(self, path, rate, burst=1, **kwargs):
+        """
+        :path - state file, created if missing
+        Other parameters are the same as in TokenBucket
+        """
+        TokenBucket.__init__(self, rate, burst, **kwargs)
+        self.path = path
+
+    def _update(self, change):
+        with self.lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.read(fd, 4096)
+                state = json.loads(data) if data else dict(self.state)
+                result = change(state)
+                data = json.dumps(state).encode("utf-8")
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, data)
+                return result
+            finally:
+                os.close(fd)
+
+
+# limiters of this process by publisher ID
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(publisher_id, rate=0.2, burst=1, path=None, **kwargs):
+    """
+    Get rate limiter of a publisher ID, created on first call
+    Default rate of one request per 5 seconds keeps the pace of the old
+    random sleeps, set rate and burst to the quota of your publisher ID.
+    :path - directory for state files shared between processes,
+            limiter is local to the process if omitted
+    Other parameters are the same as in TokenBucket
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(publisher_id)
+        if limiter is None:
+            if path:
+                state_file = os.path.join(path, "ratelimit-{0}.json".format(publisher_id))
+                limiter = FileTokenBucket(state_file, rate, burst, **kwargs)
+            else:
+                limiter = TokenBucket(rate, burst, **kwargs)
+            _limiters[publisher_id] = limiter
+        return limiter
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# Adaptive sharding of searches larger than the crawler limit
+# The API serves only the first ~1000 jobs of a search. AdaptiveSharder
+# splits a search which reports more into narrower searches along
+# job_type, site_type, radius and fromage until each one fits, crawls
+# them in parallel and merges their jobs by job_id.
+#
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from indeed import Indeed, make_session
+from indeed.PageCrawler import page_offsets
+from indeed.ratelimit import get_limiter
+from indeed.utils import *
+
+logger = logging.getLogger(__name__)
+
+# order in which searches are split
+DIMENSIONS = ("job_type", "site_type", "radius", "fromage")
+# dimensions whose values partition the jobs of a search
+PARTITIONS = {"job_type": Indeed.JOB_TYPE, "site_type": Indeed.SITE_TYPE}
+
+
+class Shard():
+    """
+    One search of a sharded crawl
+    """
+    __slots__ = ("params", "dimensions", "total", "first_page")
+
+    def __init__(self, params, dimensions, total=0, first_page=None):
+        self.params = params
+        self.dimensions = dimensions
+        self.total = total
+        self.first_page = first_page or []
+
+
+def split_shard(shard):
+    """
+    Narrower searches of a shard along its first dimension which changes it
+    job_type and site_type give one search per value. radius and fromage
+    are halved and can be halved again, they give a single search covering
+    only part of the jobs. Returns list of Shard, empty if nothing is left.
+    """
+    for i, dimension in enumerate(shard.dimensions):
+        if dimension in PARTITIONS:
+            if shard.params.get(dimension):
+                continue
+            return [Shard(dict(shard.params, **{dimension: value}), shard.dimensions[i + 1:])
+                    for value in PARTITIONS[dimension]]
+        value = shard.params.get(dimension)
+        if value and int(value) >= 2:
+            return [Shard(dict(shard.params, **{dimension: int(value) // 2}), shard.dimensions[i:])]
+    return []
+
+
+class AdaptiveSharder:
+    """
+    Crawl all jobs of a search, splitting it while it exceeds the limit
+    Every split search is probed with its first page. Searches which fit
+    are crawled completely, pages of all of them are fetched by a pool of
+    workers. If the jobs of narrower searches don't add up to the wider
+    one, e.g. jobs without job type, the wider search is crawled as well
+    up to the limit. With sort "date" fromage isn't split: narrower age
+    windows only return the newest jobs the wider search already has.
+    """
+    crawler_limit = 1000  # indeed doesn't return jobs more than #1000
+
+    def __init__(self, publisher_id, query, location=98101, radius=25, fromage=30,
+                 sort="date", limit=25, filter_dups=1, session=None,
+                 rate_limiter=None, workers=4, cache=None, dimensions=DIMENSIONS):
+        """
+        :query - API query, see indeed.construct_query
+        :workers - searches and pages fetched at once
+        :dimensions - search parameters to split along, in order
+        Other parameters are the same as in PageCrawler
+        """
+        self.publisher_id = publisher_id
+        self.params = dict(query=query, location=location, radius=radius,
+                           fromage=fromage, sort=sort, limit=limit, filter_dups=filter_dups)
+        if sort == "date":
+            dimensions = tuple(d for d in dimensions if d != "fromage")
+        self.dimensions = tuple(dimensions)
+        self.limit = limit
+        self.workers = workers
+        self.cache = cache
+        self.session = session if session is not None else make_session(pool_size=max(10, workers))
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_limiter(publisher_id)
+        self.stats = {'total_results': 0, 'calls': 0, 'shards': 0, 'probes': 0,
+                      'truncated': 0, 'jobs': 0, 'duplicates': 0}
+        self.stats_lock = threading.Lock()
+
+    def search(self, params, start=0):
+        """
+        One page of a search, returns tuple (totalResults, jobs)
+        """
+        indeed = Indeed(self.publisher_id, session=self.session,
+                        rate_limiter=self.rate_limiter, cache=self.cache)
+        if start:
+            indeed.search_jobs(start=start, **params)
+        else:
+            indeed.search_jobs(userip=getRandomIP(), useragent=getRandomUserAgent(), **params)
+        with self.stats_lock:
+            self.stats['calls'] += 1
+        return indeed.totalResults, indeed.results
+
+    def probe(self, shard):
+        shard.total, shard.first_page = self.search(shard.params)
+        return shard
+
+    def plan(self, executor):
+        """
+        Searches to crawl, every one of them fits the limit unless it
+        can't be split any further
+        """
+        root = self.probe(Shard(self.params, self.dimensions))
+        self.stats['total_results'] = root.total
+        leaves, frontier = [], [root]
+        while frontier:
+            wider = []
+            for shard in frontier:
+                children = split_shard(shard) if shard.total > self.crawler_limit else []
+                if not children:
+                    leaves.append(shard)
+                    continue
+                wider.append((shard, children))
+            probes = [child for _, children in wider for child in children]
+            self.stats['probes'] += len(probes)
+            list(executor.map(self.probe, probes))
+            frontier = []
+            for shard, children in wider:
+                children = [child for child in children if child.total]
+                if sum(child.total for child in children) < shard.total:
+                    leaves.append(shard)
+                frontier.extend(children)
+        self.stats['shards'] = len(leaves)
+        self.stats['truncated'] = sum(shard.total > self.crawler_limit for shard in leaves)
+        return leaves
+
+    def iter_results(self):
+        """
+        Yield jobs of all searches, every job_id once
+        """
+        seen = set()
+
+        def unique(jobs):
+            for job in jobs:
+                if job.job_id in seen:
+                    self.stats['duplicates'] += 1
+                    continue
+                seen.add(job.job_id)
+                self.stats['jobs'] += 1
+                yield job
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            leaves = self.plan(executor)
+            logger.info("%s jobs found, crawling %s searches", self.stats['total_results'], len(leaves))
+            for shard in leaves:
+                yield from unique(shard.first_page)
+            pages = [(shard.params, start) for shard in leaves
+                     for start in page_offsets(shard.total, self.limit, self.crawler_limit)]
+            for _, jobs in executor.map(lambda page: self.search(*page), pages):
+                yield from unique(jobs)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def crawl(self):
+        return list(self.iter_results())
+
+    def report(self):
+        """
+        Coverage of the search against API calls spent
+        coverage is the share of totalResults of the search that was
+        crawled, unsharded_coverage what a plain crawl would get.
+        """
+        with self.stats_lock:
+            report = dict(self.stats)
+        total = report['total_results']
+        report['coverage'] = report['jobs'] / total if total else 1.0
+        report['unsharded_coverage'] = min(total, self.crawler_limit + self.limit) / total if total else 1.0
+        report['jobs_per_call'] = report['jobs'] / report['calls'] if report['calls'] else 0.0
+        return report
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Crawl state: newest job seen per (job title, location)
+#
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+
+
+def job_timestamp(date):
+    """
+    Unix time of job date as returned by API, e.g.
+    "Mon, 01 Apr 2019 10:00:00 GMT", None if it can't be parsed
+    """
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class Mark(namedtuple("Mark", ("date", "job_id"))):
+    """
+    High-water mark: date and job id of the newest job of the last crawl
+    """
+    __slots__ = ()
+
+    def reached(self, job):
+        """
+        True if job was already seen by the crawl which left this mark
+        Jobs sorted by date come newest first, so everything from the
+        marked job or older than its date is known.
+        """
+        if job.job_id == self.job_id:
+            return True
+        date = job_timestamp(job.date)
+        return date is not None and self.date is not None and date < self.date
+
+
+class HighWaterMarks():
+    """
+    Marks of incremental crawls kept in a local SQLite file
+    """
+    def __init__(self, path=":memory:"):
+        """
+        :path - database file, created if missing; in memory if omitted
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS marks ("
+                                    "job_title TEXT, location TEXT, date REAL, "
+                                    "job_id TEXT, updated REAL, "
+                                    "PRIMARY KEY (job_title, location))")
+
+    def get(self, job_title, location):
+        """
+        Mark of the last crawl, None if there wasn't one
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT date, job_id FROM marks "
+                                          "WHERE job_title = ? AND location = ?",
+                                          (job_title, str(location))).fetchone()
+        return Mark(*row) if row else None
+
+    def set(self, job_title, location, job):
+        """
+        Remember job as the newest one of a crawl
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO marks VALUES (?, ?, ?, ?, ?)",
+                                    (job_title, str(location), job_timestamp(job.date),
+                                     job.job_id, time.time()))
+
+    def close(self):
+        self.connection.close()
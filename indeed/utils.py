@@ -1,17 +1,64 @@
-from random import getrandbits, randrange
-from ipaddress import IPv4Address
-from my_fake_useragent import UserAgent
+import fcntl
+import os
+from contextlib import contextmanager
+from random import choice, getrandbits, randrange
+
+# user agents of my_fake_useragent, loaded on the first draw
+_user_agents = []
+
 
 def getRandomIP():
     bits = getrandbits(32) # generates an integer with 32 random bits
-    addr = IPv4Address(bits) # instances an IPv4Address object from those bits
-    addr_str = str(addr) # get the IPv4Address object's string representation
-    return addr_str
+    # dotted quad of the bits, without building an IPv4Address object
+    return "%d.%d.%d.%d" % (bits >> 24, (bits >> 16) & 255, (bits >> 8) & 255, bits & 255)
+
+
+def loadUserAgents():
+    """
+    Load the user agent database once, later calls return the same pool
+    """
+    if not _user_agents:
+        from my_fake_useragent import UserAgent
+        _user_agents.extend(UserAgent().get_useragent_list())
+    return _user_agents
 
 
 def getRandomUserAgent():
-    ua = UserAgent()
-    return ua.random()
+    return choice(_user_agents or loadUserAgents())
 
 def getRandomSleepTime(min, max):
     return randrange(min, max, 1)
+
+
+@contextmanager
+def locked_file(path):
+    """
+    Exclusive flock of a file shared by processes, taken on path + ".lock"
+    """
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, data):
+    """
+    Replace a file with bytes through a temporary file of this call
+    Concurrent writers never share a temporary file, readers see either
+    the old or the new content.
+    """
+    import tempfile
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                    prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp files are private, keep the mode of a plain open()
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
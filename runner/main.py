@@ -1,9 +1,15 @@
+import argparse
 import datetime
+import logging
 import os
+import tempfile
+import threading
+import json, time
 
-from indeed.PageCrawler import PageCrawler
-from awslib import dynamodb
-import boto3, sys, json, time, yaml
+# boto3, requests, lxml and the crawl modules take most of the startup
+# time, every command imports only what it uses
+
+logger = logging.getLogger(__name__)
 
 
 def main():
@@ -11,46 +17,151 @@ def main():
     Main module
     """
 
+    def load_known_jobs(known_jobs_config):
+        """
+        Cache of job ids already stored in DynamoDB, loaded from a snapshot
+        """
+        snapshot = known_jobs_config.get("snapshot")
+        if not snapshot:
+            return None
+        from awslib import jobcache
+        size = known_jobs_config.get("size", 1000000)
+        if known_jobs_config.get("bloom"):
+            return jobcache.BloomFilter.load(snapshot, capacity=size)
+        return jobcache.KnownJobCache.load(snapshot, maxsize=size)
+
+    def save_known_jobs(known_jobs, known_jobs_config):
+        if known_jobs is not None:
+            known_jobs.save(known_jobs_config["snapshot"])
+
+    def load_fingerprints(known_jobs_config):
+        """
+        Fingerprints of stored jobs, unchanged jobs are not written again
+        """
+        path = known_jobs_config.get("fingerprints")
+        if not path:
+            return None
+        from awslib import jobcache
+        return jobcache.FingerprintIndex.load(path, maxsize=known_jobs_config.get("size", 1000000))
+
+    def save_fingerprints(fingerprints, known_jobs_config):
+        if fingerprints is not None:
+            fingerprints.save(known_jobs_config["fingerprints"])
+
+    def start_metrics(config):
+        """
+        Record metrics of this process and report them periodically
+        Returns event stopping the reporter, None if metrics are disabled
+        """
+        metrics_config = config.get("metrics") or {}
+        if not metrics_config.get("enabled"):
+            return None
+        from indeed import metrics
+        metrics.enable()
+        return metrics.start_reporter(interval=metrics_config.get("interval", 60),
+                                      json_path=metrics_config.get("json_path"),
+                                      prometheus_path=metrics_config.get("prometheus_path"))
+
     def purge_queues(config):
-        print("queues purge process started")
+        logger.info("queues purge process started")
+        import boto3
         sqs = boto3.client('sqs')
         queue_dict = config['queues']
 
         for k, q in queue_dict.items():
-            print("purging for queue {0} in process".format(q))
+            logger.info("purging for queue %s in process", q)
             try:
                 queue_response = sqs.get_queue_url(QueueName=q)
                 if 'ErrorResponse' in queue_response.keys():
-                    print(response)
+                    logger.error(queue_response)
                 else:
                     queue_url = queue_response['QueueUrl']
                     response = sqs.purge_queue(
                         QueueUrl=queue_url
                     )
             except Exception as e:
-                print("Error: " + str(e))
+                logger.error("Error: %s", e)
 
         # let it purge the queue and wait according to the documentation
-        print("sleeping 60 sec")
+        logger.info("sleeping 60 sec")
         time.sleep(60)
-        print("done")
+        logger.info("done")
         return 0
 
-    def kicker(config):
-        print("Kicker started, queue name: %s" % config['queues']["crawler_tasks"])
-        sqs = boto3.client('sqs')
-        queue_url = (sqs.get_queue_url(QueueName=config['queues']["crawler_tasks"]))['QueueUrl']
+    def load_dicts(config):
+        """
+        Zip code and job title dictionaries
+        """
         # use first entry in PYTHONPATH, there are better ways to do that.
         user_paths = os.environ['PYTHONPATH'].split(os.pathsep)
 
         zip_codes_filename = user_paths[0] + '/' + config["dicts"]["zip_codes"]
         job_titles_filename = user_paths[0] + '/' + config["dicts"]["titles_data"]
 
-        counter = 0
         with open(zip_codes_filename) as filepointer_zip:
             zip_codes = json.load(filepointer_zip)
         with open(job_titles_filename) as filepointer_title:
             job_titles = json.load(filepointer_title)
+        return zip_codes, job_titles
+
+    def expected_jobs(config, job_titles):
+        """
+        Expected jobs of a zip code task per title, learned yields if the
+        coalesce block has them, planner.jobs_per_task otherwise
+        """
+        default = (config.get("planner") or {}).get("jobs_per_task", 100)
+        yields_path = (config.get("coalesce") or {}).get("yields")
+        if not yields_path:
+            return default
+        from indeed.coalesce import YieldStats
+        yields = YieldStats.load(yields_path)
+        return [yields.estimate(title) or default for title in job_titles]
+
+    def plan(config):
+        """
+        Print estimated savings of the geographic planner for the zip dictionary
+        """
+        from indeed.geo import plan_centers, plan_report
+        zip_codes, job_titles = load_dicts(config)
+        planner = config.get("planner") or {}
+        radius = planner.get("radius", 25)
+        cover_radius = planner.get("cover_radius", radius)
+        centers = plan_centers(zip_codes, cover_radius)
+        report = plan_report(zip_codes, centers, len(job_titles), radius, cover_radius,
+                             jobs_per_task=expected_jobs(config, job_titles))
+        for key, value in report.items():
+            print("{0}: {1}".format(key, value))
+        return 0
+
+    def kicker(config):
+        logger.info("Kicker started, queue name: %s", config['queues']["crawler_tasks"])
+        import boto3
+        from indeed.geo import plan_centers, plan_report
+        from indeed.coalesce import YieldStats, plan_packs
+        from awslib import sqs as sqs_batch
+        sqs = boto3.client('sqs')
+        queue_url = (sqs.get_queue_url(QueueName=config['queues']["crawler_tasks"]))['QueueUrl']
+        zip_codes, job_titles = load_dicts(config)
+        radius = 25
+        planner = config.get("planner")
+        if planner:
+            # search around fewer centers with a wider radius
+            radius = planner.get("radius", 25)
+            cover_radius = planner.get("cover_radius", radius)
+            centers = plan_centers(zip_codes, cover_radius)
+            logger.info("Planner: %s", plan_report(zip_codes, centers, len(job_titles), radius, cover_radius,
+                                                   jobs_per_task=expected_jobs(config, job_titles)))
+            zip_codes = centers
+            radius = radius + cover_radius
+        coalesce = config.get("coalesce") or {}
+        if coalesce.get("yields"):
+            # rare titles of a location share one query
+            packs = plan_packs(job_titles, YieldStats.load(coalesce["yields"]),
+                               headroom=coalesce.get("headroom", 0.5),
+                               max_titles=coalesce.get("max_titles", 10))
+            logger.info("Coalescing: %s titles in %s queries per location", len(job_titles), len(packs))
+        else:
+            packs = [[title] for title in job_titles]
 
         # todo: find the instance name to keep track of it
         """r = requests.get("http://169.254.169.254/latest/dynamic/instance-identity/document")
@@ -58,95 +169,232 @@ def main():
         region = response_json.get('region')
         instance_id = response_json.get('instanceId')
         """
+        def task_message(titles, zip_code):
+            return {
+                'DelaySeconds': 1,
+                'MessageAttributes': {
+                    'Origin': {
+                        'DataType': 'String',
+                        'StringValue': 'Kicker'
+                    },
+                    'Timestamp': {
+                        'DataType': 'String',
+                        'StringValue': time.time().__str__()
+                    }
+                },
+                'MessageBody': json.dumps({
+                    'title': " or ".join(titles),
+                    'titles': titles,
+                    'zip_code': zip_code,
+                    'radius': radius,
+                    'datetime': datetime.datetime.utcnow().__str__()
+                })
+            }
+
+        start_metrics(config)
+        sender = sqs_batch.BatchSender(queue_url, sqs=sqs, workers=config.get("kicker_workers", 4))
         try:
-            for title_x in job_titles:
-                for zip_x in range(0, len(zip_codes)):
-                    zip_code = zip_codes[zip_x]["zip"]
-                    time_var = time.time().__str__()
-                    datetime_var = datetime.datetime.utcnow().__str__()
-                    response = sqs.send_message(
-                        QueueUrl=queue_url,
-                        DelaySeconds=1,
-                        MessageAttributes={
-                            'Origin': {
-                                'DataType': 'String',
-                                'StringValue': 'Kicker'
-                            },
-                            'Timestamp': {
-                                'DataType': 'String',
-                                'StringValue': time_var
-                            }
-                        },
-                        MessageBody=json.dumps({
-                            'title': title_x,
-                            'zip_code': zip_code,
-                            'datetime': datetime_var
-                        })
-                    )
-                    if not response.keys().__contains__('MessageId'):
-                        print("Error occured, no MessageId in response %s:" %response)
-                        exit(1)
-                    else:
-                        counter += 1
-                print("{0} messages sent with title {1} to sqs queue".format(counter, title_x))
-                counter = 0
+            for titles in packs:
+                counter = sender.send_many(task_message(titles, zip_x["zip"]) for zip_x in zip_codes)
+                logger.info("%s messages sent with title %s to sqs queue", counter, " or ".join(titles))
         except  Exception as e:
-                print("Error: " + str(e))
+                logger.error("Error: %s", e)
+        for failure in sender.errors:
+            logger.error("Error occured, message not sent: %s", failure)
+        logger.info("%s messages sent, %s failed, %.1f messages per second",
+                    sender.stats['sent'], sender.stats['failed'], sender.messages_per_second)
         return 0
 
-    def crawler(config):
-        print("Crawler started, queue name for tasks: %s" % config['queues']["crawler_tasks"])
-        sqs = boto3.resource('sqs')
-        queue = sqs.get_queue_by_name(QueueName=config['queues']["crawler_tasks"])
+    def crawler(config, stop_event=None, counters=None):
+        """
+        Crawl tasks from the queue until stop_event is set
+        :stop_event - event set by Supervisor to drain the worker
+        :counters - SharedCounters of Supervisor, messages and jobs are counted
+        """
+        logger.info("Crawler started, queue name for tasks: %s", config['queues']["crawler_tasks"])
+        import boto3
+        from indeed import construct_query, make_session, metrics
+        from indeed.PageCrawler import PageCrawler
+        from indeed.ratelimit import get_limiter
+        from indeed.cache import open_cache
+        from indeed.coalesce import PackCrawler, YieldStats
+        from indeed.shard import AdaptiveSharder
+        from indeed.state import HighWaterMarks
+        from awslib import dynamodb, sinks
+        from awslib import sqs as sqs_batch
+        from indeed.utils import loadUserAgents
+        # started here, every forked worker reports its own metrics
+        start_metrics(config)
+        # user agent pool is loaded before polling, not by the first request
+        loadUserAgents()
+        # one connection pool for all crawls of this process
+        http_session = make_session(pool_size=max(10, config.get("crawl_workers", 1) * config.get("crawler_workers", 1)))
+        # job ids already stored, shared by all crawls of this process
+        known_jobs = load_known_jobs(config.get("known_jobs") or {})
+        fingerprints = load_fingerprints(config.get("known_jobs") or {})
+        sqs = boto3.client('sqs')
+        queue_url = (sqs.get_queue_url(QueueName=config['queues']["crawler_tasks"]))['QueueUrl']
+        # API requests are paced by the limiter of the publisher ID, not by sleeps
+        rate_limiter = get_limiter(config["publisher_id"], **config.get("rate_limit", {}))
+        # opened here, sqlite connections must not be inherited by forked workers
+        # API responses reused by redelivered and overlapping tasks
+        cache_config = dict(config.get("response_cache") or {})
+        response_cache = open_cache(**cache_config) if cache_config.pop("enabled", False) else None
+        # newest job per (title, location) for incremental crawls
+        incremental = config.get("incremental") or {}
+        crawl_state = HighWaterMarks(incremental["path"]) if incremental.get("path") else None
+        # local files written next to DynamoDB for analytics
+        result_sink = sinks.open_sink(**config["result_sink"]) if (config.get("result_sink") or {}).get("path") else None
+        # results per title learned from crawls, read by the kicker to pack titles
+        yields_path = (config.get("coalesce") or {}).get("yields")
+        yields = YieldStats.load(yields_path) if yields_path else None
+        snapshot_every = 100
+        handled = [0]
+        handled_lock = threading.Lock()
+
+        def remembered(jobs, crawled):
+            """
+            Yield jobs, keeping them in list crawled
+            """
+            for job in jobs:
+                crawled.append(job)
+                yield job
 
-        try:
-            for message in queue.receive_messages(VisibilityTimeout=600, MaxNumberOfMessages=10, MessageAttributeNames=['All']):
-                json_obj = json.loads(message.body)
+        def crawl_message(message):
+            json_obj = json.loads(message['Body'])
+            crawl_args = dict(location=json_obj["zip_code"],
+                              radius=json_obj.get("radius", 25),
+                              fromage=1,
+                              session=http_session,
+                              rate_limiter=rate_limiter,
+                              workers=config.get("crawl_workers", 1),
+                              cache=response_cache,
+                              state=crawl_state)
+            sharding = config.get("sharding") or {}
+            titles = json_obj.get("titles") or [json_obj["title"]]
+            if sharding.get("enabled") and len(titles) == 1:
+                # searches over the crawler limit are split instead of truncated
+                crawl_instance = AdaptiveSharder(config["publisher_id"], construct_query(all_words=titles[0]),
+                                                 location=json_obj["zip_code"],
+                                                 radius=json_obj.get("radius", 25),
+                                                 fromage=1,
+                                                 session=http_session,
+                                                 rate_limiter=rate_limiter,
+                                                 workers=sharding.get("workers", 4),
+                                                 cache=response_cache)
+            elif json_obj.get("titles"):
+                crawl_instance = PackCrawler(config["publisher_id"], json_obj["titles"],
+                                             yields=yields, **crawl_args)
+            else:
                 crawl_instance = PageCrawler(publisher_id=config["publisher_id"],
-                                             job_title=json_obj["title"],
-                                             location=json_obj["zip_code"],
-                                             fromage=1)
-                crawl_instance.crawl()
-                # save all job_ids to DynamoDB in bulk
-                print("fetched: " +len(crawl_instance.results).__str__()+ " jobs")
-                dynamodb.updateJobs(crawl_instance.results)
-
-                # Let the queue know that the message is processed
-                print("Deleting message Timestamp '%s' from sqs" % message.message_attributes.get('Timestamp').get('StringValue'))
-                message.delete()
-        except Exception as e:
-                print("Error: " + str(e))
-                exit(1)
-        wait_seconds = 5
-        # sqs doesn't return all messages since it is decentralized, now we wait and re-run in recursion
-        print("Crawler finished processing current batch, waiting for %s seconds" %wait_seconds)
-        time.sleep(wait_seconds) # here we don't want to spam API.
-        return crawler(config)
-
-    def crawler_desc(configParams):
-        print("Crawler for descriptions started")
-        # check if job id and description already exists in DynamoDB, then don't bother
-        a = dynamodb.jobExists()
-        exit(1)
+                                             job_title=json_obj["title"], **crawl_args)
+            # save job_ids to DynamoDB in bulk while pages arrive
+            jobs = crawl_instance.iter_results()
+            crawled = []
+            if result_sink is not None:
+                jobs = remembered(jobs, crawled)
+            compression = config.get("dynamodb_compression") or {}
+            with dynamodb.JobStore(workers=config.get("dynamodb_workers", 0), cache=known_jobs,
+                                   fingerprints=fingerprints,
+                                   compress_threshold=compression.get("threshold") or 0,
+                                   codec=compression.get("codec")) as store:
+                stored = store.put_many(jobs)
+            # jobs are written, a redelivered message may skip them now
+            if not isinstance(crawl_instance, AdaptiveSharder):
+                crawl_instance.commit_mark()
+            if result_sink is not None:
+                # written once stored, a failed message doesn't leave rows behind
+                result_sink.put_many(crawled)
+            logger.debug("writes: %s", store.stats)
+            logger.info("stored: %s jobs for message Timestamp '%s'", stored,
+                        message.get('MessageAttributes', {}).get('Timestamp', {}).get('StringValue'))
+            if isinstance(crawl_instance, AdaptiveSharder):
+                logger.info("Sharding: %s", crawl_instance.report())
+            elif isinstance(crawl_instance, PackCrawler):
+                logger.info("Jobs per title: %s, unmatched: %s", dict(crawl_instance.by_title),
+                            crawl_instance.unmatched)
+            metrics.registry.incr("messages")
+            metrics.registry.incr("jobs_stored", stored)
+            if counters is not None:
+                counters.add("messages")
+                counters.add("jobs", stored)
+            with handled_lock:
+                handled[0] += 1
+                if handled[0] % snapshot_every == 0:
+                    save_known_jobs(known_jobs, config.get("known_jobs") or {})
+                    save_fingerprints(fingerprints, config.get("known_jobs") or {})
+                    if yields is not None:
+                        yields.save(yields_path)
+
+        # messages are deleted by the worker once crawl_message returns
+        worker = sqs_batch.QueueWorker(queue_url, crawl_message, sqs=sqs,
+                                       workers=config.get("crawler_workers", 1),
+                                       wait_time=20, visibility_timeout=600)
+        if stop_event is not None:
+            # finish messages in progress and return once supervisor asks to stop
+            threading.Thread(target=lambda: stop_event.wait() or worker.stop(), daemon=True).start()
+        try:
+            worker.run()
+        finally:
+            save_known_jobs(known_jobs, config.get("known_jobs") or {})
+            save_fingerprints(fingerprints, config.get("known_jobs") or {})
+            if yields is not None:
+                yields.save(yields_path)
+            logger.info("Crawler stopped: %s", worker.report())
+            if response_cache is not None:
+                logger.info("Response cache: %s", response_cache.stats)
+            if result_sink is not None:
+                result_sink.close()
+                logger.info("Result files: %s", result_sink.stats)
         return 0
 
-    command = sys.argv[1]
+    def crawler_desc(config):
+        """
+        Crawl descriptions of stored jobs, not implemented yet
+        Once there is a description fetcher, job ids of a batch are to be
+        checked at once with dynamodb.JobStore(cache=load_known_jobs(...)).jobs_exist
+        """
+        logger.error("Crawler for descriptions is not implemented, no messages are taken")
+        return 1
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="crawler processes run by a supervisor")
+    parser.add_argument("--log-level", default=None,
+                        help="DEBUG, INFO, WARNING or ERROR, log_level of config if omitted")
+    args = parser.parse_args()
+    command = args.command
 
-    print("command passed to the main script: %s" % command)
+    import yaml
     config_params = yaml.safe_load(open("ConfigParameters.yaml"))
-    print(config_params)
+    logging.basicConfig(level=(args.log_level or config_params.get("log_level") or "INFO").upper(),
+                        format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s")
+    logger.info("command passed to the main script: %s", command)
+    # config holds the publisher ID, keep it out of regular logs
+    logger.debug("config: %s", config_params)
+    if command == 'crawler' and args.workers > 1:
+        # processes of this host share the rate limit through a state file
+        rate_limit = config_params.get("rate_limit") or {}
+        rate_limit["path"] = rate_limit.get("path") or tempfile.gettempdir()
+        config_params["rate_limit"] = rate_limit
     # map the inputs to the function blocks
     options = {'kicker': kicker,
                'crawler': crawler,
                'crawler_desc': crawler_desc,
                'purge_queues': purge_queues,
+               'plan': plan,
                }
 
     if not options.keys().__contains__(command):
-        print("error, no options found for the command: %s" % command)
+        logger.error("error, no options found for the command: %s", command)
 
-    options[command](config_params)
+    if command == 'crawler' and args.workers > 1:
+        from supervisor import Supervisor
+        Supervisor(crawler, args=(config_params,), workers=args.workers).run()
+    else:
+        return options[command](config_params)
 
 
 if __name__ == '__main__':
-    main()
+    raise SystemExit(main())
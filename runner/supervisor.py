@@ -0,0 +1,125 @@
+"""Supervisor running several crawler processes on one host.
+Every worker process runs the same target, e.g. the crawl loop of
+main.py. Crashed workers are restarted, SIGTERM or SIGINT asks all of
+them to finish the messages in progress and exit. Workers report
+progress through shared counters, which the supervisor logs as rates
+for the whole host.
+"""
+import logging
+import multiprocessing
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCounters():
+    """
+    Counters shared by worker processes
+    """
+    def __init__(self, names, context=multiprocessing):
+        self.values = {name: context.Value('d', 0.0) for name in names}
+
+    def add(self, name, amount=1):
+        value = self.values[name]
+        with value.get_lock():
+            value.value += amount
+
+    def snapshot(self):
+        return {name: value.value for name, value in self.values.items()}
+
+
+def _worker_main(target, args, stop_event, counters):
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    target(*args, stop_event=stop_event, counters=counters)
+
+
+class Supervisor():
+    """
+    Fork worker processes, restart them and drain them on shutdown
+    """
+    def __init__(self, target, args=(), workers=2, counters=("messages", "jobs"),
+                 restart_delay=5, drain_timeout=660, report_every=60):
+        """
+        :target - function run by every worker, called with args and
+                  keyword arguments stop_event and counters
+        :workers - number of worker processes
+        :counters - names of SharedCounters passed to workers
+        :restart_delay - minimum seconds between starts of one worker slot
+        :drain_timeout - seconds to wait for workers after stop before
+                         they are terminated
+        :report_every - seconds between progress reports
+        """
+        self.target = target
+        self.args = args
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.drain_timeout = drain_timeout
+        self.report_every = report_every
+        self.context = multiprocessing.get_context("fork")
+        self.stop_event = self.context.Event()
+        self.counters = SharedCounters(counters, self.context)
+        self.processes = [None] * workers
+        self.started_at = [0.0] * workers
+        self.restarts = 0
+        self.started = None
+
+    def _start(self, slot):
+        process = self.context.Process(target=_worker_main, name="worker-{0}".format(slot),
+                                       args=(self.target, self.args, self.stop_event, self.counters))
+        process.start()
+        self.processes[slot] = process
+        self.started_at[slot] = time.monotonic()
+
+    def stop(self, signum=None, frame=None):
+        self.stop_event.set()
+
+    def run(self):
+        """
+        Run workers until stop is called or a signal is received
+        """
+        previous = {s: signal.signal(s, self.stop) for s in (signal.SIGTERM, signal.SIGINT)}
+        self.started = time.monotonic()
+        last_report = self.started
+        try:
+            for slot in range(self.workers):
+                self._start(slot)
+            while not self.stop_event.wait(0.5):
+                for slot, process in enumerate(self.processes):
+                    if process.is_alive() or self.stop_event.is_set():
+                        continue
+                    if time.monotonic() - self.started_at[slot] < self.restart_delay:
+                        continue
+                    logger.warning("worker %s exited with code %s, restarting", slot, process.exitcode)
+                    self.restarts += 1
+                    self._start(slot)
+                if time.monotonic() - last_report >= self.report_every:
+                    last_report = time.monotonic()
+                    logger.info("supervisor: %s", self.report())
+        finally:
+            self.stop_event.set()
+            deadline = time.monotonic() + self.drain_timeout
+            for process in self.processes:
+                if process is not None:
+                    process.join(max(0.0, deadline - time.monotonic()))
+            for process in self.processes:
+                if process is not None and process.is_alive():
+                    logger.warning("worker %s didn't stop in time, terminating", process.name)
+                    process.terminate()
+                    process.join()
+            for s, handler in previous.items():
+                signal.signal(s, handler)
+            logger.info("supervisor stopped: %s", self.report())
+
+    def report(self):
+        """
+        Totals of shared counters and their rates per second for the host
+        """
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        report = self.counters.snapshot()
+        for name, total in list(report.items()):
+            report[name + "_per_second"] = total / elapsed if elapsed else 0.0
+        report['alive'] = sum(1 for p in self.processes if p is not None and p.is_alive())
+        report['restarts'] = self.restarts
+        return report
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+from unittest import TestCase
+from indeed import Indeed
+from indeed.cache import cache_key, MemoryCache, SQLiteCache
+from benchmarks.fake_indeed import FakeIndeedServer
+
+
+class TestCacheKey(TestCase):
+    def test_ignores_random_params(self):
+        """
+        userip, useragent and parameter order don't change the key
+        """
+        first = cache_key("http://h/ads/apisearch?q=python&userip=1.2.3.4&start=25&useragent=A")
+        second = cache_key("http://h/ads/apisearch?start=25&useragent=B&q=python&userip=5.6.7.8")
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, cache_key("http://h/ads/apisearch?q=python&start=50"))
+
+
+class TestBackends(TestCase):
+    def check_backend(self, cache):
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", b"1")
+        cache.set("b", b"2")
+        cache.set("c", b"3")
+        self.assertEqual(cache.get("c"), b"3")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats['evictions'], 1)
+        cache.ttl = -1
+        cache.set("d", b"4")
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_memory(self):
+        self.check_backend(MemoryCache(maxsize=2))
+
+    def test_sqlite(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = SQLiteCache(os.path.join(path, "cache.db"), maxsize=2, evict_every=1)
+            self.check_backend(cache)
+            cache.close()
+
+    def test_sqlite_periodic_eviction(self):
+        """
+        Table is trimmed to maxsize every evict_every sets, not on every set
+        """
+        with tempfile.TemporaryDirectory() as path:
+            cache = SQLiteCache(os.path.join(path, "cache.db"), maxsize=10, evict_every=5)
+            for i in range(14):
+                cache.set(str(i), b"x")
+            count = cache.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            self.assertEqual((count, cache.stats['evictions']), (14, 0))
+            cache.set("14", b"x")
+            count = cache.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            self.assertEqual((count, cache.stats['evictions']), (10, 5))
+            self.assertIsNone(cache.get("0"))
+            self.assertEqual(cache.get("14"), b"x")
+            cache.close()
+
+
+class TestClientCache(TestCase):
+    def test_repeated_search_served_from_cache(self):
+        """
+        Second search with different userip doesn't reach the server
+        """
+        cache = MemoryCache()
+        with FakeIndeedServer(total_results=40) as server:
+            indeed = Indeed("1", base_url=server.url, cache=cache)
+            indeed.search_jobs("python", userip="1.1.1.1")
+            first = [e.job_id for e in indeed.results]
+            response = indeed.search_jobs("python", userip="2.2.2.2")
+            self.assertEqual(server.requests, 1)
+        self.assertTrue(response.from_cache)
+        self.assertEqual([e.job_id for e in indeed.results], first)
+        self.assertEqual(indeed.totalResults, 40)
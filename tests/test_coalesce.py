@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from indeed import Element, Indeed
+from indeed.coalesce import pack_query, demultiplex, plan_packs, YieldStats, PackCrawler
+from indeed.ratelimit import TokenBucket
+from benchmarks.fake_indeed import FakeIndeedServer
+
+
+def job(title, description="", job_id="1"):
+    return Element(title, "ACME", "Seattle", "WA", "US", "Indeed", "Mon, 01 Apr 2019 10:00:00 GMT",
+                   description, "http://www.indeed.com/viewjob?jk=" + job_id, False, "1 day ago")
+
+
+class TestPacking(TestCase):
+    """
+    Test packed queries and assignment of jobs to titles
+    """
+    def test_pack_query(self):
+        """
+        Every title is a group of required words
+        """
+        self.assertEqual(pack_query(["data engineer", "actuary"]), "((data+engineer)+or+(actuary))")
+        self.assertEqual(pack_query(["data engineer"]), "data+engineer")
+
+    def test_demultiplex(self):
+        """
+        Jobs go to titles whose words they contain
+        """
+        jobs = [job("Senior Data Engineer"), job("Actuary II"),
+                job("Analyst", "our data engineer team"), job("Nurse")]
+        by_title = demultiplex(jobs, ["data engineer", "actuary"])
+        self.assertEqual([j.title for j in by_title["data engineer"]], ["Senior Data Engineer", "Analyst"])
+        self.assertEqual([j.title for j in by_title["actuary"]], ["Actuary II"])
+        self.assertEqual([j.title for j in by_title[None]], ["Nurse"])
+
+    def test_plan_packs(self):
+        """
+        Packs stay under the limit, unknown titles are searched alone
+        """
+        yields = YieldStats()
+        for title, results in (("a", 300), ("b", 150), ("c", 100), ("d", 50), ("e", 900)):
+            yields.observe(title, results)
+        packs = plan_packs(["a", "b", "c", "d", "e", "new"], yields, crawler_limit=1000, headroom=0.5)
+        self.assertEqual(sorted(map(sorted, packs)), [["a", "b", "d"], ["c"], ["e"], ["new"]])
+
+    def test_yields_saved(self):
+        """
+        Estimates of other processes survive a save
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "yields.json")
+            first, second = YieldStats(), YieldStats(alpha=0.5)
+            first.observe("a", 10)
+            second.observe("b", 20)
+            second.observe("b", 40)
+            first.save(path)
+            second.save(path)
+            loaded = YieldStats.load(path)
+        self.assertEqual((loaded.estimate("a"), loaded.estimate("b")), (10.0, 30.0))
+
+
+class TestPackCrawler(TestCase):
+    """
+    Test crawling a pack against fake server
+    """
+    def crawl(self, total_results, titles):
+        yields = YieldStats()
+        with FakeIndeedServer(total_results=total_results) as server, \
+                patch.object(Indeed, "API_URL", server.url):
+            crawler = PackCrawler("1", titles, yields=yields, rate_limiter=TokenBucket(1000, burst=100))
+            jobs = list(crawler.iter_results())
+            return crawler, yields, jobs, server.requests
+
+    def test_one_query(self):
+        """
+        Titles under the limit are crawled with one query and learned
+        """
+        crawler, yields, jobs, requests = self.crawl(60, ["python developer", "rust"])
+        self.assertEqual(requests, 3)
+        self.assertEqual(len(jobs), 60)
+        self.assertEqual(dict(crawler.by_title), {"python developer": 60, "rust": 0})
+        self.assertEqual(yields.estimate("python developer"), 60)
+
+    def test_split_over_limit(self):
+        """
+        Pack finding more jobs than the limit is crawled title by title
+        """
+        crawler, yields, jobs, requests = self.crawl(1100, ["python developer", "rust"])
+        self.assertEqual(requests, 1 + 2 * 41)
+        self.assertEqual(len(jobs), 2 * 1025)
+        self.assertEqual(yields.estimate("rust"), 1100)
+        self.assertEqual(dict(crawler.by_title), {"python developer": 1025, "rust": 1025})
+
+    def test_jobs_assigned(self):
+        """
+        Every job of a packed query comes with the titles it belongs to
+        """
+        class Pages():
+            crawler_limit = 1000
+            total_results = 4
+
+            def iter_results(self, pages=False):
+                yield [job("Senior Data Engineer", job_id="1"), job("Actuary II", job_id="2")]
+                yield [job("Analyst", "our data engineer team", job_id="3"), job("Nurse", job_id="4")]
+
+        crawler = PackCrawler("1", ["data engineer", "actuary"])
+        with patch.object(crawler, "crawler", lambda titles: Pages()):
+            assigned = [(titles, j.job_id) for titles, j in crawler.iter_assigned()]
+        self.assertEqual(assigned, [(("data engineer",), "1"), (("actuary",), "2"),
+                                    (("data engineer",), "3"), ((), "4")])
+        self.assertEqual(dict(crawler.by_title), {"data engineer": 2, "actuary": 1})
+        self.assertEqual(crawler.unmatched, 1)
+
+    def test_jobs_assigned_title_by_title(self):
+        """
+        Jobs of titles crawled one by one belong to the title searched
+        """
+        with FakeIndeedServer(total_results=1100) as server, \
+                patch.object(Indeed, "API_URL", server.url):
+            crawler = PackCrawler("1", ["python developer", "rust"], rate_limiter=TokenBucket(1000, burst=100))
+            titles = [titles for titles, _ in crawler.iter_assigned()]
+        self.assertEqual(titles, [("python developer",)] * 1025 + [("rust",)] * 1025)
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+import boto3
+from moto import mock_aws
+from awslib import dynamodb
+from awslib.jobcache import KnownJobCache, BloomFilter, FingerprintIndex
+from benchmarks.feeds import make_jobs
+from benchmarks.aws import create_jobs_table
+
+
+class TestJobStore(TestCase):
+    """
+    Test batched writes of jobs into local DynamoDB stand-in
+    """
+    def setUp(self):
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+        self.mock = mock_aws()
+        self.mock.start()
+        self.resource = boto3.resource('dynamodb', region_name=dynamodb.REGION_NAME)
+        self.table = create_jobs_table(self.resource)
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_dedup_and_batches(self):
+        """
+        Repeated job ids are written once, in batches of 25
+        """
+        jobs = make_jobs(60) + make_jobs(10)
+        with dynamodb.JobStore(dynamodb=self.resource) as store:
+            self.assertEqual(store.put_many(jobs), 60)
+        self.assertEqual(store.stats['duplicates'], 10)
+        self.assertEqual(store.stats['batches'], 3)
+        self.assertEqual(self.table.scan()['Count'], 60)
+
+    def test_thread_pool(self):
+        """
+        Batches sent from threads reach the table
+        """
+        with dynamodb.JobStore(dynamodb=self.resource, workers=4) as store:
+            store.put_many(make_jobs(200))
+        self.assertEqual(store.stats['written'], 200)
+        self.assertEqual(self.table.scan()['Count'], 200)
+
+    def test_update_jobs(self):
+        """
+        Old entry point writes through a store
+        """
+        store = dynamodb.JobStore(dynamodb=self.resource)
+        self.assertEqual(dynamodb.updateJobs(make_jobs(30), store=store), 30)
+        self.assertEqual(dynamodb.updateJobs(make_jobs(30), store=store), 30)
+        self.assertEqual(self.table.scan()['Count'], 30)
+
+
+class TestFingerprints(TestCase):
+    """
+    Test change detection of repeated crawls
+    """
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.resource = boto3.resource('dynamodb', region_name=dynamodb.REGION_NAME)
+        self.table = create_jobs_table(self.resource)
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_changes(self):
+        """
+        Unchanged jobs are skipped, expired is updated in place, changed jobs are rewritten
+        """
+        index = FingerprintIndex()
+        with dynamodb.JobStore(dynamodb=self.resource, fingerprints=index) as store:
+            self.assertEqual(store.put_many(make_jobs(50)), 50)
+        self.assertEqual(store.stats['written'], 50)
+        jobs = make_jobs(50)
+        for job in jobs:
+            job.date_published = "3 days ago"
+        jobs[0].expired = True
+        jobs[1].description = "new description"
+        with dynamodb.JobStore(dynamodb=self.resource, fingerprints=index, workers=2) as store:
+            self.assertEqual(store.put_many(jobs), 2)
+        self.assertEqual((store.stats['unchanged'], store.stats['updated'], store.stats['written']), (48, 1, 1))
+        first = self.table.get_item(Key={'job_id': jobs[0].job_id})['Item']
+        self.assertIs(first['expired'], True)
+        self.assertEqual(first['fingerprint'], jobs[0].fingerprint())
+        self.assertEqual(index.get(jobs[1].job_id), (jobs[1].fingerprint(), False))
+
+    def test_conflict_rewritten(self):
+        """
+        Update of a job missing from the table writes it whole
+        """
+        index = FingerprintIndex()
+        job = make_jobs(1)[0]
+        index.set(job.job_id, job.fingerprint(), True)
+        with dynamodb.JobStore(dynamodb=self.resource, fingerprints=index) as store:
+            store.put(job)
+        self.assertEqual((store.stats['conflicts'], store.stats['written']), (1, 1))
+        self.assertEqual(self.table.get_item(Key={'job_id': job.job_id})['Item']['title'], job.title)
+
+
+class TestUnprocessedItems(TestCase):
+    """
+    Test retry of items DynamoDB didn't process
+    """
+    def test_retry(self):
+        resource = MagicMock()
+        client = resource.meta.client
+        calls = []
+
+        def batch_write_item(RequestItems):
+            calls.append(len(RequestItems[dynamodb.TABLE_NAME]))
+            if len(calls) == 1:
+                return {'UnprocessedItems': {dynamodb.TABLE_NAME: RequestItems[dynamodb.TABLE_NAME][:5]}}
+            return {'UnprocessedItems': {}}
+
+        client.batch_write_item.side_effect = batch_write_item
+        with dynamodb.JobStore(dynamodb=resource, backoff_factor=0) as store:
+            store.put_many(make_jobs(25))
+        self.assertEqual(calls, [25, 5])
+        self.assertEqual(store.stats['written'], 25)
+        self.assertEqual(store.stats['retries'], 1)
+
+    def test_give_up(self):
+        resource = MagicMock()
+        resource.meta.client.batch_write_item.side_effect = lambda RequestItems: {'UnprocessedItems': RequestItems}
+        store = dynamodb.JobStore(dynamodb=resource, max_retries=2, backoff_factor=0)
+        store.put_many(make_jobs(3))
+        with self.assertRaises(RuntimeError):
+            store.flush()
+
+
+class TestJobsExist(TestCase):
+    """
+    Test bulk existence checks and known job cache
+    """
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.resource = boto3.resource('dynamodb', region_name=dynamodb.REGION_NAME)
+        create_jobs_table(self.resource)
+        with dynamodb.JobStore(dynamodb=self.resource) as store:
+            store.put_many(make_jobs(150))
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_batch_get(self):
+        """
+        Ids are looked up in chunks of 100 and found ones are cached
+        """
+        cache = KnownJobCache()
+        store = dynamodb.JobStore(dynamodb=self.resource, cache=cache)
+        ids = [j.job_id for j in make_jobs(50, start=120)]
+        self.assertEqual(store.jobs_exist(ids), set(ids[:30]))
+        self.assertEqual(store.stats['lookups'], 1)
+        self.assertEqual(len(cache), 30)
+        store.jobs_exist(ids[:30])
+        self.assertEqual(store.stats['lookups'], 1)
+
+    def test_known_jobs_not_written(self):
+        """
+        Jobs in cache skip DynamoDB on re-crawl
+        """
+        cache = KnownJobCache()
+        with dynamodb.JobStore(dynamodb=self.resource, cache=cache) as store:
+            store.put_many(make_jobs(160))
+        self.assertEqual(store.stats['written'], 160)
+        with dynamodb.JobStore(dynamodb=self.resource, cache=cache) as store:
+            store.put_many(make_jobs(160))
+        self.assertEqual(store.stats['known'], 160)
+        self.assertEqual(store.stats['batches'], 0)
+
+    def test_bloom_hits_confirmed(self):
+        """
+        False hits of a Bloom filter are written and not reported as stored
+        """
+        bloom = BloomFilter(capacity=100)
+        # every id is a hit of a saturated filter
+        bloom.array[:] = b"\xff" * len(bloom.array)
+        store = dynamodb.JobStore(dynamodb=self.resource, cache=bloom)
+        ids = [j.job_id for j in make_jobs(50, start=120)]
+        self.assertEqual(store.jobs_exist(ids), set(ids[:30]))
+        with store:
+            store.put_many(make_jobs(50, start=120))
+        self.assertEqual((store.stats['known'], store.stats['false_hits'], store.stats['written']), (30, 20, 20))
+        self.assertEqual(len(dynamodb.JobStore(dynamodb=self.resource).jobs_exist(ids)), 50)
+
+
+class TestCompression(TestCase):
+    """
+    Test compressed storage of large text attributes
+    """
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.resource = boto3.resource('dynamodb', region_name=dynamodb.REGION_NAME)
+        self.table = create_jobs_table(self.resource)
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_encode_item(self):
+        """
+        Only large text is compressed, both codecs decode to the original item
+        """
+        job = make_jobs(1)[0]
+        job.description = "Python developer wanted, remote work possible. " * 40
+        item = dynamodb.job_item(job, job.fingerprint())
+        for codec in ("zlib", "zstd") if dynamodb._zstandard() else ("zlib",):
+            encoded = dynamodb.encode_item(item, threshold=512, codec=codec)
+            self.assertIsInstance(encoded['description'], bytes)
+            self.assertEqual((encoded['title'], encoded['fingerprint']), (item['title'], item['fingerprint']))
+            self.assertLess(dynamodb.item_size(encoded), dynamodb.item_size(item))
+            self.assertEqual(dynamodb.decode_item(encoded), item)
+        self.assertEqual(dynamodb.encode_item(item, threshold=4096), item)
+
+    def test_round_trip(self):
+        """
+        Compressed jobs are stored as Binary and read back as text
+        """
+        jobs = make_jobs(30)
+        for job in jobs[:10]:
+            job.description = "Seattle, WA. Full time position with benefits. " * 50
+        with dynamodb.JobStore(dynamodb=self.resource, compress_threshold=512, codec="zlib") as store:
+            store.put_many(jobs)
+        stored = self.table.get_item(Key={'job_id': jobs[0].job_id})['Item']
+        self.assertNotIsInstance(stored['description'], str)
+        items = dynamodb.get_jobs([j.job_id for j in jobs] + ["missing"], store=store)
+        self.assertEqual(len(items), 30)
+        for job in jobs:
+            self.assertEqual(items[job.job_id], dynamodb.job_item(job))
+
+    def test_update_expired(self):
+        """
+        Conditional update works on items with compressed attributes
+        """
+        index = FingerprintIndex()
+        job = make_jobs(1)[0]
+        job.description = "Long description of the position. " * 50
+        with dynamodb.JobStore(dynamodb=self.resource, fingerprints=index, compress_threshold=512) as store:
+            store.put(job)
+        job.expired = True
+        with dynamodb.JobStore(dynamodb=self.resource, fingerprints=index, compress_threshold=512) as store:
+            store.put(job)
+        self.assertEqual(store.stats['updated'], 1)
+        item = dynamodb.get_jobs([job.job_id], store=store)[job.job_id]
+        self.assertIs(item['expired'], True)
+        self.assertEqual(item['description'], job.description)
+
+
+class TestJobCache(TestCase):
+    """
+    Test snapshots of known job caches
+    """
+    def test_lru_snapshot(self):
+        cache = KnownJobCache(maxsize=2)
+        cache.update(["a", "b", "c"])
+        self.assertNotIn("a", cache)
+        with tempfile.TemporaryDirectory() as path:
+            cache.save(os.path.join(path, "known.txt"))
+            loaded = KnownJobCache.load(os.path.join(path, "known.txt"))
+        self.assertIn("b", loaded)
+        self.assertIn("c", loaded)
+
+    def test_bloom_snapshot(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        bloom.update(str(i) for i in range(1000))
+        with tempfile.TemporaryDirectory() as path:
+            bloom.save(os.path.join(path, "known.bloom"))
+            loaded = BloomFilter.load(os.path.join(path, "known.bloom"))
+        self.assertTrue(all(str(i) in loaded for i in range(1000)))
+        false_positives = sum(str(i) in loaded for i in range(1000, 11000))
+        self.assertLess(false_positives, 300)
+
+    def test_bloom_capacity_warning(self):
+        bloom = BloomFilter(capacity=10, error_rate=0.01)
+        with self.assertLogs("awslib.jobcache", level="WARNING"):
+            bloom.update(str(i) for i in range(20))
+        self.assertTrue(bloom.full)
+        bloom.update(str(i) for i in range(20))
+        self.assertLessEqual(bloom.count, 20)
+        with tempfile.TemporaryDirectory() as path:
+            bloom.save(os.path.join(path, "known.bloom"))
+            # capacity of a snapshot is derived from its size and hashes
+            self.assertAlmostEqual(BloomFilter.load(os.path.join(path, "known.bloom")).capacity, 10, delta=1)
+
+    def test_fingerprint_snapshot(self):
+        index = FingerprintIndex()
+        index.set("a\tb", "0123456789abcdef", True)
+        index.set("c", "fedcba9876543210", False)
+        with tempfile.TemporaryDirectory() as path:
+            index.save(os.path.join(path, "fingerprints.txt"))
+            loaded = FingerprintIndex.load(os.path.join(path, "fingerprints.txt"))
+        self.assertEqual(loaded.get("a\tb"), ("0123456789abcdef", True))
+        self.assertEqual(loaded.get("c"), ("fedcba9876543210", False))
+
+    def test_snapshots_merged(self):
+        """
+        Processes saving to one file keep each other's jobs
+        """
+        with tempfile.TemporaryDirectory() as path:
+            known = os.path.join(path, "known.txt")
+            fingerprints = os.path.join(path, "fingerprints.txt")
+            bloom = os.path.join(path, "known.bloom")
+            for worker in ("a", "b"):
+                cache = KnownJobCache()
+                cache.update([worker + "1", worker + "2"])
+                cache.save(known)
+                index = FingerprintIndex()
+                index.set("shared", worker, False)
+                index.set(worker, worker, True)
+                index.save(fingerprints)
+                bloom_filter = BloomFilter(capacity=100)
+                bloom_filter.add(worker)
+                bloom_filter.save(bloom)
+            self.assertEqual(list(KnownJobCache.load(known).ids), ["a1", "a2", "b1", "b2"])
+            loaded = FingerprintIndex.load(fingerprints)
+            self.assertEqual((loaded.get("a"), loaded.get("shared")), (("a", True), ("b", False)))
+            self.assertTrue("a" in BloomFilter.load(bloom) and "b" in BloomFilter.load(bloom))
+            self.assertEqual(sorted(f for f in os.listdir(path) if f.endswith(".tmp")), [])
+
+    def test_concurrent_saves(self):
+        """
+        Forked processes saving at once lose no job ids
+        """
+        with tempfile.TemporaryDirectory() as path:
+            known = os.path.join(path, "known.txt")
+            pids = []
+            for worker in range(4):
+                pid = os.fork()
+                if pid == 0:
+                    try:
+                        cache = KnownJobCache()
+                        for i in range(20):
+                            cache.add("{0}-{1}".format(worker, i))
+                            cache.save(known)
+                    finally:
+                        os._exit(0)
+                pids.append(pid)
+            for pid in pids:
+                os.waitpid(pid, 0)
+            self.assertEqual(len(KnownJobCache.load(known)), 80)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import random
+from unittest import TestCase
+from indeed.geo import distance_miles, GridIndex, plan_centers, plan_report, zip_coordinates
+
+
+class TestGeo(TestCase):
+    """
+    Test spatial index and covering set of search centers
+    """
+    def setUp(self):
+        rnd = random.Random(1)
+        # dense cluster around Seattle, another around Portland
+        self.zips = [{'zip': str(98000 + i), 'latitude': 47.6 + rnd.uniform(-0.2, 0.2),
+                      'longitude': -122.3 + rnd.uniform(-0.2, 0.2)} for i in range(100)]
+        self.zips += [{'zip': str(97000 + i), 'lat': 45.5 + rnd.uniform(-0.1, 0.1),
+                       'lng': -122.7 + rnd.uniform(-0.1, 0.1)} for i in range(50)]
+
+    def test_distance(self):
+        self.assertAlmostEqual(distance_miles(47.6062, -122.3321, 45.5152, -122.6784), 145, delta=2)
+
+    def test_index_matches_brute_force(self):
+        points = [zip_coordinates(z) for z in self.zips]
+        index = GridIndex(points, 10)
+        for lat, lon in points[::10]:
+            expected = [i for i, p in enumerate(points) if distance_miles(lat, lon, *p) <= 10]
+            self.assertEqual(sorted(index.near(lat, lon, 10)), expected)
+
+    def test_every_zip_covered(self):
+        """
+        Few centers cover all zips, zips without coordinates are kept
+        """
+        zips = self.zips + [{'zip': '00001'}]
+        centers = plan_centers(zips, cover_radius=25)
+        self.assertIn({'zip': '00001'}, centers)
+        self.assertLessEqual(len(centers), 5)
+        located = [zip_coordinates(c) for c in centers if zip_coordinates(c)]
+        for z in self.zips:
+            self.assertTrue(any(distance_miles(*zip_coordinates(z), *c) <= 25 for c in located))
+        report = plan_report(zips, centers, titles=10)
+        self.assertEqual(report['tasks_before'], 1510)
+        self.assertEqual(report['search_radius'], 50)
+        self.assertGreater(report['saved_share'], 0.9)
+
+    def test_report_calls(self):
+        """
+        Wider searches of centers need more pages and can pass the crawler limit
+        """
+        zips, centers = [{}] * 100, [{}] * 10
+        # 100 jobs per zip is 400 per center: 4 calls per zip, 16 per center
+        report = plan_report(zips, centers, titles=2, radius=25, cover_radius=25, jobs_per_task=100)
+        self.assertEqual((report['calls_before'], report['calls_after']), (800, 320))
+        self.assertEqual(report['truncated_titles'], 0)
+        # 400 jobs per zip is 1600 per center, only 1025 of them are returned
+        report = plan_report(zips, centers, titles=2, radius=25, cover_radius=25, jobs_per_task=[100, 400])
+        self.assertEqual(report['calls_after'], 10 * (16 + 41))
+        self.assertEqual(report['truncated_titles'], 1)
+        self.assertEqual(report['jobs_past_limit'], 10 * (1600 - 1025))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import stat
+import tempfile
+import time
+from unittest import TestCase
+from indeed import Indeed, redact_url
+from indeed import metrics
+from benchmarks.fake_indeed import FakeIndeedServer
+
+
+class TestRegistry(TestCase):
+    """
+    Test counters, timers and their exposition
+    """
+    def test_counters_and_timers(self):
+        """
+        Timers keep count, sum and maximum of observations
+        """
+        registry = metrics.Registry()
+        registry.incr("elements", 25)
+        registry.incr("elements")
+        registry.observe("parse", 0.5)
+        with registry.timer("parse"):
+            pass
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['counters'], {'elements': 26})
+        self.assertEqual(snapshot['timers']['parse']['count'], 2)
+        self.assertEqual(snapshot['timers']['parse']['max_seconds'], 0.5)
+
+    def test_prometheus(self):
+        """
+        Counters and timers are exposed in Prometheus text format
+        """
+        registry = metrics.Registry()
+        registry.incr("elements", 3)
+        registry.observe("http_request", 0.25)
+        text = registry.to_prometheus()
+        self.assertIn("# TYPE indeed_elements_total counter\nindeed_elements_total 3\n", text)
+        self.assertIn("indeed_http_request_seconds_count 1\n", text)
+        self.assertIn("indeed_http_request_seconds_sum 0.25\n", text)
+
+    def test_noop_by_default(self):
+        """
+        Nothing is recorded until metrics are enabled
+        """
+        self.assertIsInstance(metrics.registry, metrics.NoopRegistry)
+        with metrics.registry.timer("parse"):
+            metrics.registry.incr("elements")
+        self.assertEqual(metrics.registry.snapshot()['counters'], {})
+
+    def test_reporter_files(self):
+        """
+        Reporter replaces snapshot files through temporary files of its own
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "metrics_{pid}.json")
+            prometheus_path = os.path.join(directory, "indeed_{pid}.prom")
+            stop = metrics.start_reporter(0.05, json_path, prometheus_path, log=False)
+            path = json_path.format(pid=os.getpid())
+            for _ in range(50):
+                if os.path.exists(prometheus_path.format(pid=os.getpid())):
+                    break
+                time.sleep(0.05)
+            stop.set()
+            with open(path) as f:
+                self.assertIn('counters', json.load(f))
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o644)
+            time.sleep(0.1)
+            self.assertEqual([name for name in os.listdir(directory) if name.endswith(".tmp")], [])
+
+
+class TestInstrumentation(TestCase):
+    """
+    Test metrics recorded by the client
+    """
+    def tearDown(self):
+        metrics.disable()
+
+    def test_search_recorded(self):
+        """
+        Request, parse and element counts are recorded per page
+        """
+        registry = metrics.enable()
+        with FakeIndeedServer(total_results=60) as server:
+            indeed = Indeed("1", base_url=server.url)
+            list(indeed.iter_jobs("python"))
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['timers']['http_request']['count'], 3)
+        self.assertEqual(snapshot['timers']['json_decode']['count'], 3)
+        self.assertEqual(snapshot['counters']['http_responses_200'], 3)
+        self.assertEqual(snapshot['counters']['elements'], 60)
+
+    def test_publisher_hidden(self):
+        """
+        Logged URLs don't contain publisher ID
+        """
+        url = Indeed("12345678901234567890").build_url("python")
+        self.assertNotIn("12345678901234567890", redact_url(url))
+        self.assertIn("publisher=***&v=2", redact_url(url))
@@ -2,35 +2,39 @@
 
 from unittest import TestCase
 #from indeed.main import Query, Element, Indeed
-from indeed import construct_query, Element, Indeed
+from indeed import construct_query, Element, Indeed, parse_xml, parse_json, json_loads, \
+    make_session, ResultBatch
+from benchmarks.feeds import make_xml_feed, make_json_feed
+from benchmarks.fake_indeed import FakeIndeedServer
+from indeed.aio import AsyncIndeed
+from indeed.AsyncPageCrawler import AsyncPageCrawler
+from indeed.PageCrawler import PageCrawler
+from indeed.ratelimit import TokenBucket, get_limiter
+from indeed.state import HighWaterMarks
+from awslib.dynamodb import JobStore
+from indeed.utils import getRandomIP, getRandomUserAgent, loadUserAgents
+from ipaddress import IPv4Address
+from unittest.mock import MagicMock, patch
+import asyncio
 __all__ = [construct_query, Element, Indeed]
 
 class TestQuery(TestCase):
     """
     Test proper query construction
     """
-    def setUp(self):
-        """
-        Initialize Query instance
-        """
-        self.indeed = Indeed();
-        self.q = self.indeed.con
-
     def test_only_one_word(self):
         """
         One word given - one word returned
         """
         word = "Python"
-        self.q.construct_query(all_words=word)
-        self.assertEqual(self.q.query, "Python")
+        self.assertEqual(construct_query(all_words=word), "Python")
 
     def test_multiple_words(self):
         """
         Multiple words given - concatenated by '+'
         """
         words = "Python Django Junior"
-        self.q.construct_query(all_words=words)
-        self.assertEqual(self.q.query, "Python+Django+Junior")
+        self.assertEqual(construct_query(all_words=words), "Python+Django+Junior")
 
     def test_one_word_with_one_not(self):
         """
@@ -38,5 +42,349 @@ class TestQuery(TestCase):
         """
         words = "Python"
         none = "Junior"
-        self.q.construct_query(all_words=words, none=none)
-        self.assertEqual(self.q.query, "Python+-Junior")
+        self.assertEqual(construct_query(all_words=words, none=none), "Python+-Junior")
+
+    def test_several_not(self):
+        """
+        Every excluded word gets its own sign
+        """
+        self.assertEqual(construct_query(all_words="Python", none="Junior Intern"),
+                         "Python+-Junior+-Intern")
+
+    def test_cached(self):
+        """
+        Same words give the cached query
+        """
+        construct_query(all_words="Python Flask")
+        hits = construct_query.cache_info().hits
+        self.assertEqual(construct_query(all_words="Python Flask"), "Python+Flask")
+        self.assertEqual(construct_query.cache_info().hits, hits + 1)
+
+
+class TestRequestBuilder(TestCase):
+    """
+    Test URLs of search requests
+    """
+    def test_values_encoded(self):
+        """
+        Location and user agent are percent-encoded, '+' of query is kept
+        """
+        url = Indeed("1").build_url("Python+-Junior", location="Seattle", state="WA",
+                                    start=50, userip="1.2.3.4", useragent="Mozilla/5.0 (X11; Linux)")
+        self.assertEqual(url, "http://api.indeed.com/ads/apisearch?publisher=1&v=2&format=json"
+                              "&callback=&q=Python+-Junior&l=Seattle%2C%20WA&sort=&radius=25"
+                              "&st=&jt=&limit=25&fromage=&highlight=0&filter=1&latlong=&co=us"
+                              "&chnl=&start=50&userip=1.2.3.4&useragent=Mozilla%2F5.0+%28X11%3B+Linux%29")
+
+    def test_search_encoded_once(self):
+        """
+        Pages of one search reuse its encoded parameters
+        """
+        indeed = Indeed("1")
+        urls = [indeed.build_url("python", sort="date", start=start) for start in (0, 25, 50)]
+        info = indeed.request_builder.search_part.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+        self.assertEqual([url.split("&start=")[1].split("&")[0] for url in urls], ["0", "25", "50"])
+        self.assertIn("&sort=date&", urls[0])
+        self.assertIn("&sort=&", indeed.build_url("python", sort="unknown"))
+
+
+class TestParseXml(TestCase):
+    """
+    Test single-pass parsing of XML responses
+    """
+    def test_results_in_order(self):
+        """
+        Every <result> becomes an Element, order is preserved
+        """
+        total, results = parse_xml(make_xml_feed(3, start=10, total=42))
+        self.assertEqual(total, 42)
+        self.assertEqual([e.title for e in results],
+                         ["Python Developer 10", "Python Developer 11", "Python Developer 12"])
+        self.assertEqual(results[0].job_id, "000000000000000a")
+        self.assertFalse(results[0].expired)
+
+    def test_missing_field(self):
+        """
+        Missing child tags are returned as None
+        """
+        content = b"<response><totalresults>1</totalresults><results><result>" \
+                  b"<jobtitle>Python</jobtitle><url>http://x/viewjob?jk=abc</url>" \
+                  b"<expired>true</expired></result></results></response>"
+        total, results = parse_xml(content)
+        self.assertEqual(total, 1)
+        self.assertEqual(results[0].job_id, "abc")
+        self.assertIsNone(results[0].company)
+        self.assertTrue(results[0].expired)
+
+    def test_missing_expired(self):
+        """
+        Result without <expired> is a live job
+        """
+        content = b"<response><totalresults>1</totalresults><results><result>" \
+                  b"<jobtitle>Python</jobtitle><url>http://x/viewjob?jk=abc</url>" \
+                  b"</result></results></response>"
+        total, results = parse_xml(content)
+        self.assertIs(results[0].expired, False)
+
+
+class TestParseJson(TestCase):
+    """
+    Test single decode of JSON responses
+    """
+    def test_list_and_batch(self):
+        """
+        Page decoded once fills a list or a ResultBatch with the same results
+        """
+        content = make_json_feed(3, start=10, total=42)
+        total, results = parse_json(json_loads(content))
+        batch_total, batch = parse_json(json_loads(content), ResultBatch())
+        self.assertEqual(total, 42)
+        self.assertEqual(batch_total, 42)
+        self.assertEqual([e.title for e in results],
+                         ["Python Developer 10", "Python Developer 11", "Python Developer 12"])
+        self.assertEqual([e.as_dict() for e in batch], [e.as_dict() for e in results])
+
+    def test_missing_field(self):
+        """
+        Result without a field fails like before
+        """
+        with self.assertRaises(KeyError):
+            parse_json({'totalResults': 1, 'results': [{'jobtitle': "Python"}]})
+
+
+class TestSession(TestCase):
+    """
+    Test connection reuse of shared session
+    """
+    def test_clients_share_connection(self):
+        """
+        Pages fetched by several clients go through one connection
+        """
+        session = make_session()
+        with FakeIndeedServer(total_results=60) as server:
+            for start in (0, 25, 50):
+                indeed = Indeed("1", session=session, base_url=server.url)
+                indeed.search_jobs("python", start=start)
+            self.assertEqual(indeed.totalResults, 60)
+            self.assertEqual(len(indeed.results), 10)
+            self.assertEqual(server.requests, 3)
+            self.assertEqual(server.connections, 1)
+
+    def test_retry_throttled(self):
+        """
+        Session retries pages answered with 429 and 500
+        """
+        session = make_session(max_retries=10, backoff_factor=0)
+        with FakeIndeedServer(total_results=500, throttle_rate=0.2, error_rate=0.2) as server:
+            indeed = Indeed("1", session=session, base_url=server.url)
+            jobs = list(indeed.iter_jobs("python"))
+            self.assertEqual(len(jobs), 500)
+            self.assertGreater(sum(server.failures.values()), 0)
+
+
+class TestAsync(TestCase):
+    """
+    Test asyncio client and crawler against fake server
+    """
+    def test_same_results_as_sync(self):
+        """
+        AsyncIndeed returns the same elements as Indeed
+        """
+        async def search(url):
+            async with AsyncIndeed("1", base_url=url) as indeed:
+                return await indeed.search_jobs("python", start=25)
+
+        with FakeIndeedServer(total_results=60) as server:
+            indeed = Indeed("1", base_url=server.url)
+            indeed.search_jobs("python", start=25)
+            total, results = asyncio.run(search(server.url))
+        self.assertEqual(total, indeed.totalResults)
+        self.assertEqual([e.job_id for e in results], [e.job_id for e in indeed.results])
+
+    def test_crawl_all_pages(self):
+        """
+        Crawler fetches every page up to crawler limit, in start order
+        """
+        async def crawl(url):
+            async with AsyncIndeed("1", base_url=url, concurrency=4) as indeed:
+                return await AsyncPageCrawler("1", "python", client=indeed).crawl()
+
+        with FakeIndeedServer(total_results=1100) as server:
+            results = asyncio.run(crawl(server.url))
+            self.assertEqual(server.requests, 41)
+        self.assertEqual([e.job_id for e in results],
+                         ["{0:016x}".format(i) for i in range(1025)])
+
+    def test_private_client_rate_limited(self):
+        """
+        Crawler without a client paces its pages like the sync crawler
+        """
+        self.assertIs(AsyncPageCrawler("1", "python").rate_limiter, get_limiter("1"))
+        bucket = TokenBucket(1000, burst=100)
+        with FakeIndeedServer(total_results=100) as server, \
+                patch.object(Indeed, "API_URL", server.url), \
+                patch.object(bucket, "acquire_async", wraps=bucket.acquire_async) as acquire:
+            results = asyncio.run(AsyncPageCrawler("1", "python", rate_limiter=bucket).crawl())
+        self.assertEqual(len(results), 100)
+        self.assertEqual(acquire.call_count, 4)
+
+
+class TestPageCrawler(TestCase):
+    """
+    Test crawling all pages of a query
+    """
+    def crawl(self, workers):
+        with FakeIndeedServer(total_results=300) as server:
+            crawler = PageCrawler("1", "python", workers=workers,
+                                  rate_limiter=TokenBucket(1000, burst=100))
+            with patch.object(Indeed, "API_URL", server.url):
+                crawler.crawl()
+            return crawler.results
+
+    def test_parallel_same_as_sequential(self):
+        """
+        Pages fetched by a pool are merged in start order
+        """
+        sequential = self.crawl(workers=1)
+        parallel = self.crawl(workers=4)
+        self.assertEqual(len(parallel), 300)
+        self.assertEqual([e.job_id for e in parallel], [e.job_id for e in sequential])
+
+
+class TestElement(TestCase):
+    """
+    Test compact Element and columnar ResultBatch
+    """
+    url = "http://www.indeed.com/viewjob?qd=abc&jk=a1%2Bb2&indpubnum=1"
+    row = ("Python", "ACME", "Seattle", "WA", "US", "Indeed",
+           "Mon, 01 Apr 2019 10:00:00 GMT", "snippet", url, False, "1 day ago")
+
+    def test_lazy_job_id(self):
+        """
+        Job key is extracted and unquoted on first access
+        """
+        element = Element(*self.row)
+        self.assertFalse(hasattr(element, "__dict__"))
+        self.assertIsNone(element._job_id)
+        self.assertEqual(element.job_id, "a1+b2")
+        self.assertIn("Title: Python", str(element))
+
+    def test_url_without_job_key(self):
+        """
+        URL without jk fails like before
+        """
+        element = Element(*self.row[:8] + ("http://www.indeed.com/viewjob?qd=abc",) + self.row[9:])
+        with self.assertRaises(KeyError):
+            element.job_id
+
+    def test_batch_round_trip(self):
+        """
+        Batch gives back the same elements
+        """
+        batch = ResultBatch()
+        batch.append_row(*self.row)
+        batch.append(Element(*self.row[:9] + (True, "2 days ago")))
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.job_ids(), ["a1+b2", "a1+b2"])
+        self.assertEqual([e.as_dict() for e in batch][0], Element(*self.row).as_dict())
+        self.assertIs(batch[1].expired, True)
+
+    def test_client_fills_batch(self):
+        """
+        Columnar client stores page in ResultBatch
+        """
+        with FakeIndeedServer(total_results=30) as server:
+            indeed = Indeed("1", base_url=server.url, columnar=True)
+            indeed.search_jobs("python", format_results="xml")
+        self.assertIsInstance(indeed.results, ResultBatch)
+        self.assertEqual(len(indeed.results), 25)
+        self.assertEqual(indeed.results.column("title")[0], "Python Developer 0")
+
+
+class TestStreaming(TestCase):
+    """
+    Test results yielded page by page instead of collected
+    """
+    def test_iter_results_pages(self):
+        """
+        Pages are yielded as they arrive, results are per instance
+        """
+        with FakeIndeedServer(total_results=60) as server:
+            crawler = PageCrawler("1", "python", rate_limiter=TokenBucket(1000, burst=100))
+            with patch.object(Indeed, "API_URL", server.url):
+                pages = [len(page) for page in crawler.iter_results(pages=True)]
+        self.assertEqual(pages, [25, 25, 10])
+        self.assertEqual(crawler.results, [])
+        self.assertIsNot(crawler.results, PageCrawler("1", "java").results)
+
+    def test_iter_jobs(self):
+        """
+        Client pages through all results of a search
+        """
+        with FakeIndeedServer(total_results=110) as server:
+            indeed = Indeed("1", base_url=server.url)
+            jobs = [e.job_id for e in indeed.iter_jobs("python", limit=50)]
+        self.assertEqual(jobs, ["{0:016x}".format(i) for i in range(110)])
+
+
+class TestIncremental(TestCase):
+    """
+    Test crawls stopping at jobs of the previous crawl
+    """
+    def test_incremental(self):
+        """
+        Second crawl stops at the newest job of the first one
+        """
+        state = HighWaterMarks()
+        with FakeIndeedServer(total_results=100, first_id=30) as server, \
+                patch.object(Indeed, "API_URL", server.url):
+            crawler = PageCrawler("1", "python", rate_limiter=TokenBucket(1000, burst=100), state=state)
+            self.assertEqual(len(list(crawler.iter_results())), 100)
+            crawler.commit_mark()
+            # 30 new jobs were posted on top of the feed
+            server.first_id = 0
+            fresh = [e.job_id for e in crawler.iter_results()]
+            self.assertEqual(fresh, ["{0:016x}".format(i) for i in range(30)])
+            self.assertEqual(server.requests, 4 + 2)
+            self.assertEqual(state.get("python", 98101).job_id, "{0:016x}".format(30))
+            crawler.commit_mark()
+            self.assertEqual(state.get("python", 98101).job_id, "{0:016x}".format(0))
+
+    def test_mark_kept_when_store_fails(self):
+        """
+        Jobs whose write failed are crawled again by the redelivered task
+        """
+        state = HighWaterMarks()
+        resource = MagicMock()
+        resource.meta.client.batch_write_item.side_effect = RuntimeError("write failed")
+        with FakeIndeedServer(total_results=40) as server, \
+                patch.object(Indeed, "API_URL", server.url):
+            crawler = PageCrawler("1", "python", rate_limiter=TokenBucket(1000, burst=100), state=state)
+            with self.assertRaises(RuntimeError):
+                with JobStore(dynamodb=resource) as store:
+                    store.put_many(crawler.iter_results())
+                crawler.commit_mark()
+            self.assertIsNone(state.get("python", 98101))
+            self.assertEqual(len(list(crawler.iter_results())), 40)
+
+
+class TestUtils(TestCase):
+    """
+    Test random user agents and IPs
+    """
+    def test_user_agent_pool(self):
+        """
+        Database is loaded once, agents are drawn from it
+        """
+        pool = loadUserAgents()
+        self.assertIs(loadUserAgents(), pool)
+        self.assertIn(getRandomUserAgent(), pool)
+
+    def test_random_ip(self):
+        """
+        IPs are valid dotted quads
+        """
+        for _ in range(100):
+            ip = getRandomIP()
+            self.assertEqual(str(IPv4Address(ip)), ip)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import tempfile
+import time
+from unittest import TestCase
+from indeed.ratelimit import TokenBucket, FileTokenBucket, get_limiter
+
+
+class TestTokenBucket(TestCase):
+    """
+    Test token bucket pacing and adaptive rate
+    """
+    def test_burst_then_rate(self):
+        """
+        Burst requests go at once, the next one waits for a token
+        """
+        bucket = TokenBucket(rate=20, burst=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(), 0.05, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.10, places=2)
+
+    def test_async_acquire(self):
+        """
+        Coroutines share bucket with threads
+        """
+        bucket = TokenBucket(rate=50, burst=1)
+
+        async def run():
+            started = time.monotonic()
+            await asyncio.gather(*[bucket.acquire_async() for _ in range(5)])
+            return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.07)
+
+    def test_slowdown_and_recovery(self):
+        """
+        Rate halves on 429 and recovers on success up to the quota
+        """
+        bucket = TokenBucket(rate=10, burst=1, recovery=0.1)
+        self.assertEqual(bucket.feedback(429), 5)
+        self.assertEqual(bucket.feedback(503), 2.5)
+        self.assertAlmostEqual(bucket.feedback(200), 3.5)
+        for _ in range(20):
+            bucket.feedback(200)
+        self.assertEqual(bucket.rate, 10)
+
+    def test_file_backend_shared(self):
+        """
+        Buckets on the same file take tokens from one pool
+        """
+        with tempfile.TemporaryDirectory() as path:
+            state_file = os.path.join(path, "bucket.json")
+            first = FileTokenBucket(state_file, rate=1, burst=2)
+            second = FileTokenBucket(state_file, rate=1, burst=2)
+            self.assertEqual(first.reserve(), 0.0)
+            self.assertEqual(second.reserve(), 0.0)
+            self.assertGreater(first.reserve(), 0.5)
+
+    def test_limiter_per_publisher(self):
+        """
+        Same publisher ID gets the same limiter
+        """
+        self.assertIs(get_limiter("test-a", rate=5), get_limiter("test-a"))
+        self.assertIsNot(get_limiter("test-a"), get_limiter("test-b"))
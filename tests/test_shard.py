@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+from unittest.mock import patch
+from indeed import Indeed
+from indeed.shard import AdaptiveSharder, Shard, split_shard
+from indeed.ratelimit import TokenBucket
+from benchmarks.fake_indeed import FakeIndeedServer
+
+JOB_TYPES = ("fulltime", "parttime", "contract", "internship", "temporary")
+
+
+def make_corpus(count, job_types=JOB_TYPES):
+    return [{'job_type': job_types[i % len(job_types)],
+             'site_type': ("jobsite", "employer")[i % 2],
+             'distance': i % 25, 'age': i % 30} for i in range(count)]
+
+
+class TestSplit(TestCase):
+    """
+    Test narrower searches of a shard
+    """
+    def test_partition_then_halve(self):
+        """
+        Job type gives a search per value, radius is halved repeatedly
+        """
+        children = split_shard(Shard({'radius': 25}, ("job_type", "radius")))
+        self.assertEqual([c.params['job_type'] for c in children], list(JOB_TYPES))
+        child = split_shard(children[0])[0]
+        self.assertEqual(child.params, {'radius': 12, 'job_type': "fulltime"})
+        self.assertEqual(split_shard(child)[0].params['radius'], 6)
+        self.assertEqual(split_shard(Shard({'radius': 1}, ("radius",))), [])
+
+
+class TestAdaptiveSharder(TestCase):
+    """
+    Test sharded crawls against a fake server with a corpus
+    """
+    def crawl(self, corpus, **kwargs):
+        with FakeIndeedServer(corpus=corpus) as server, \
+                patch.object(Indeed, "API_URL", server.url):
+            sharder = AdaptiveSharder("1", "python", rate_limiter=TokenBucket(1000, burst=100), **kwargs)
+            jobs = sharder.crawl()
+            self.assertEqual(server.requests, sharder.stats['calls'])
+        return sharder, jobs
+
+    def test_small_search_not_split(self):
+        sharder, jobs = self.crawl(make_corpus(300))
+        self.assertEqual(len(jobs), 300)
+        self.assertEqual(sharder.stats['calls'], 12)
+        self.assertEqual(sharder.report()['coverage'], 1.0)
+
+    def test_full_coverage(self):
+        """
+        Job types split a search of 4000 jobs into searches which fit
+        """
+        sharder, jobs = self.crawl(make_corpus(4000))
+        self.assertEqual(sorted(int(job.job_id, 16) for job in jobs), list(range(4000)))
+        report = sharder.report()
+        self.assertEqual(report['coverage'], 1.0)
+        self.assertEqual(report['shards'], 5)
+        self.assertLess(report['unsharded_coverage'], 0.26)
+
+    def test_gap_crawled(self):
+        """
+        Jobs without job type are reached through the wider search, once
+        """
+        corpus = make_corpus(3000, job_types=JOB_TYPES + (None,))
+        sharder, jobs = self.crawl(corpus, dimensions=("job_type",))
+        ids = [job.job_id for job in jobs]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sharder.stats['shards'], 6)
+        self.assertGreater(sharder.stats['duplicates'], 0)
+        self.assertEqual(len(ids), 2500 + len([i for i in range(1025) if i % 6 == 5]))
+
+    def test_radius(self):
+        """
+        Search left over the limit after job types is split by radius
+        """
+        sharder, jobs = self.crawl(make_corpus(12000), dimensions=("job_type", "radius"))
+        report = sharder.report()
+        self.assertGreater(report['coverage'], 0.6)
+        self.assertLess(report['unsharded_coverage'], 0.1)
+        self.assertEqual(report['jobs'], len(jobs))
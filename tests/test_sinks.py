@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase, skipUnless
+from indeed import parse_json
+from awslib.sinks import NDJSONSink, open_sink, tee, SINK_FIELDS
+from benchmarks.feeds import make_results
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def make_elements(count):
+    return parse_json({'totalResults': count, 'results': make_results(count)})[1]
+
+
+class TestNDJSONSink(TestCase):
+    """
+    Test rolling gzipped NDJSON files
+    """
+    def test_rolling_parts(self):
+        """
+        Parts are rolled every max_rows jobs, all jobs are written once
+        """
+        jobs = make_elements(25)
+        with tempfile.TemporaryDirectory() as directory:
+            with NDJSONSink(directory, max_rows=10, buffer_rows=4) as sink:
+                self.assertEqual(sink.put_many(jobs), 25)
+            self.assertEqual(sorted(os.listdir(directory)), sorted(os.path.basename(f) for f in sink.files))
+            lines = []
+            for path in sink.files:
+                with gzip.open(path, "rt") as f:
+                    lines.append([json.loads(line) for line in f])
+        self.assertEqual([len(part) for part in lines], [10, 10, 5])
+        rows = [row for part in lines for row in part]
+        self.assertEqual([row['job_id'] for row in rows], [job.job_id for job in jobs])
+        self.assertEqual(set(rows[0]), set(SINK_FIELDS))
+        self.assertEqual(sink.stats['rows'], 25)
+
+    def test_unfinished_part_hidden(self):
+        """
+        Part being written keeps its temporary name
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            sink = NDJSONSink(directory, buffer_rows=1)
+            jobs = list(tee(make_elements(3), sink))
+            self.assertEqual(len(jobs), 3)
+            self.assertTrue(all(name.endswith(".tmp") for name in os.listdir(directory)))
+            sink.close()
+            self.assertEqual(len(sink.files), 1)
+            self.assertTrue(sink.files[0].endswith(".ndjson.gz"))
+
+    def test_duplicates_skipped(self):
+        """
+        A job id is written once per part, the next part can have it again
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            with NDJSONSink(directory, max_rows=10, buffer_rows=4) as sink:
+                self.assertEqual(sink.put_many(make_elements(8)), 8)
+                # redelivered message crawls the same jobs again
+                self.assertEqual(sink.put_many(make_elements(8)), 0)
+                sink.roll()
+                self.assertEqual(sink.put_many(make_elements(3)), 3)
+            self.assertEqual((sink.stats['rows'], sink.stats['duplicates'], sink.stats['files']), (11, 8, 2))
+
+    def test_roll_after_max_seconds(self):
+        """
+        Part is finished after max_seconds without reaching max_rows
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            sink = NDJSONSink(directory, buffer_rows=100, max_seconds=0.2)
+            sink.put_many(make_elements(5))
+            for _ in range(50):
+                if sink.files:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(len(sink.files), 1)
+            with gzip.open(sink.files[0], "rt") as f:
+                self.assertEqual(len(f.readlines()), 5)
+            sink.close()
+            self.assertEqual(len(sink.files), 1)
+
+
+@skipUnless(pyarrow, "pyarrow is not installed")
+class TestColumnarSinks(TestCase):
+    """
+    Test Parquet and Arrow files
+    """
+    def test_parquet(self):
+        import pyarrow.parquet
+        jobs = make_elements(30)
+        with tempfile.TemporaryDirectory() as directory:
+            with open_sink("parquet", directory, max_rows=20, buffer_rows=7) as sink:
+                sink.put_many(jobs)
+            table = pyarrow.parquet.read_table(sink.files)
+        self.assertEqual(len(sink.files), 2)
+        self.assertEqual(table.column("job_id").to_pylist(), [job.job_id for job in jobs])
+        self.assertEqual(table.column("expired").to_pylist(), [False] * 30)
+
+    def test_arrow(self):
+        import pyarrow.ipc
+        jobs = make_elements(5)
+        with tempfile.TemporaryDirectory() as directory:
+            with open_sink("arrow", directory) as sink:
+                sink.put_many(jobs)
+            with pyarrow.ipc.open_file(sink.files[0]) as reader:
+                table = reader.read_all()
+        self.assertEqual(table.column("title").to_pylist(), [job.title for job in jobs])
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import json
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import boto3
+from botocore.exceptions import EndpointConnectionError
+from moto import mock_aws
+from awslib.sqs import BatchSender, QueueWorker
+
+
+class TestBatchSender(TestCase):
+    """
+    Test batched producer against local SQS stand-in
+    """
+    def test_send_many(self):
+        """
+        All messages arrive, sent in batches of 10
+        """
+        with mock_aws():
+            client = boto3.client('sqs', region_name='us-east-1')
+            queue_url = client.create_queue(QueueName='tasks')['QueueUrl']
+            sender = BatchSender(queue_url, sqs=client, workers=3)
+            sent = sender.send_many({'MessageBody': json.dumps({'n': i})} for i in range(95))
+            self.assertEqual(sent, 95)
+            self.assertEqual(sender.stats['batches'], 10)
+            attributes = client.get_queue_attributes(QueueUrl=queue_url,
+                                                     AttributeNames=['ApproximateNumberOfMessages'])
+            self.assertEqual(attributes['Attributes']['ApproximateNumberOfMessages'], '95')
+        self.assertGreater(sender.messages_per_second, 0)
+
+    def test_retry_failed_entries(self):
+        """
+        Only failed entries are resent, sender faults are not retried
+        """
+        client = MagicMock()
+        calls = []
+
+        def send_message_batch(QueueUrl, Entries):
+            calls.append([e['MessageBody'] for e in Entries])
+            if len(calls) == 1:
+                return {'Successful': [{'Id': e['Id']} for e in Entries[2:]],
+                        'Failed': [{'Id': Entries[0]['Id'], 'SenderFault': False},
+                                   {'Id': Entries[1]['Id'], 'SenderFault': True}]}
+            return {'Successful': [{'Id': e['Id']} for e in Entries]}
+
+        client.send_message_batch.side_effect = send_message_batch
+        sender = BatchSender("url", sqs=client, backoff_factor=0)
+        self.assertEqual(sender.send_many({'MessageBody': str(i)} for i in range(5)), 4)
+        self.assertEqual(calls[1], ['0'])
+        self.assertEqual(sender.stats['failed'], 1)
+        self.assertEqual(len(sender.errors), 1)
+
+
+class TestQueueWorker(TestCase):
+    """
+    Test concurrent consumer against local SQS stand-in
+    """
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.client = boto3.client('sqs', region_name='us-east-1')
+        self.queue_url = self.client.create_queue(QueueName='tasks')['QueueUrl']
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_failures_isolated(self):
+        """
+        Failed message stays in the queue, the others are deleted
+        """
+        BatchSender(self.queue_url, sqs=self.client).send_many(
+            {'MessageBody': json.dumps({'n': i})} for i in range(25))
+        handled = []
+
+        def handle(message):
+            n = json.loads(message['Body'])['n']
+            if n == 7:
+                raise ValueError("bad message")
+            handled.append(n)
+
+        worker = QueueWorker(self.queue_url, handle, sqs=self.client, workers=4, wait_time=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            worker.run(until_empty=True)
+        report = worker.report()
+        self.assertEqual(sorted(handled), [n for n in range(25) if n != 7])
+        self.assertEqual(report['deleted'], 24)
+        self.assertEqual(report['failed'], 1)
+        attributes = self.client.get_queue_attributes(
+            QueueUrl=self.queue_url, AttributeNames=['ApproximateNumberOfMessagesNotVisible'])
+        self.assertEqual(attributes['Attributes']['ApproximateNumberOfMessagesNotVisible'], '1')
+
+    def test_visibility_extended(self):
+        """
+        Long handler gets its message visibility extended
+        """
+        self.client.send_message(QueueUrl=self.queue_url, MessageBody="slow")
+        worker = QueueWorker(self.queue_url, lambda message: time.sleep(0.5), sqs=self.client,
+                             workers=1, wait_time=0, visibility_timeout=30, heartbeat=0.1)
+        worker.run(until_empty=True)
+        self.assertGreater(worker.report()['extended'], 0)
+        self.assertEqual(worker.report()['deleted'], 1)
+
+    def test_finished_messages_deleted(self):
+        """
+        With more messages than workers every message is handled once,
+        finished ones are deleted before their visibility timeout ends
+        """
+        BatchSender(self.queue_url, sqs=self.client).send_many(
+            {'MessageBody': json.dumps({'n': i})} for i in range(6))
+        handled = []
+
+        def handle(message):
+            handled.append(json.loads(message['Body'])['n'])
+            time.sleep(0.6)
+
+        worker = QueueWorker(self.queue_url, handle, sqs=self.client, workers=2, wait_time=0,
+                             visibility_timeout=1, heartbeat=30)
+        worker.run(until_empty=True)
+        self.assertEqual(sorted(handled), list(range(6)))
+        self.assertEqual(worker.report()['deleted'], 6)
+
+    def test_poll_error_retried(self):
+        """
+        A failed poll is logged and retried, the worker keeps handling messages
+        """
+        BatchSender(self.queue_url, sqs=self.client).send_many(
+            {'MessageBody': json.dumps({'n': i})} for i in range(3))
+        receive = self.client.receive_message
+        calls = []
+
+        def flaky_receive(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise EndpointConnectionError(endpoint_url=self.queue_url)
+            return receive(**kwargs)
+
+        handled = []
+        worker = QueueWorker(self.queue_url, lambda m: handled.append(json.loads(m['Body'])['n']),
+                             sqs=self.client, workers=2, wait_time=0, backoff_factor=0.01)
+        with patch.object(self.client, "receive_message", side_effect=flaky_receive), \
+                self.assertLogs("awslib.sqs", level="ERROR"):
+            worker.run(until_empty=True)
+        self.assertEqual(sorted(handled), [0, 1, 2])
+        self.assertEqual(worker.report()['poll_errors'], 1)
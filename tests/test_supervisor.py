@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "runner"))
+from supervisor import Supervisor
+
+
+def steady_worker(stop_event=None, counters=None):
+    while not stop_event.is_set():
+        counters.add("jobs", 5)
+        counters.add("messages")
+        time.sleep(0.01)
+
+
+def crashing_worker(marker, stop_event=None, counters=None):
+    counters.add("messages")
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(3)
+    stop_event.wait()
+
+
+class TestSupervisor(TestCase):
+    """
+    Test worker processes run by supervisor
+    """
+    def run_for(self, supervisor, seconds):
+        threading.Timer(seconds, supervisor.stop).start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            supervisor.run()
+        return supervisor.report()
+
+    def test_counters_and_drain(self):
+        """
+        Counters of all workers add up, workers exit on stop
+        """
+        supervisor = Supervisor(steady_worker, workers=3, report_every=0.2)
+        report = self.run_for(supervisor, 1.0)
+        self.assertEqual(report['alive'], 0)
+        self.assertGreater(report['jobs'], 0)
+        self.assertEqual(report['jobs'], report['messages'] * 5)
+        self.assertGreater(report['jobs_per_second'], 0)
+
+    def test_restart_crashed(self):
+        """
+        Crashed worker is started again
+        """
+        marker = os.path.join(tempfile.gettempdir(), "supervisor-test-%d" % os.getpid())
+        try:
+            supervisor = Supervisor(crashing_worker, args=(marker,), workers=1, restart_delay=0)
+            report = self.run_for(supervisor, 1.5)
+        finally:
+            if os.path.exists(marker):
+                os.remove(marker)
+        self.assertEqual(report['restarts'], 1)
+        self.assertEqual(report['messages'], 2)